@@ -1,16 +1,43 @@
-from flask import Flask, request, jsonify
-from supabase import create_client
+from flask import Flask, request, jsonify, Response, stream_with_context, g, copy_current_request_context
 from werkzeug.security import generate_password_hash, check_password_hash
 import os
 import threading
 import time
+import tempfile
 from datetime import datetime, timedelta, timezone
 from flask_cors import CORS
 from decimal import Decimal # Conservé, peut être utile si des décimaux sont nécessaires plus tard
 import uuid
+import base64
+import secrets
+import json
+import atexit
+from concurrent.futures import ThreadPoolExecutor
 from supabase import PostgrestAPIError
 import chess
 
+import background
+import storage
+from presence import PresenceBuffer, PresenceRegistry
+from sweeper import OfflineSweeper
+from leaderboard import LeaderboardIndex
+from chess_sessions import ChessSessionCache, parse_premoves
+from game_events import GameEventHub, LocalChannel, build_snapshot, FINISHED_STATUSES
+from matchmaking import Matchmaker
+from counters import PlayCounters
+from move_history import pack_moves, row_moves, to_base64
+from chess_archive import ChessReaper, build_pgn, compress_pgn
+from chess_positions import PositionCache, state_fields
+from spectators import SpectatorFeed
+from http_cache import SnapshotCache, accepted_encoding, etag_matches
+from gun_merge_saves import SaveCache, apply_patch, new_save_version, top_level_changes
+from profile_loads import (
+    FDPIECE_LOAD_COLUMNS, GUN_MERGE_LOAD_COLUMNS, fdpiece_new_row, fdpiece_sections_body,
+    gun_merge_load_body, gun_merge_new_row, load_or_create
+)
+from metrics import Metrics, InstrumentedClient, WorkerMetricsStore, current_route
+from session_tokens import SessionTokens
+
 # ---------------------------------
 # --- VALEURS PAR DÉFAUT (À DÉFINIR AU SOMMET DE VOTRE FICHIER PYTHON) ---
 DEFAULT_GRADE = "Poussière"
@@ -28,7 +55,7 @@ CORS(app, origins=["*"])
 def add_cors_headers(response):
     response.headers['Access-Control-Allow-Origin'] = '*'  # toutes origines
     response.headers['Access-Control-Allow-Methods'] = 'GET, POST, OPTIONS'
-    response.headers['Access-Control-Allow-Headers'] = 'Content-Type'
+    response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization'
     return response
 
 
@@ -37,18 +64,25 @@ def options_handler(path):
     response = jsonify({'status': 'OK'})
     response.headers['Access-Control-Allow-Origin'] = '*'  # toutes origines
     response.headers['Access-Control-Allow-Methods'] = 'GET, POST, OPTIONS'
-    response.headers['Access-Control-Allow-Headers'] = 'Content-Type'
+    response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization'
     return response, 200
 
-# NOTE : Assurez-vous que ces variables d'environnement sont bien définies
-SUPABASE_URL = os.environ.get("SUPABASE_URL")
-SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
-
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise RuntimeError("Variables d'environnement SUPABASE_URL ou SUPABASE_KEY manquantes")
-
-# Initialisation du client Supabase
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Métriques Prometheus (/metrics) : METRICS_ENABLED=0 désactive l'instrumentation
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") != "0"
+METRICS_DUMP_INTERVAL = float(os.environ.get("METRICS_DUMP_INTERVAL", 5))
+METRICS_DIR = os.environ.get(
+    "METRICS_DIR", os.path.join(tempfile.gettempdir(), "project_3_api_metrics")
+)
+app_metrics = Metrics()
+
+# Initialisation du client de stockage.
+# STORAGE_BACKEND=supabase (défaut, SUPABASE_URL / SUPABASE_KEY requis)
+# ou STORAGE_BACKEND=sqlite (base locale SQLITE_PATH, pour les tests de charge hors ligne)
+storage_client = storage.create_storage()
+supabase = storage_client
+if METRICS_ENABLED:
+    # Chaque .execute() est mesuré (table, opération, route, durée, lignes)
+    supabase = InstrumentedClient(storage_client, app_metrics)
 
 # Nom de vos tables de sauvegarde (CORRIGÉ pour correspondre EXACTEMENT au schéma)
 # J'ai conservé vos noms de variables, mais je les utilise maintenant
@@ -60,6 +94,52 @@ TABLE_NAME_STICKMAN_RUNNER = "Stickman_Runner"
 TABLE_NAME_CHESS = "chess"
 
 INITIAL_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+# Jetons de session émis par /login : SESSION_SECRET doit être identique sur tous les workers.
+# SESSION_DEV_MODE=1 autorise un secret aléatoire propre au process (développement, un seul worker)
+SESSION_SECRET = os.environ.get("SESSION_SECRET")
+SESSION_DEV_MODE = os.environ.get("SESSION_DEV_MODE", "0") == "1"
+SESSION_TOKEN_TTL = int(os.environ.get("SESSION_TOKEN_TTL", 7 * 24 * 3600))
+if SESSION_SECRET:
+    session_tokens = SessionTokens(SESSION_SECRET, SESSION_TOKEN_TTL)
+elif SESSION_DEV_MODE:
+    # Secret propre à ce process : les jetons ne valent que pour ce worker et jusqu'au redémarrage
+    print("[SESSION] SESSION_DEV_MODE : SESSION_SECRET non défini, secret aléatoire utilisé")
+    session_tokens = SessionTokens(secrets.token_urlsafe(32), SESSION_TOKEN_TTL)
+else:
+    # Un secret différent par worker refuserait les jetons émis par les autres workers :
+    # sans secret partagé, pas de jetons (les routes utilisent l'ID envoyé par le client)
+    print("[SESSION] ATTENTION : SESSION_SECRET non défini, jetons de session désactivés")
+    session_tokens = None
+
+# Présence : intervalle (secondes) et taille des lots d'écriture des last_seen
+PRESENCE_FLUSH_INTERVAL = float(os.environ.get("PRESENCE_FLUSH_INTERVAL", 5))
+PRESENCE_BATCH_SIZE = int(os.environ.get("PRESENCE_BATCH_SIZE", 500))
+# Registre de présence en mémoire : intervalle (secondes) de fusion des battements reçus par les autres workers
+PRESENCE_RECONCILE_INTERVAL = float(os.environ.get("PRESENCE_RECONCILE_INTERVAL", 5))
+
+# Balayage des joueurs inactifs : un seul worker (détenteur du verrou fichier) l'exécute
+PLAYER_INACTIVITY_TIMEOUT = int(os.environ.get("PLAYER_INACTIVITY_TIMEOUT", 15))
+OFFLINE_SWEEP_INTERVAL = float(os.environ.get("OFFLINE_SWEEP_INTERVAL", 10))
+OFFLINE_SWEEP_LOCK_PATH = os.environ.get(
+    "OFFLINE_SWEEP_LOCK_PATH", os.path.join(tempfile.gettempdir(), "project_3_api_offline_sweep.lock")
+)
+
+# Classements : taille du top et intervalle (secondes) de réconciliation avec les tables
+LEADERBOARD_SIZE = int(os.environ.get("LEADERBOARD_SIZE", 10))
+LEADERBOARD_RECONCILE_INTERVAL = float(os.environ.get("LEADERBOARD_RECONCILE_INTERVAL", 60))
+
+# Lectures servies en instantané (classements, versions, compteurs) : durée de vie (secondes)
+# et taille minimale (octets) d'un corps compressé
+HTTP_SNAPSHOT_TTL = float(os.environ.get("HTTP_SNAPSHOT_TTL", 5))
+HTTP_COMPRESS_MIN_BYTES = int(os.environ.get("HTTP_COMPRESS_MIN_BYTES", 1024))
+
+# Gun Merge : sauvegardes gardées en mémoire pour appliquer les patchs (par worker)
+GUN_MERGE_SAVE_CACHE_SIZE = int(os.environ.get("GUN_MERGE_SAVE_CACHE_SIZE", 1000))
+
+# get_all_players_status : taille de page par défaut et maximale (paramètre limit)
+PLAYERS_STATUS_PAGE_SIZE = int(os.environ.get("PLAYERS_STATUS_PAGE_SIZE", 100))
+PLAYERS_STATUS_MAX_PAGE_SIZE = int(os.environ.get("PLAYERS_STATUS_MAX_PAGE_SIZE", 1000))
 # ----------------------------------------------------------------------
 # --- UTILITIES ---
 # ----------------------------------------------------------------------
@@ -70,16 +150,123 @@ def build_cors_preflight_response():
     response.headers.add("Access-Control-Allow-Methods", "GET,POST,PUT,DELETE,OPTIONS")
     return response
 
+# ----------------------------------------------------------------------
+# --- MESURE DES REQUÊTES HTTP ---
+# ----------------------------------------------------------------------
+app_metrics.describe("http_requests_total", "counter", "Requêtes HTTP par route, méthode et code de statut.")
+app_metrics.describe("http_request_duration_seconds", "histogram", "Durée de traitement des requêtes HTTP.")
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+def observe_request(route, method, status_code, duration):
+    """Enregistre une requête HTTP (aussi appelé par les vues asynchrones de asgi.py)."""
+    if not METRICS_ENABLED:
+        return
+    app_metrics.observe("http_request_duration_seconds", (("route", route), ("method", method)), duration)
+    app_metrics.inc("http_requests_total", (("route", route), ("method", method), ("status", str(status_code))))
+
+
+# ----------------------------------------------------------------------
+# --- INSTANTANÉS HTTP (ETag / 304, compression) ---
+# ----------------------------------------------------------------------
+snapshot_cache = SnapshotCache(HTTP_SNAPSHOT_TTL)
+app_metrics.describe("http_snapshot_responses_total", "counter",
+                     "Réponses en instantané : built (construite), cached (depuis l'instantané), not_modified (304).")
+app_metrics.describe("http_response_bytes_total", "counter", "Octets de corps envoyés par les routes en instantané.")
+
+
+def snapshot_response(key, build):
+    """Réponse JSON servie depuis un instantané (voir http_cache.py).
+
+    `build()` renvoie (réponse, code HTTP) comme les autres fonctions *_body ;
+    elle n'est rappelée qu'à l'expiration de l'instantané (HTTP_SNAPSHOT_TTL)
+    ou quand `key` change. If-None-Match égal à l'ETag -> 304 sans corps.
+    """
+    def serialize():
+        body, code = build()
+        return (app.json.dumps(body, separators=(",", ":")) + "\n").encode("utf-8"), code
+
+    snapshot, cached = snapshot_cache.get(key, serialize)
+    return send_snapshot(snapshot, cached)
+
+
+def send_snapshot(snapshot, cached):
+    """Réponse HTTP d'un http_cache.Snapshot : 304 si l'ETag correspond, corps compressé si accepté."""
+    encoding = None
+    if snapshot.status == 200 and etag_matches(request.headers.get("If-None-Match"), snapshot.etag):
+        response = Response(status=304)
+        result = "not_modified"
+    else:
+        if len(snapshot.body) >= HTTP_COMPRESS_MIN_BYTES:
+            encoding = accepted_encoding(request.headers.get("Accept-Encoding"))
+        data = snapshot.encoded(encoding) if encoding else snapshot.body
+        response = Response(data, status=snapshot.status, mimetype="application/json")
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+        result = "cached" if cached else "built"
+
+    if snapshot.status == 200:
+        response.headers["ETag"] = snapshot.etag
+        # Le client peut garder la réponse mais doit la revalider (If-None-Match) à chaque usage
+        response.headers["Cache-Control"] = "no-cache"
+    response.headers["Vary"] = "Accept-Encoding"
+
+    if METRICS_ENABLED:
+        route = current_route()
+        app_metrics.inc("http_snapshot_responses_total", (("route", route), ("result", result)))
+        app_metrics.inc("http_response_bytes_total", (("route", route), ("encoding", encoding or "identity")),
+                        response.content_length or 0)
+    return response
+
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop("request_started", None)
+    if started is not None:
+        observe_request(current_route(), request.method, response.status_code, time.perf_counter() - started)
+    return response
+
+# ----------------------------------------------------------------------
+# --- JETONS DE SESSION ---
+# ----------------------------------------------------------------------
+def player_from_authorization(header_value):
+    """ID du joueur porté par un en-tête Authorization valide, sinon None (aussi utilisé par asgi.py)."""
+    token = SessionTokens.from_header(header_value) if session_tokens is not None else None
+    return session_tokens.verify(token) if token else None
+
+
+def session_player_id():
+    """ID du joueur authentifié par son jeton de session, vérifié une fois par requête.
+
+    Un jeton absent, invalide ou expiré renvoie None : les routes retombent
+    alors sur l'ID envoyé dans le corps ou les paramètres.
+    """
+    if "session_player_id" not in g:
+        g.session_player_id = player_from_authorization(request.headers.get("Authorization"))
+    return g.session_player_id
+
 # ----------------------------------------------------------------------
 # --- HOOK DE MISE À JOUR D'ACTIVITÉ (S'exécute avant chaque requête) ---
 # ----------------------------------------------------------------------
+# Routes d'administration : pas de battement de présence pour l'ID consulté
+ADMIN_ROUTES = ['/get_all_players_status', '/get_all_ban', '/do_ban', '/remove_sanction', '/get_ban']
+
+
 @app.before_request
 def update_last_seen():
-    """Met à jour le statut du joueur à 'online' et l'horodatage Last_Seen."""
+    """Enregistre le battement du joueur ('online' + last_seen), écrit en différé par lots."""
 
-    admin_routes = ['/get_all_players_status', '/get_all_ban', '/do_ban', '/remove_sanction', '/get_ban']
-        
-    if request.path in admin_routes:
+    # Jeton de session : l'appelant est connu sans lire le corps de la requête
+    player_id = session_player_id()
+    if player_id:
+        record_presence(player_id)
+        return
+
+    if request.path in ADMIN_ROUTES:
         return
 
     if request.args.get('admin') == 'true':
@@ -104,42 +291,84 @@ def update_last_seen():
         player_id = str(player_id).strip()
         
         if player_id:
-            try:
-                # Écrit Status et last_seen dans la table Player.
-                # Noms de colonnes : "Status", "last_seen" (minuscules dans le schéma)
-                # Le nom de la colonne d'ID est "ID"
-                supabase.table(TABLE_NAME_Player).update({ 
-                    "Status": "🟢 online", 
-                    "last_seen": datetime.now(timezone.utc).isoformat() 
-                }).eq("ID", player_id).execute()
-                
-            except Exception as e:
-                # C'est important pour les logs, mais cela ne doit pas bloquer la requête
-                print(f"=========================================================")
-                print(f"[ERREUR Last_Seen] Échec de la mise à jour pour ID: {player_id}")
-                print(f"Détail de l'erreur Supabase: {e}")
-                print(f"=========================================================")
+            record_presence(player_id)
+
+
+def record_presence(player_id):
+    """Battement de présence (aussi appelé par asgi.py), sans accès base.
+
+    Le registre en mémoire le voit immédiatement ; la table Player n'en reçoit
+    qu'un instantané, écrit par lots par flush_presence_batch (voir presence.py).
+    """
+    now = time.time()
+    presence_registry.touch(player_id, now)
+    presence_buffer.record(player_id, datetime.fromtimestamp(now, timezone.utc).isoformat())
+
+
+def flush_presence_batch(batch):
+    """Écrit un lot de battements de présence en une seule requête (RPC record_presence_batch).
+
+    Chaque joueur reçoit son propre last_seen ; la fonction ne fait qu'un
+    UPDATE, pour ne jamais créer de ligne Player sans mot de passe pour un ID inconnu.
+    """
+    supabase.rpc("record_presence_batch", {
+        "heartbeats": [{"id": player_id, "last_seen": last_seen} for player_id, last_seen in batch]
+    }).execute()
+
+
+presence_buffer = PresenceBuffer(flush_presence_batch, batch_size=PRESENCE_BATCH_SIZE)
+background.register("presence_flush", PRESENCE_FLUSH_INTERVAL, presence_buffer.flush)
+atexit.register(presence_buffer.flush)
+
+
+def load_online_presence(since_iso):
+    """Joueurs 'online' en base avec un battement depuis `since_iso` (écrits par tous les workers)."""
+    response = supabase.table(TABLE_NAME_Player).select("ID, last_seen") \
+        .eq("Status", "🟢 online") \
+        .gte("last_seen", since_iso) \
+        .execute()
+    return [(row["ID"], row["last_seen"]) for row in response.data or []]
+
+
+presence_registry = PresenceRegistry(PLAYER_INACTIVITY_TIMEOUT, load_online_presence)
+background.register("presence_reconcile", PRESENCE_RECONCILE_INTERVAL, presence_registry.reconcile)
+
 # ----------------------------------------------------------------------
 # --- TÂCHE D'ARRIÈRE-PLAN POUR LA VÉRIFICATION D'INACTIVITÉ ---
 # ----------------------------------------------------------------------
-@app.before_request
 def check_player_activity():
-    try:
-        
-        inactivity_limit = datetime.now(timezone.utc) - timedelta(seconds=15)
-        inactivity_limit_iso = inactivity_limit.isoformat()
-
-        # Met tous les joueurs 'online' qui n'ont pas bougé depuis 15s à 'offline'
-        # Noms de colonnes : "last_seen", "Status" (conformes au schéma Player)
-        supabase.table(TABLE_NAME_Player).update({
-            "Status": "🔴 offline"
-        }).lt(
-            "last_seen", inactivity_limit_iso
-        ).eq(
-            "Status", "🟢 online"
-        ).execute()
-    except Exception as e:
-        print(f"Erreur inattendue dans le thread d'activité: {e}")
+    """Passe 'offline' les joueurs 'online' sans battement depuis PLAYER_INACTIVITY_TIMEOUT.
+
+    Appelée par offline_sweeper (hors du chemin des requêtes).
+    Renvoie (lignes basculées, joueurs 'online' examinés).
+    """
+    inactivity_limit = datetime.now(timezone.utc) - timedelta(seconds=PLAYER_INACTIVITY_TIMEOUT)
+    inactivity_limit_iso = inactivity_limit.isoformat()
+
+    # Joueurs 'online' avant le balayage (comptés en base, une seule ligne renvoyée)
+    inspected = supabase.table(TABLE_NAME_Player).select("ID", count="exact") \
+        .eq("Status", "🟢 online") \
+        .limit(1) \
+        .execute().count or 0
+
+    # Met tous les joueurs 'online' qui n'ont pas bougé depuis le délai à 'offline'
+    # Noms de colonnes : "last_seen", "Status" (conformes au schéma Player)
+    response = supabase.table(TABLE_NAME_Player).update({
+        "Status": "🔴 offline"
+    }).lt(
+        "last_seen", inactivity_limit_iso
+    ).eq(
+        "Status", "🟢 online"
+    ).execute()
+    return len(response.data or []), inspected
+
+
+offline_sweeper = OfflineSweeper(check_player_activity, OFFLINE_SWEEP_LOCK_PATH, app_metrics)
+app_metrics.describe("offline_sweeps_total", "counter", "Balayages des joueurs inactifs exécutés (worker leader).")
+app_metrics.describe("offline_sweep_flipped_total", "counter", "Joueurs passés offline par le balayage.")
+app_metrics.describe("offline_sweep_inspected_total", "counter", "Joueurs 'online' examinés par le balayage.")
+app_metrics.describe("offline_sweep_errors_total", "counter", "Balayages des joueurs inactifs en erreur.")
+background.register("offline_sweep", OFFLINE_SWEEP_INTERVAL, offline_sweeper.run_once)
 # ----------------------------------------------------------------------
 # --- ROUTES FLASK ---
 # ----------------------------------------------------------------------
@@ -203,9 +432,18 @@ def login():
     if not check_password_hash(user_data["Password"], password):
         return jsonify({"status": "error", "message": "ID ou mot de passe incorrect"}), 401
 
-    # Logique de connexion simple conservée
+    # Jeton signé : les requêtes suivantes s'identifient par l'en-tête
+    # "Authorization: Bearer <token>", sans nouveau calcul du hachage
     print(f"[LOGIN] {username} connecté.")
-    response = jsonify({"status": "success", "message": f"Connexion réussie pour {username}"})
+    body = {
+        "status": "success",
+        "message": f"Connexion réussie pour {username}"
+    }
+    # Sans SESSION_SECRET, aucun jeton n'est émis : le client continue d'envoyer son ID
+    if session_tokens is not None:
+        body["token"] = session_tokens.issue(username)
+        body["expires_in"] = SESSION_TOKEN_TTL
+    response = jsonify(body)
     response.headers.add("Access-Control-Allow-Origin", "*")
     return response, 200
 
@@ -214,8 +452,8 @@ def logout():
     if request.method == "OPTIONS":
         return build_cors_preflight_response()
 
-    data = request.get_json(force=True)
-    username = (data.get("id") or "").strip()
+    data = request.get_json(silent=True) or {}
+    username = (data.get("id") or session_player_id() or "").strip()
     if not username:
         return jsonify({"status": "error", "message": "ID manquant"}), 400
     try:
@@ -224,6 +462,10 @@ def logout():
         if not user.data:
             return jsonify({"status": "error", "message": "Utilisateur introuvable"}), 404
 
+        # Le battement de cette requête ne doit pas remettre le joueur online après coup
+        presence_buffer.discard(username)
+        presence_registry.remove(username)
+
         # Met à jour le statut à offline. Colonnes : "Status", "ID"
         supabase.table(TABLE_NAME_Player).update({"Status": "🔴 offline"}).eq("ID", username).execute()
         
@@ -275,6 +517,65 @@ def friends_control():
         
 
 
+# ------------------------------------------------
+# CLASSEMENTS EN MÉMOIRE (top N par jeu)
+# ------------------------------------------------
+# Les routes *_get_leaderboard lisent ces index sans accès base ; les routes
+# *_update_data les mettent à jour quand un record est battu.
+def load_top_rows(table_name, columns, score_column):
+    def loader(size):
+        response = supabase.table(table_name) \
+            .select(columns) \
+            .order(score_column, desc=True) \
+            .limit(size) \
+            .execute()
+        return response.data or []
+    return loader
+
+
+skull_arena_leaderboard = LeaderboardIndex(
+    "Best_Vague", load_top_rows(TABLE_NAME_Skull_Arena, "username, Best_Vague", "Best_Vague"), LEADERBOARD_SIZE
+)
+astro_dodge_leaderboard = LeaderboardIndex(
+    "PR_Score", load_top_rows(TABLE_NAME_ASTRO_DODGE, "username, PR_Score", "PR_Score"), LEADERBOARD_SIZE
+)
+stickman_runner_leaderboard = LeaderboardIndex(
+    "best_score", load_top_rows(TABLE_NAME_STICKMAN_RUNNER, "username, best_score, grade", "best_score"), LEADERBOARD_SIZE
+)
+
+for _name, _index in [("skull_arena", skull_arena_leaderboard),
+                      ("astro_dodge", astro_dodge_leaderboard),
+                      ("stickman_runner", stickman_runner_leaderboard)]:
+    background.register(f"leaderboard_reconcile_{_name}", LEADERBOARD_RECONCILE_INTERVAL, _index.reconcile)
+
+
+def leaderboard_revision(index):
+    """Révision du top d'un index, lue après son premier chargement.
+
+    Le premier chargement incrémente la révision : lue avant, la clé de
+    l'instantané construit au premier appel serait aussitôt périmée et la
+    réponse reconstruite à l'appel suivant.
+    """
+    try:
+        index.ensure_loaded()
+    except Exception as e:
+        # La construction de la réponse retentera le chargement et renverra l'erreur
+        print(f"[LEADERBOARD ERROR] {e}")
+    return index.revision
+
+
+def save_best_score(table_name, score_column, payload):
+    """Upsert de la sauvegarde en un aller-retour (RPC save_best_score, voir supabase_functions.sql).
+    La base garde le plus grand des deux scores, même si deux sauvegardes arrivent en même temps.
+    Renvoie le meilleur score enregistré (None en cas d'échec).
+    """
+    response = supabase.rpc("save_best_score", {
+        "table_name": table_name,
+        "score_column": score_column,
+        "payload": payload
+    }).execute()
+    return response.data
+
 # ------------------------------------------------
 # SKULL ARENA (ROUTES DE GESTION DE JEU)
 # ------------------------------------------------
@@ -283,107 +584,118 @@ def skull_arena_update_data():
     """ [Skull_Arena_ServerSave] Met à jour les données du joueur (crânes, meilleure vague, niveaux d'amélioration).
     Table : Skull_Arena_DataBase, Colonnes : username, "Best_Vague", "Crane", "UP_Degat", "UP_Portée", "UP_Vitesse", "UP_Cadence"
     """
-    data = request.get_json(force=True)
+    body, code = save_skull_arena_data(request.get_json(force=True))
+    return jsonify(body), code
+
+
+def save_skull_arena_data(data):
+    """Validation + sauvegarde Skull Arena ; renvoie (réponse, code HTTP). Partagé avec /save_all."""
     username = (data.get('username') or "").strip()
     if not username:
-        return jsonify({"status": "error", "message": "Username manquant"}), 400
+        return {"status": "error", "message": "Username manquant"}, 400
     try:
         new_best_vague = int(data.get('best_wave', 0))
         
-        # 1. Fetcher la meilleure vague actuelle pour ne pas l'écraser (COLONNE CORRIGÉE : "Best_Vague")
-        current_data_query = supabase.table(TABLE_NAME_Skull_Arena).select('"Best_Vague"').eq('username', username).limit(1).execute()
-        current_data = current_data_query.data[0] if current_data_query.data else None
-        current_best_vague = current_data.get('Best_Vague', 0) if current_data else 0
-        final_best_vague = max(current_best_vague, new_best_vague)
-        
-        # 2. Préparer le payload (COLONNES CORRIGÉES : "Best_Vague", "Crane", "UP_Degat", "UP_Portée", "UP_Vitesse", "UP_Cadence")
+        # 1. Préparer le payload (COLONNES CORRIGÉES : "Best_Vague", "Crane", "UP_Degat", "UP_Portée", "UP_Vitesse", "UP_Cadence")
         payload = {
             "username": username,
-            "Best_Vague": final_best_vague,
+            "Best_Vague": new_best_vague,
             "Crane": int(data.get('skulls', 0)),
             "UP_Degat": int(data.get('up_damage', 0)),
             "UP_Portée": int(data.get('up_range', 0)),
             "UP_Vitesse": int(data.get('up_speed', 0)),
             "UP_Cadence": int(data.get('up_fire', 0))
         }
-        # 3. Effectuer l'UPSERT
-        response = supabase.table(TABLE_NAME_Skull_Arena).upsert(payload, on_conflict="username").execute()
-        if response.data:
-            return jsonify({"status": "success", "message": "Sauvegarde Skull Arena réussie"}), 200
+        # 2. UPSERT conditionnel : la base conserve la meilleure vague (un seul aller-retour)
+        final_best_vague = save_best_score(TABLE_NAME_Skull_Arena, "Best_Vague", payload)
+        if final_best_vague is not None:
+            skull_arena_leaderboard.offer({"username": username, "Best_Vague": final_best_vague})
+            return {"status": "success", "message": "Sauvegarde Skull Arena réussie"}, 200
         else:
-            return jsonify({"status": "error", "message": "Échec de l'UPSERT Skull Arena"}), 500
+            return {"status": "error", "message": "Échec de l'UPSERT Skull Arena"}, 500
     except Exception as e:
         print(f"[SAVE SKULL ARENA ERROR] {e}")
-        return jsonify({"status": "error", "message": str(e)}), 500
+        return {"status": "error", "message": str(e)}, 500
 
 @app.route('/skull_arena_get_data', methods=['POST'])
 def skull_arena_get_data():
     """ [Skull_Arena_ServerLoad] Récupère les données d'un joueur.
     """
-    data = request.get_json(force=True)
+    body, code = load_skull_arena_data(request.get_json(force=True))
+    return jsonify(body), code
+
+
+# COLONNES CORRIGÉES : Noms exacts de la table Skull_Arena_DataBase
+SKULL_ARENA_LOAD_COLUMNS = '"Crane", "Best_Vague", "UP_Degat", "UP_Portée", "UP_Vitesse", "UP_Cadence"'
+
+
+def load_skull_arena_data(data):
+    """Lecture Skull Arena ; renvoie (réponse, code HTTP). Partagé avec /profile."""
     username = (data.get('username') or "").strip()
     if not username:
-        return jsonify({"status": "error", "message": "Username manquant"}), 400
+        return {"status": "error", "message": "Username manquant"}, 400
     try:
-        # COLONNES CORRIGÉES : Noms exacts de la table Skull_Arena_DataBase
-        columns = '"Crane", "Best_Vague", "UP_Degat", "UP_Portée", "UP_Vitesse", "UP_Cadence"'
-        response = supabase.table(TABLE_NAME_Skull_Arena).select(columns).eq('username', username).limit(1).execute()
-        
-        if not response.data:
-            return jsonify({
-                "status": "not_found", 
-                "message": "Données Skull Arena introuvables. Initialisation...",
-                "data": {"skulls": 0, "best_wave": 0, "levels": {"damage": 0, "range": 0, "speed": 0, "fire": 0}}
-            }), 200
-        
-        row = response.data[0]
-        # CLÉS DE RÉPONSE CORRIGÉES
-        return jsonify({
-            "status": "success", 
-            "message": "Données Skull Arena chargées",
-            "data": {
-                "skulls": int(row.get('Crane', 0)),
-                "best_wave": int(row.get('Best_Vague', 0)),
-                "levels": {
-                    "damage": int(row.get('UP_Degat', 0)),
-                    "range": int(row.get('UP_Portée', 0)),
-                    "speed": int(row.get('UP_Vitesse', 0)),
-                    "fire": int(row.get('UP_Cadence', 0))
-                }
-            }
-        }), 200
+        response = supabase.table(TABLE_NAME_Skull_Arena).select(SKULL_ARENA_LOAD_COLUMNS).eq('username', username).limit(1).execute()
+        return skull_arena_load_body(response.data[0] if response.data else None)
     except Exception as e:
         print(f"[LOAD SKULL ARENA ERROR] {e}")
-        return jsonify({"status": "error", "message": str(e)}), 500
+        return {"status": "error", "message": str(e)}, 500
+
+
+def skull_arena_load_body(row):
+    """Réponse de skull_arena_get_data pour la ligne lue (None si absente). Partagé avec asgi.py."""
+    if not row:
+        return {
+            "status": "not_found", 
+            "message": "Données Skull Arena introuvables. Initialisation...",
+            "data": {"skulls": 0, "best_wave": 0, "levels": {"damage": 0, "range": 0, "speed": 0, "fire": 0}}
+        }, 200
+    
+    # CLÉS DE RÉPONSE CORRIGÉES
+    return {
+        "status": "success", 
+        "message": "Données Skull Arena chargées",
+        "data": {
+            "skulls": int(row.get('Crane', 0)),
+            "best_wave": int(row.get('Best_Vague', 0)),
+            "levels": {
+                "damage": int(row.get('UP_Degat', 0)),
+                "range": int(row.get('UP_Portée', 0)),
+                "speed": int(row.get('UP_Vitesse', 0)),
+                "fire": int(row.get('UP_Cadence', 0))
+            }
+        }
+    }, 200
 
 @app.route('/skull_arena_get_leaderboard', methods=['GET'])
 def skull_arena_get_leaderboard():
     """ Récupère les 10 meilleurs scores (Best_Vague) du classement global.
     """
+    return snapshot_response(("skull_arena_leaderboard", leaderboard_revision(skull_arena_leaderboard)), skull_arena_leaderboard_body)
+
+
+def skull_arena_leaderboard_body():
+    """Réponse du classement Skull Arena (réponse, code HTTP), servie en instantané."""
     try:
-        # COLONNE CORRIGÉE : "Best_Vague"
-        response = supabase.table(TABLE_NAME_Skull_Arena) \
-            .select("username, Best_Vague") \
-            .order("Best_Vague", desc=True) \
-            .limit(10) \
-            .execute()
+        # Lu depuis l'index en mémoire (aucun accès base hors premier chargement)
+        top_rows = skull_arena_leaderboard.top()
             
         formatted_data = []
-        for row in response.data:
+        for row in top_rows:
             formatted_data.append({
                 "name": row.get('username'),
                 "wave": int(row.get('Best_Vague', 0)) # CLÉ DE RÉPONSE CORRIGÉE
             })
 
-        return jsonify({
+        return {
             "status": "success", 
             "message": "Classement global Skull Arena chargé.", 
             "data": formatted_data
-        }), 200
+        }, 200
         
     except Exception as e:
         print(f"[LEADERBOARD SKULL ARENA ERROR] {e}")
-        return jsonify({"status": "error", "message": str(e)}), 500
+        return {"status": "error", "message": str(e)}, 500
 
 # ------------------------------------------------
 # ASTRO DODGE (ROUTES DE GESTION DE JEU)
@@ -393,105 +705,116 @@ def astro_dodge_update_data():
     """ [Astro_Dodge_ServerSave] Met à jour le meilleur score, le crédit et les vaisseaux débloqués du joueur.
     Table : Astro_Dodge, Colonnes : username, "PR_Score", "Coins", "Voiture"
     """
-    data = request.get_json(force=True)
+    body, code = save_astro_dodge_data(request.get_json(force=True))
+    return jsonify(body), code
+
+
+def save_astro_dodge_data(data):
+    """Validation + sauvegarde Astro Dodge ; renvoie (réponse, code HTTP). Partagé avec /save_all."""
     username = (data.get('username') or "").strip()
     if not username:
-        return jsonify({"status": "error", "message": "Username manquant"}), 400
+        return {"status": "error", "message": "Username manquant"}, 400
     try:
         new_score = int(data.get('score', 0))
         # CORRECTION 3: Récupération de la chaîne de voitures
         new_voiture_string = (data.get('Voiture') or "Standard").strip()
         
-        # 1. Fetcher le meilleur score actuel (la logique de comparaison reste intacte)
-        current_data_query = supabase.table(TABLE_NAME_ASTRO_DODGE).select('"PR_Score"').eq('username', username).limit(1).execute()
-        current_data = current_data_query.data[0] if current_data_query.data else None
-        current_best_score = current_data.get('PR_Score', 0) if current_data else 0
-        final_best_score = max(current_best_score, new_score)
-        
-        # 2. Préparer le payload
+        # 1. Préparer le payload
         payload = {
             "username": username,
-            "PR_Score": final_best_score,
+            "PR_Score": new_score,
             "Coins": int(data.get('credit', 0)),
             # CORRECTION 4: Ajout de la clé "Voiture" au payload de l'upsert
             "Voiture": new_voiture_string 
         }
         
-        # 3. Effectuer l'UPSERT
-        response = supabase.table(TABLE_NAME_ASTRO_DODGE).upsert(payload, on_conflict="username").execute()
-        if response.data:
-            return jsonify({"status": "success", "message": "Sauvegarde Astro Dodge réussie"}), 200
+        # 2. UPSERT conditionnel : la base conserve le meilleur score (un seul aller-retour)
+        final_best_score = save_best_score(TABLE_NAME_ASTRO_DODGE, "PR_Score", payload)
+        if final_best_score is not None:
+            astro_dodge_leaderboard.offer({"username": username, "PR_Score": final_best_score})
+            return {"status": "success", "message": "Sauvegarde Astro Dodge réussie"}, 200
         else:
-            return jsonify({"status": "error", "message": "Échec de l'UPSERT Astro Dodge"}), 500
+            return {"status": "error", "message": "Échec de l'UPSERT Astro Dodge"}, 500
     except Exception as e:
         print(f"[SAVE ASTRO DODGE ERROR] {e}")
-        return jsonify({"status": "error", "message": str(e)}), 500
+        return {"status": "error", "message": str(e)}, 500
 
 @app.route('/astro_dodge_get_data', methods=['POST'])
 def astro_dodge_get_data():
     """ [Astro_Dodge_ServerLoad] Récupère les données d'un joueur, y compris les vaisseaux débloqués.
     """
-    data = request.get_json(force=True)
+    body, code = load_astro_dodge_data(request.get_json(force=True))
+    return jsonify(body), code
+
+
+# CORRECTION 1: Ajout de "Voiture" à la sélection des colonnes
+ASTRO_DODGE_LOAD_COLUMNS = '"PR_Score", "Coins", "Voiture"'
+
+
+def load_astro_dodge_data(data):
+    """Lecture Astro Dodge ; renvoie (réponse, code HTTP). Partagé avec /profile."""
     username = (data.get('username') or "").strip()
     if not username:
-        return jsonify({"status": "error", "message": "Username manquant"}), 400
+        return {"status": "error", "message": "Username manquant"}, 400
     try:
-        # CORRECTION 1: Ajout de "Voiture" à la sélection des colonnes
-        columns = '"PR_Score", "Coins", "Voiture"' 
-        response = supabase.table(TABLE_NAME_ASTRO_DODGE).select(columns).eq('username', username).limit(1).execute()
-        
-        if not response.data:
-            return jsonify({
-                "status": "not_found", 
-                "message": "Données Astro Dodge introuvables. Initialisation...",
-                # J'initialise 'Voiture' ici aussi, par sécurité, même si le client a un fallback
-                "data": {"score": 0, "credit": 0, "Voiture": "Standard"} 
-            }), 200
-            
-        row = response.data[0]
-        # CLÉS DE RÉPONSE CORRIGÉES
-        return jsonify({
-            "status": "success", 
-            "message": "Données Astro Dodge chargées",
-            "data": {
-                "score": int(row.get('PR_Score', 0)),
-                "credit": int(row.get('Coins', 0)),
-                # CORRECTION 2: Ajout de la clé "Voiture" dans la réponse
-                "Voiture": row.get('Voiture', 'Standard') 
-            }
-        }), 200
+        response = supabase.table(TABLE_NAME_ASTRO_DODGE).select(ASTRO_DODGE_LOAD_COLUMNS).eq('username', username).limit(1).execute()
+        return astro_dodge_load_body(response.data[0] if response.data else None)
     except Exception as e:
         print(f"[LOAD ASTRO DODGE ERROR] {e}")
-        return jsonify({"status": "error", "message": str(e)}), 500
+        return {"status": "error", "message": str(e)}, 500
+
+
+def astro_dodge_load_body(row):
+    """Réponse de astro_dodge_get_data pour la ligne lue (None si absente). Partagé avec asgi.py."""
+    if not row:
+        return {
+            "status": "not_found", 
+            "message": "Données Astro Dodge introuvables. Initialisation...",
+            # J'initialise 'Voiture' ici aussi, par sécurité, même si le client a un fallback
+            "data": {"score": 0, "credit": 0, "Voiture": "Standard"} 
+        }, 200
+
+    # CLÉS DE RÉPONSE CORRIGÉES
+    return {
+        "status": "success", 
+        "message": "Données Astro Dodge chargées",
+        "data": {
+            "score": int(row.get('PR_Score', 0)),
+            "credit": int(row.get('Coins', 0)),
+            # CORRECTION 2: Ajout de la clé "Voiture" dans la réponse
+            "Voiture": row.get('Voiture', 'Standard') 
+        }
+    }, 200
         
 @app.route('/astro_dodge_get_leaderboard', methods=['GET'])
 def astro_dodge_get_leaderboard():
     """ Récupère les 10 meilleurs scores ("PR_Score") du classement global.
     """
+    return snapshot_response(("astro_dodge_leaderboard", leaderboard_revision(astro_dodge_leaderboard)), astro_dodge_leaderboard_body)
+
+
+def astro_dodge_leaderboard_body():
+    """Réponse du classement Astro Dodge (réponse, code HTTP), servie en instantané."""
     try:
-        # COLONNE CORRIGÉE : "PR_Score"
-        response = supabase.table(TABLE_NAME_ASTRO_DODGE) \
-            .select("username, PR_Score") \
-            .order("PR_Score", desc=True) \
-            .limit(10) \
-            .execute()
+        # Lu depuis l'index en mémoire (aucun accès base hors premier chargement)
+        top_rows = astro_dodge_leaderboard.top()
             
         formatted_data = []
-        for row in response.data:
+        for row in top_rows:
             formatted_data.append({
                 "name": row.get('username'),
                 "score": int(row.get('PR_Score', 0)) # CLÉ DE RÉPONSE CORRIGÉE
             })
 
-        return jsonify({
+        return {
             "status": "success", 
             "message": "Classement global Astro Dodge chargé.", 
             "data": formatted_data
-        }), 200
+        }, 200
         
     except Exception as e:
         print(f"[LEADERBOARD ASTRO DODGE ERROR] {e}")
-        return jsonify({"status": "error", "message": str(e)}), 500
+        return {"status": "error", "message": str(e)}, 500
 
 # ------------------------------------------------
 # STICKMAN RUNNER (ROUTES DE GESTION DE JEU)
@@ -501,11 +824,16 @@ def stickman_runner_update_data():
     """ [Stickman_Runner_ServerSave] Met à jour la meilleure distance, le crédit et le grade du joueur.
     Table : Stickman_Runner, Colonnes : username, best_score, credit, grade
     """
-    data = request.get_json(force=True)
+    body, code = save_stickman_runner_data(request.get_json(force=True))
+    return jsonify(body), code
+
+
+def save_stickman_runner_data(data):
+    """Validation + sauvegarde Stickman Runner ; renvoie (réponse, code HTTP). Partagé avec /save_all."""
     username = (data.get('username') or "").strip()
 
     if not username:
-        return jsonify({"status": "error", "message": "Username manquant"}), 400
+        return {"status": "error", "message": "Username manquant"}, 400
     try:
         # CORRECTION 1 : Le client envoie 'best_score', pas 'distance'.
         new_distance = int(data.get('best_score', 0)) 
@@ -513,101 +841,384 @@ def stickman_runner_update_data():
         # CORRECTION 2 : Récupérer le grade envoyé par le client (string)
         new_grade = (data.get('grade') or "").strip()
 
-        # 1. Fetcher la meilleure distance actuelle
-        current_data_query = supabase.table(TABLE_NAME_STICKMAN_RUNNER).select('best_score').eq('username', username).limit(1).execute()
-        current_data = current_data_query.data[0] if current_data_query.data else None
-        current_best_distance = current_data.get('best_score', 0) if current_data else 0
-        final_best_distance = max(current_best_distance, new_distance)
-
-        # 2. Préparer le payload (Ajout de 'grade')
+        # 1. Préparer le payload (Ajout de 'grade')
         payload = {
             "username": username,
-            "best_score": final_best_distance,
+            "best_score": new_distance,
             "credit": new_credit, 
             "grade": new_grade # NOUVEAU : Sauvegarde du grade
         }
         
-        # 3. Effectuer l'UPSERT
-        response = supabase.table(TABLE_NAME_STICKMAN_RUNNER).upsert(payload, on_conflict="username").execute()
+        # 2. UPSERT conditionnel : la base conserve la meilleure distance (un seul aller-retour)
+        final_best_distance = save_best_score(TABLE_NAME_STICKMAN_RUNNER, "best_score", payload)
         
-        if response.data:
-            return jsonify({"status": "success", "message": "Sauvegarde Stickman Runner réussie"}), 200
+        if final_best_distance is not None:
+            stickman_runner_leaderboard.offer({"username": username, "best_score": final_best_distance, "grade": new_grade})
+            return {"status": "success", "message": "Sauvegarde Stickman Runner réussie"}, 200
         else:
-            return jsonify({"status": "error", "message": "Échec de l'UPSERT Stickman Runner"}), 500
+            return {"status": "error", "message": "Échec de l'UPSERT Stickman Runner"}, 500
             
     except Exception as e:
         print(f"[SAVE STICKMAN RUNNER ERROR] {e}")
-        return jsonify({"status": "error", "message": str(e)}), 500
+        return {"status": "error", "message": str(e)}, 500
         
 @app.route('/stickman_runner_get_data', methods=['POST'])
 def stickman_runner_get_data():
     """ [Stickman_Runner_ServerLoad] Récupère les données d'un joueur.
     """
-    data = request.get_json(force=True)
+    body, code = load_stickman_runner_data(request.get_json(force=True))
+    return jsonify(body), code
+
+
+# COLONNES CORRIGÉES : best_score, credit
+STICKMAN_RUNNER_LOAD_COLUMNS = 'best_score, credit, grade'
+
+
+def load_stickman_runner_data(data):
+    """Lecture Stickman Runner ; renvoie (réponse, code HTTP). Partagé avec /profile."""
     username = (data.get('username') or "").strip()
 
     if not username:
-        return jsonify({"status": "error", "message": "Username manquant"}), 400
+        return {"status": "error", "message": "Username manquant"}, 400
     try:
-        # COLONNES CORRIGÉES : best_score, credit
-        columns = 'best_score, credit, grade'
-        response = supabase.table(TABLE_NAME_STICKMAN_RUNNER).select(columns).eq('username', username).limit(1).execute()
-
-        if not response.data:
-            return jsonify({
-                "status": "not_found", 
-                "message": "Données Stickman Runner introuvables. Initialisation...",
-                "data": {"distance": 0, "credit": 0}
-            }), 200
-
-        row = response.data[0]
-        # CLÉS DE RÉPONSE CORRIGÉES
-        return jsonify({
-            "status": "success", 
-            "message": "Données stickman Runner chargées",
-            "data": {
-                "distance": int(row.get('best_score', 0)), # CORRIGÉ (votre schéma a 'best_score')
-                "credit": int(row.get('credit', 0)), # CORRIGÉ (votre schéma a 'credit')
-                "grade": row.get('grade','')
-            }
-        }), 200
+        response = supabase.table(TABLE_NAME_STICKMAN_RUNNER).select(STICKMAN_RUNNER_LOAD_COLUMNS).eq('username', username).limit(1).execute()
+        return stickman_runner_load_body(response.data[0] if response.data else None)
 
     except Exception as e:
         print(f"[LOAD STICKMAN RUNNER ERROR] {e}")
-        return jsonify({"status": "error", "message": str(e)}), 500
+        return {"status": "error", "message": str(e)}, 500
+
+
+def stickman_runner_load_body(row):
+    """Réponse de stickman_runner_get_data pour la ligne lue (None si absente). Partagé avec asgi.py."""
+    if not row:
+        return {
+            "status": "not_found", 
+            "message": "Données Stickman Runner introuvables. Initialisation...",
+            "data": {"distance": 0, "credit": 0}
+        }, 200
+
+    # CLÉS DE RÉPONSE CORRIGÉES
+    return {
+        "status": "success", 
+        "message": "Données stickman Runner chargées",
+        "data": {
+            "distance": int(row.get('best_score', 0)), # CORRIGÉ (votre schéma a 'best_score')
+            "credit": int(row.get('credit', 0)), # CORRIGÉ (votre schéma a 'credit')
+            "grade": row.get('grade','')
+        }
+    }, 200
 
 @app.route('/stickman_runner_get_leaderboard', methods=['GET'])
 def stickman_runner_get_leaderboard():
     """ Récupère les 10 meilleures distances (best_score) et le grade du classement global.
     """
+    return snapshot_response(("stickman_runner_leaderboard", leaderboard_revision(stickman_runner_leaderboard)), stickman_runner_leaderboard_body)
+
+
+def stickman_runner_leaderboard_body():
+    """Réponse du classement Stickman Runner (réponse, code HTTP), servie en instantané."""
     try:
-        # COLONNE CORRIGÉE : best_score, et AJOUT de 'grade'
-        response = supabase.table(TABLE_NAME_STICKMAN_RUNNER) \
-            .select("username, best_score, grade") \
-            .order("best_score", desc=True) \
-            .limit(10) \
-            .execute()
+        # Lu depuis l'index en mémoire (aucun accès base hors premier chargement)
+        top_rows = stickman_runner_leaderboard.top()
             
         formatted_data = []
-        for row in response.data:
+        for row in top_rows:
             formatted_data.append({
                 "name": row.get('username'),
                 "distance": int(row.get('best_score', 0)), # CLÉ DE RÉPONSE CORRIGÉE
                 "grade": row.get('grade') # AJOUT DE LA COLONNE 'grade'
             })
 
-        return jsonify({
+        return {
             "status": "success", 
             "message": "Classement global Stickman Runner chargé.", 
             "data": formatted_data
-        }), 200
+        }, 200
         
     except Exception as e:
         print(f"[LEADERBOARD STICKMAN RUNNER ERROR] {e}")
-        return jsonify({"status": "error", "message": str(e)}), 500
+        return {"status": "error", "message": str(e)}, 500
+
 #----------------------------------
 #--------------chess game----------
 #----------------------------------
+# Parties actives en mémoire (LRU de chess.Board) ; chaque coup est écrit en base avant la réponse
+CHESS_CACHE_SIZE = int(os.environ.get("CHESS_CACHE_SIZE", 1000))
+# Coups légaux et issue mémorisés par FEN (LRU, par worker)
+CHESS_POSITION_CACHE_SIZE = int(os.environ.get("CHESS_POSITION_CACHE_SIZE", 10000))
+# Nombre maximal de coups anticipés (premoves) en file par joueur
+CHESS_MAX_PREMOVES = int(os.environ.get("CHESS_MAX_PREMOVES", 20))
+# Délai (secondes) après lequel un joueur en attente qui ne consulte plus sa partie n'est plus apparié
+MATCHMAKING_WAIT_TIMEOUT = float(os.environ.get("MATCHMAKING_WAIT_TIMEOUT", 60))
+# Profondeur de la file de matchmaking : intervalle (secondes) du comptage, fait par un seul worker
+MATCHMAKING_DEPTH_INTERVAL = float(os.environ.get("MATCHMAKING_DEPTH_INTERVAL", 10))
+MATCHMAKING_LOCK_PATH = os.environ.get(
+    "MATCHMAKING_LOCK_PATH", os.path.join(tempfile.gettempdir(), "project_3_api_matchmaking.lock")
+)
+# Nettoyage de la table chess (un seul worker) : parties sans Noir supprimées quand le joueur en attente
+# ne les consulte plus depuis CHESS_UNJOINED_TTL secondes, parties terminées archivées CHESS_ARCHIVE_DELAY
+# secondes après la fin
+CHESS_REAPER_INTERVAL = float(os.environ.get("CHESS_REAPER_INTERVAL", 60))
+CHESS_UNJOINED_TTL = float(os.environ.get("CHESS_UNJOINED_TTL", 600))
+CHESS_ARCHIVE_DELAY = float(os.environ.get("CHESS_ARCHIVE_DELAY", 300))
+CHESS_ARCHIVE_BATCH = int(os.environ.get("CHESS_ARCHIVE_BATCH", 100))
+CHESS_REAPER_LOCK_PATH = os.environ.get(
+    "CHESS_REAPER_LOCK_PATH", os.path.join(tempfile.gettempdir(), "project_3_api_chess_reaper.lock")
+)
+
+
+def load_chess_game(game_uuid):
+    result = supabase.table(TABLE_NAME_CHESS) \
+        .select("fen_state, white_player_id, black_player_id, moves_list, moves_packed, abandon, "
+                "premove_player, premoves") \
+        .eq("uuid", game_uuid) \
+        .single() \
+        .execute()
+    row = dict(result.data)
+    # Historique binaire (moves_packed) décodé en UCI ; une ligne encore au
+    # format JSON n'a pas de coups "en binaire" : sa première écriture sera complète
+    row["moves_list"] = row_moves(row)
+    row["stored_plies"] = len(row["moves_list"]) if row.get("moves_packed") or not row["moves_list"] else None
+    return row
+
+
+def save_chess_moves(game_uuid, fen, stored_plies, moves, finished_at=None, premoves=None):
+    """RPC save_chess_moves : ajoute `moves` après les `stored_plies` coups sur lesquels ils ont été validés.
+
+    stored_plies None (partie encore au format JSON) : `moves` est l'historique
+    complet. `premoves` remplace la file de coups anticipés (None : inchangée).
+    Renvoie {moves_bytes, premove_player, premoves} relus après écriture, None
+    si la partie a changé entre-temps (coup joué via un autre worker,
+    abandon) : rien n'est alors écrit.
+    """
+    response = supabase.rpc("save_chess_moves", {
+        "p_game_uuid": game_uuid,
+        "fen": fen,
+        "stored_bytes": None if stored_plies is None else 2 * stored_plies,
+        "moves": to_base64(pack_moves(moves)),
+        "p_finished_at": finished_at,
+        "p_premoves": premoves
+    }).execute()
+    return response.data
+
+
+def clear_chess_premoves(game_uuid, fen):
+    """Annule en base la file de coups anticipés (condition non remplie), tant que la position n'a pas changé."""
+    supabase.table(TABLE_NAME_CHESS) \
+        .update({"premove_player": None, "premoves": None}) \
+        .eq("uuid", game_uuid) \
+        .eq("fen_state", fen) \
+        .execute()
+
+
+chess_sessions = ChessSessionCache(load_chess_game, INITIAL_FEN, CHESS_CACHE_SIZE)
+
+
+def find_or_create_chess_match(player_id):
+    """RPC find_or_create_chess_match : appariement atomique en base (voir matchmaking.py)."""
+    response = supabase.rpc("find_or_create_chess_match", {
+        "p_player_id": player_id,
+        "p_game_uuid": str(uuid.uuid4()),
+        "p_fen": INITIAL_FEN,
+        "wait_timeout": MATCHMAKING_WAIT_TIMEOUT
+    }).execute()
+    return response.data[0]
+
+
+def touch_waiting_chess_game(game_uuid):
+    """Rafraîchit l'attente d'un joueur sans adversaire (waiting_seen_at)."""
+    supabase.table(TABLE_NAME_CHESS) \
+        .update({"waiting_seen_at": datetime.now(timezone.utc).isoformat()}) \
+        .eq("uuid", game_uuid) \
+        .is_("black_player_id", "null") \
+        .execute()
+
+
+def count_waiting_chess_games():
+    """Joueurs en attente d'adversaire encore appariables."""
+    fresh_after = (datetime.now(timezone.utc) - timedelta(seconds=MATCHMAKING_WAIT_TIMEOUT)).isoformat()
+    response = supabase.table(TABLE_NAME_CHESS) \
+        .select("uuid", count="exact") \
+        .is_("black_player_id", "null") \
+        .gte("waiting_seen_at", fresh_after) \
+        .limit(1) \
+        .execute()
+    return response.count or 0
+
+
+matchmaker = Matchmaker(
+    find_or_create_chess_match, touch_waiting_chess_game, count_waiting_chess_games,
+    MATCHMAKING_LOCK_PATH, MATCHMAKING_WAIT_TIMEOUT
+)
+background.register("matchmaking_depth", MATCHMAKING_DEPTH_INTERVAL, matchmaker.refresh_depth)
+app_metrics.describe("matchmaking_pairing_seconds", "histogram", "Attente du joueur Blanc avant l'arrivée d'un adversaire.")
+position_cache = PositionCache(CHESS_POSITION_CACHE_SIZE)
+
+
+# Notifications d'état des parties (/game_events) : long-poll ou SSE
+GAME_EVENTS_MAX_WAIT = float(os.environ.get("GAME_EVENTS_MAX_WAIT", 25))
+GAME_EVENTS_HEARTBEAT = float(os.environ.get("GAME_EVENTS_HEARTBEAT", 15))
+GAME_EVENTS_DIR = os.environ.get(
+    "GAME_EVENTS_DIR", os.path.join(tempfile.gettempdir(), "project_3_api_game_events")
+)
+
+game_event_hub = GameEventHub()
+
+
+def receive_game_event(snapshot):
+    """Instantané publié par un autre worker : la session en cache de la partie est périmée s'il la devance."""
+    game_event_hub.receive(snapshot)
+    session = chess_sessions.peek(snapshot["game_uuid"])
+    if session is not None and snapshot["version"] > session.version():
+        chess_sessions.invalidate(snapshot["game_uuid"])
+
+
+# Canal local entre workers gunicorn (démarré avec les tâches d'arrière-plan)
+game_event_channel = LocalChannel(GAME_EVENTS_DIR, receive_game_event)
+game_event_hub.channel = game_event_channel
+
+# Flux spectateur (/spectate) : instantanés partagés gardés en mémoire (parties, par worker)
+SPECTATOR_CACHE_SIZE = int(os.environ.get("SPECTATOR_CACHE_SIZE", 1000))
+
+
+def build_spectator_snapshot(game_uuid, event, previous):
+    """Corps du flux spectateur pour l'état `event` de GameEventHub (FEN, coups, abandon).
+
+    La liste des coups est reprise du corps précédent quand la partie n'a
+    avancé que d'un coup (ou pas du tout), sinon de la session en cache si
+    elle est à jour, et en dernier recours lue en base (une fois par worker).
+    """
+    complete = previous is not None and len(previous["moves"]) == previous["ply"]
+    if event["ply"] == 0:
+        moves = []
+    elif complete and event["ply"] == previous["ply"]:
+        moves = previous["moves"]
+    elif complete and event["last_move"] and event["ply"] == previous["ply"] + 1:
+        moves = previous["moves"] + [event["last_move"]]
+    else:
+        moves = None
+        session = chess_sessions.peek(game_uuid)
+        if session is not None:
+            with session.lock:
+                if session.board.fen() == event["fen"]:
+                    moves = list(session.moves_list)
+        if moves is None:
+            result = supabase.table(TABLE_NAME_CHESS) \
+                .select("moves_list, moves_packed") \
+                .eq("uuid", game_uuid) \
+                .single() \
+                .execute()
+            moves = row_moves(result.data)
+
+    body = {"status": "success", **event, "moves": moves}
+    return body, (app.json.dumps(body, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+spectator_feed = SpectatorFeed(build_spectator_snapshot, SPECTATOR_CACHE_SIZE)
+
+
+def current_game_snapshot(game_uuid):
+    """Dernier instantané connu de la partie ; lu en base seulement la première fois."""
+    snapshot = game_event_hub.get(game_uuid)
+    if snapshot is None:
+        result = supabase.table(TABLE_NAME_CHESS) \
+            .select("fen_state, white_player_id, black_player_id, abandon") \
+            .eq("uuid", game_uuid) \
+            .single() \
+            .execute()
+        row = result.data
+        game_event_hub.apply(build_snapshot(
+            game_uuid, row["fen_state"], row.get("white_player_id"), row.get("black_player_id"), row.get("abandon")
+        ))
+        snapshot = game_event_hub.get(game_uuid)
+    return snapshot
+
+
+def reap_unjoined_chess_games():
+    """Supprime les parties sans joueur Noir dont l'attente n'est plus rafraîchie depuis CHESS_UNJOINED_TTL secondes."""
+    limit_iso = (datetime.now(timezone.utc) - timedelta(seconds=CHESS_UNJOINED_TTL)).isoformat()
+    response = supabase.table(TABLE_NAME_CHESS) \
+        .delete() \
+        .is_("black_player_id", "null") \
+        .lt("waiting_seen_at", limit_iso) \
+        .execute()
+    reaped = [row["uuid"] for row in response.data or []]
+    for game_uuid in reaped:
+        forget_chess_game(game_uuid)
+    app_metrics.inc("chess_games_reaped_total", (), len(reaped))
+    return len(reaped)
+
+
+def archive_finished_chess_games():
+    """Déplace vers chess_archive (PGN compressé) un lot de parties terminées depuis CHESS_ARCHIVE_DELAY secondes.
+
+    L'insertion dans l'archive et la suppression de la ligne chess se font
+    dans une seule transaction (RPC archive_chess_games).
+    """
+    limit_iso = (datetime.now(timezone.utc) - timedelta(seconds=CHESS_ARCHIVE_DELAY)).isoformat()
+    response = supabase.table(TABLE_NAME_CHESS) \
+        .select("uuid, created_at, finished_at, white_player_id, black_player_id, moves_list, moves_packed, abandon") \
+        .lt("finished_at", limit_iso) \
+        .order("finished_at") \
+        .limit(CHESS_ARCHIVE_BATCH) \
+        .execute()
+    rows = response.data or []
+    if not rows:
+        return 0
+
+    games = []
+    for row in rows:
+        pgn, result, termination, plies = build_pgn(row, row_moves(row), INITIAL_FEN)
+        games.append({
+            "uuid": row["uuid"],
+            "white_player_id": row.get("white_player_id"),
+            "black_player_id": row.get("black_player_id"),
+            "result": result,
+            "termination": termination,
+            "plies": plies,
+            "pgn": to_base64(compress_pgn(pgn)),
+            "created_at": row.get("created_at"),
+            "finished_at": row.get("finished_at"),
+        })
+    archived = supabase.rpc("archive_chess_games", {"games": games}).execute().data or 0
+    for game in games:
+        forget_chess_game(game["uuid"])
+    app_metrics.inc("chess_games_archived_total", (), archived)
+    return archived
+
+
+def forget_chess_game(game_uuid):
+    """Oublie une partie supprimée de la table chess dans les caches de ce worker."""
+    chess_sessions.invalidate(game_uuid)
+    game_event_hub.forget(game_uuid)
+    spectator_feed.forget(game_uuid)
+
+
+app_metrics.describe("chess_games_reaped_total", "counter", "Parties d'échecs jamais rejointes supprimées par le nettoyage.")
+app_metrics.describe("chess_games_archived_total", "counter", "Parties d'échecs terminées déplacées vers chess_archive.")
+chess_reaper = ChessReaper(reap_unjoined_chess_games, archive_finished_chess_games, CHESS_REAPER_LOCK_PATH)
+background.register("chess_reaper", CHESS_REAPER_INTERVAL, chess_reaper.run_once)
+
+
+@app.route("/chess_cache_stats", methods=["GET"])
+def chess_cache_stats():
+    """Statistiques du cache des parties (hits / misses / évictions) et des écritures différées."""
+    return jsonify({
+        "status": "success",
+        "cache": chess_sessions.stats(),
+        "events": game_event_hub.stats(),
+        "reaper": chess_reaper.stats(),
+        "positions": position_cache.stats(),
+        "spectators": spectator_feed.stats()
+    }), 200
+
+
+@app.route("/matchmaking_stats", methods=["GET"])
+def matchmaking_stats():
+    """Profondeur de la file d'attente et latence d'appariement."""
+    return jsonify({"status": "success", "data": matchmaker.stats()}), 200
+
 # 1. Matchmaking : Trouve ou crée une partie
 # 1. Matchmaking : Trouve ou crée une partie
 @app.route("/find_or_create_match", methods=["POST"])
@@ -621,54 +1232,35 @@ def find_or_create_match():
         return jsonify({"error": "Pseudo manquant dans la requête. Connexion requise."}), 401
 
     try:
-        # 1. Chercher une partie en attente (où black_player_id est NULL)
-        open_games = supabase.table(TABLE_NAME_CHESS) \
-            .select("uuid, fen_state, white_player_id") \
-            .is_("black_player_id", "null") \
-            .neq("white_player_id", player_id) \
-            .limit(1) \
-            .execute()
-
-        if open_games.data:
-            # 2. Partie trouvée : Rejoindre en tant que Noir
-            game_data = open_games.data[0]
-            game_uuid = game_data['uuid']
-            white_id = game_data['white_player_id']
-            
-            # Mise à jour de la partie (Retrait de la tentative de mise à jour de 'game_status')
-            supabase.table(TABLE_NAME_CHESS) \
-                .update({"black_player_id": player_id, "joueurs": f"{white_id},{player_id}"}) \
-                .eq("uuid", game_uuid) \
-                .execute()
+        # 1. Appariement atomique en base (RPC) : la partie ouverte du joueur s'il attend déjà,
+        # sinon la plus ancienne partie ouverte (FIFO), sinon une nouvelle partie ouverte
+        match = matchmaker.pair_or_enqueue(player_id)
+        game_uuid = match["game_uuid"]
+
+        if match["result"] == "joined":
+            # 2. Partie rejointe en tant que Noir
+            white_id = match["white_player_id"]
+            app_metrics.observe("matchmaking_pairing_seconds", (), float(match.get("waited_seconds") or 0))
+            chess_sessions.invalidate(game_uuid)
+            game_event_hub.publish(build_snapshot(
+                game_uuid, match["fen_state"], white_id, player_id, event="join"
+            ))
                 
             return jsonify({
                 "status": "joined",
                 "game_uuid": game_uuid,
                 "player_color": "black",
-                "fen": game_data['fen_state'],
+                "fen": match["fen_state"],
                 "opponent_id": white_id
             })
 
         else:
-            # 3. Aucune partie ouverte : Créer une nouvelle partie en tant que Blanc
-            new_game_uuid = str(uuid.uuid4())
-            
-            new_game = {
-                "uuid": new_game_uuid,
-                "fen_state": INITIAL_FEN,
-                "white_player_id": player_id,
-                "black_player_id": None, 
-                "joueurs": player_id, 
-                "moves_list": [] 
-            }
-            
-            supabase.table(TABLE_NAME_CHESS).insert(new_game).execute()
-            
+            # 3. Personne en attente (ou attente déjà en cours) : le joueur attend en tant que Blanc
             return jsonify({
                 "status": "created",
-                "game_uuid": new_game_uuid,
+                "game_uuid": game_uuid,
                 "player_color": "white",
-                "fen": INITIAL_FEN,
+                "fen": match["fen_state"],
                 "opponent_id": None
             })
 
@@ -679,6 +1271,74 @@ def find_or_create_match():
         print(f"Erreur inattendue lors du matchmaking: {e}")
         return jsonify({"error": "Erreur interne du serveur."}), 500
 
+def joined_chess_session(game_uuid):
+    """Session d'une partie dont le Noir est arrivé, None si le Blanc attend encore un adversaire.
+
+    Une session sans Noir est relue en base : l'adversaire a pu rejoindre via un autre worker.
+    """
+    session = chess_sessions.get(game_uuid)
+    if session.black_player_id is None:
+        session = chess_sessions.reload(game_uuid)
+    return session if session.black_player_id is not None else None
+
+
+def play_chess_move(game_uuid, session, move, premoves=None):
+    """Joue un coup légal sur la session (verrou tenu), l'écrit en base puis le notifie.
+
+    Le coup n'est ajouté en base que si l'historique y est encore celui sur
+    lequel il a été validé ; `premoves` y remplace alors la file de coups
+    anticipés (None : inchangée), et la session reprend la file relue en base. Renvoie les champs game_status / outcome /
+    legal_moves de la nouvelle position, None si la partie a changé en base
+    (coup joué via un autre worker, abandon) : le coup n'est pas joué et la
+    session, périmée, est retirée du cache.
+    """
+    board = session.board
+    board.push(move)
+    new_fen = board.fen()
+
+    # Statut, issue et coups légaux de la nouvelle position (pour la réponse client, pas pour la DB).
+    # La répétition quintuple dépend de l'historique : elle est vérifiée sur le plateau en cache.
+    state = state_fields(
+        position_cache.get(new_fen), session.abandon, session.black_player_id,
+        fivefold=board.is_fivefold_repetition()
+    )
+    finished_at = datetime.now(timezone.utc).isoformat() if state["game_status"] != "active" else None
+
+    # Seul le nouveau coup est envoyé, sauf pour une partie encore au format JSON (réécrite en entier)
+    moves = [move.uci()] if session.stored_plies is not None else session.moves_list + [move.uci()]
+    try:
+        written = save_chess_moves(game_uuid, new_fen, session.stored_plies, moves, finished_at, premoves)
+    except Exception:
+        board.pop()
+        raise
+    if written is None:
+        board.pop()
+        chess_sessions.invalidate(game_uuid)
+        return None
+
+    session.moves_list.append(move.uci())
+    session.stored_plies = len(session.moves_list)
+    session.set_premoves(written["premove_player"], written["premoves"])
+    game_event_hub.publish(build_snapshot(
+        game_uuid, new_fen, session.white_player_id, session.black_player_id,
+        session.abandon, move.uci(), event="move"
+    ))
+    return state
+
+
+def chess_conflict_response(game_uuid, error="La partie a changé entre-temps (coup joué ou abandon) : coup refusé."):
+    """409 d'une écriture refusée car la partie a changé en base ; renvoie l'état relu pour resynchroniser le client."""
+    session = chess_sessions.reload(game_uuid)
+    with session.lock:
+        fen = session.board.fen()
+        state = state_fields(position_cache.get(fen), session.abandon, session.black_player_id)
+    return jsonify({
+        "error": error,
+        "fen": fen,
+        **state
+    }), 409
+
+
 # 2. Envoyer Coup (Make Move)
 # 2. Envoyer Coup (Make Move)
 @app.route("/make_move", methods=["POST"])
@@ -695,64 +1355,132 @@ def make_move():
         return jsonify({"error": "Données de mouvement ou identifiant de joueur manquant."}), 400
 
     try:
-        # 1. Récupérer l'état actuel de la partie
-        result = supabase.table(TABLE_NAME_CHESS) \
-            .select("fen_state, white_player_id, black_player_id, moves_list") \
-            .eq("uuid", game_uuid) \
-            .single() \
-            .execute()
-            
-        game_data = result.data
-        current_fen = game_data['fen_state']
-        moves_list = game_data.get('moves_list') if isinstance(game_data.get('moves_list'), list) else [] 
+        # 1. Récupérer la partie depuis le cache (lecture en base seulement si absente)
+        session = joined_chess_session(game_uuid)
+        if session is None:
+            return jsonify({"error": "En attente d'un adversaire."}), 409
 
-        # 2. Créer l'objet plateau 'python-chess'
-        board = chess.Board(current_fen)
-        
-        # Vérifier si c'est le tour du joueur
-        expected_player = game_data['white_player_id'] if board.turn == chess.WHITE else game_data['black_player_id']
-        if expected_player != player_id:
-            return jsonify({"error": "Ce n'est pas votre tour de jouer."}), 403
+        # Le cache peut être périmé si l'adversaire a joué via un autre worker :
+        # avant de refuser le coup, on relit la partie une fois en base.
+        if not session.accepts(player_id, move_uci):
+            session = chess_sessions.reload(game_uuid)
 
-        # 3. Valider et effectuer le mouvement
-        try:
-            move = chess.Move.from_uci(move_uci)
-        except ValueError:
-            return jsonify({"error": f"Coup UCI invalide: {move_uci}"}), 400
+        with session.lock:
+            board = session.board
 
-        if move not in board.legal_moves:
-            return jsonify({"error": "Coup illégal."}), 400
+            # 2. Vérifier si c'est le tour du joueur
+            if session.expected_player() != player_id:
+                return jsonify({"error": "Ce n'est pas votre tour de jouer."}), 403
 
-        board.push(move)
-        new_fen = board.fen()
-        moves_list.append(move_uci)
+            # 3. Valider et effectuer le mouvement
+            try:
+                move = chess.Move.from_uci(move_uci)
+            except ValueError:
+                return jsonify({"error": f"Coup UCI invalide: {move_uci}"}), 400
+
+            if move not in board.legal_moves:
+                return jsonify({
+                    "error": "Coup illégal.",
+                    "legal_moves": position_cache.get(board.fen()).legal_moves
+                }), 400
+
+            # 4. Jouer le coup (écriture conditionnelle et notification)
+            state = play_chess_move(game_uuid, session, move)
+            if state is None:
+                # Partie modifiée ailleurs depuis la validation : le coup est refusé
+                return chess_conflict_response(game_uuid)
+
+            # 5. Coup anticipé (premove) de l'adversaire en réponse : joué sans attendre son client.
+            # La file vient de la base (relue par l'écriture du coup), même déposée via un autre worker.
+            premove = None
+            if state["game_status"] == "active" and session.premoves:
+                premove = session.take_premove(move.uci())
+                if premove is not None:
+                    premove_state = play_chess_move(game_uuid, session, premove, session.stored_premoves())
+                    if premove_state is None:
+                        premove = None
+                    else:
+                        state = premove_state
+                elif not session.premoves:
+                    clear_chess_premoves(game_uuid, board.fen())
+            new_fen = board.fen()
         
-        # 4. Déterminer le statut (pour la réponse client, pas pour la DB)
-        game_status = "active"
-        if board.is_checkmate():
-            game_status = "checkmate"
-        elif board.is_stalemate() or board.is_fivefold_repetition() or board.is_insufficient_material() or board.is_seventyfive_moves():
-            game_status = "draw"
+        return jsonify({
+            "success": True, 
+            "new_fen": new_fen,
+            "game_status": state["game_status"], # On renvoie le statut au client pour la gestion locale
+            "outcome": state["outcome"],
+            "legal_moves": state["legal_moves"],
+            "premove": premove.uci() if premove is not None else None
+        }), 200
+
+    except PostgrestAPIError as e:
+        print(f"Erreur Supabase lors de la gestion du coup: {e}")
+        return jsonify({"error": f"Erreur Supabase: {e.message}"}), 500
+    except Exception as e:
+        print(f"Erreur inattendue lors du coup: {e}")
+        return jsonify({"error": "Erreur interne du serveur."}), 500
+
+# 2 bis. Coups anticipés (premoves)
+@app.route("/queue_premoves", methods=["POST"])
+def queue_premoves():
+    """
+    Dépose une liste ordonnée de coups conditionnels pendant le tour de l'adversaire :
+    {"game_uuid", "username", "premoves": [{"if": "e7e5", "play": "g1f3"}, ...]}.
+    "if" absent = quelle que soit la réponse. Chaque entrée répond au coup adverse
+    suivant ; make_move la joue aussitôt, et une condition non remplie annule la file.
+    Une liste vide annule les coups en attente. Remplace la file précédente.
+    """
+    data = request.get_json(silent=True) or {}
+    game_uuid = data.get("game_uuid")
+    player_id = (data.get("username") or "").strip()
+    premoves = data.get("premoves")
+
+    if not game_uuid or not player_id or premoves is None:
+        return jsonify({"error": "game_uuid, username et premoves sont requis."}), 400
+    if isinstance(premoves, list) and len(premoves) > CHESS_MAX_PREMOVES:
+        return jsonify({"error": f"Au plus {CHESS_MAX_PREMOVES} coups anticipés."}), 400
+
+    try:
+        session = joined_chess_session(game_uuid)
+        if session is None:
+            return jsonify({"error": "En attente d'un adversaire."}), 409
+
+        with session.lock:
+            if player_id not in (session.white_player_id, session.black_player_id):
+                return jsonify({"error": "L'utilisateur n'est pas un joueur de cette partie."}), 403
+            state = state_fields(position_cache.get(session.board.fen()), session.abandon, session.black_player_id)
+            if state["game_status"] != "active":
+                return jsonify({"error": "La partie est terminée."}), 409
+            if session.expected_player() == player_id:
+                return jsonify({"error": "C'est votre tour : jouez avec make_move."}), 409
+
+            try:
+                parsed = parse_premoves(session.board, premoves)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+
+            # File stockée avec la partie (le coup adverse peut arriver sur un autre worker),
+            # seulement si la position sur laquelle elle a été validée est toujours celle en base
+            session.set_premoves(player_id, parsed)
+            response = supabase.table(TABLE_NAME_CHESS) \
+                .update({"premove_player": session.premove_player, "premoves": session.stored_premoves() or None}) \
+                .eq("uuid", game_uuid) \
+                .eq("fen_state", session.board.fen()) \
+                .is_("abandon", "null") \
+                .execute()
+            if not response.data:
+                return chess_conflict_response(
+                    game_uuid, "La partie a changé entre-temps (coup joué ou abandon) : coups anticipés refusés."
+                )
 
-        update_data = {
-            "fen_state": new_fen,
-            "moves_list": moves_list,
-            # game_status est retiré de la mise à jour DB
-        }
-        
-        supabase.table(TABLE_NAME_CHESS).update(update_data).eq("uuid", game_uuid).execute()
-        
-        return jsonify({
-            "success": True, 
-            "new_fen": new_fen,
-            "game_status": game_status # On renvoie le statut au client pour la gestion locale
-        }), 200
+        return jsonify({"success": True, "queued": len(parsed)}), 200
 
     except PostgrestAPIError as e:
-        print(f"Erreur Supabase lors de la gestion du coup: {e}")
+        print(f"Erreur Supabase lors de l'enregistrement des coups anticipés: {e}")
         return jsonify({"error": f"Erreur Supabase: {e.message}"}), 500
     except Exception as e:
-        print(f"Erreur inattendue lors du coup: {e}")
+        print(f"Erreur inattendue lors de l'enregistrement des coups anticipés: {e}")
         return jsonify({"error": "Erreur interne du serveur."}), 500
 
 # 3. Demander Coups de la Partie (Historique)
@@ -761,15 +1489,16 @@ def make_move():
 def get_moves(game_uuid):
     """
     Récupère la liste complète des coups joués pour une partie donnée.
+    L'historique binaire (moves_packed) est décodé en UCI à la demande.
     """
     try:
         result = supabase.table(TABLE_NAME_CHESS) \
-            .select("moves_list") \
+            .select("moves_list, moves_packed") \
             .eq("uuid", game_uuid) \
             .single() \
             .execute()
             
-        moves = result.data.get("moves_list", [])
+        moves = row_moves(result.data)
 
         return jsonify({
             "game_uuid": game_uuid,
@@ -818,6 +1547,7 @@ def destroy_match():
             .delete() \
             .eq("uuid", game_uuid) \
             .execute()
+        forget_chess_game(game_uuid)
         
         return jsonify({"success": True, "message": f"Partie {game_uuid} supprimée."}), 200
 
@@ -844,7 +1574,7 @@ def get_game_state():
     try:
         # Utilisation de TABLE_NAME_CHESS et sélection des colonnes existantes
         result = supabase.table(TABLE_NAME_CHESS)\
-            .select("fen_state, white_player_id, black_player_id")\
+            .select("fen_state, white_player_id, black_player_id, abandon")\
             .eq("uuid", game_uuid)\
             .single()\
             .execute()
@@ -854,17 +1584,20 @@ def get_game_state():
         if not game_data:
             return jsonify({"status": "error", "message": "Partie non trouvée."}), 404
 
-        # INFERENCE DU STATUT : La colonne game_status n'existe pas, on déduit le statut.
-        # 'active' si l'adversaire (Noir) a rejoint. 'created' sinon.
-        inferred_status = 'created'
+        # STATUT : la colonne game_status n'existe pas, on le déduit de la position (mat, nulle),
+        # de l'abandon, et sinon de la présence de l'adversaire (Noir) : 'active', ou 'created'.
+        # Le client l'utilise pour se débloquer ; legal_moves lui permet de valider ses coups localement.
         opponent_id = game_data.get('black_player_id')
-        if opponent_id:
-            inferred_status = 'active'
+        fen = game_data.get('fen_state') or INITIAL_FEN
+        state = state_fields(position_cache.get(fen), game_data.get('abandon'), opponent_id)
+        if state["game_status"] == "created":
+            # Le joueur en attente consulte sa partie : elle reste appariable
+            matchmaker.touch(game_uuid)
             
         response_data = {
             "status": "success",
-            "game_status": inferred_status, # Le client l'utilise pour se débloquer
-            "fen": game_data.get('fen_state'), 
+            **state,
+            "fen": fen, 
             "player_white_id": game_data.get('white_player_id'), 
             "opponent_id": opponent_id 
         }
@@ -896,7 +1629,7 @@ def give_up_chess():
 
         # 1. Récupérer les données de la partie
         # On vérifie aussi si la partie n'a pas déjà un statut d'abandon
-        game_data_response = supabase.table('chess').select('white_player_id, black_player_id, abandon').eq('uuid', game_uuid).single().execute()
+        game_data_response = supabase.table('chess').select('fen_state, white_player_id, black_player_id, abandon').eq('uuid', game_uuid).single().execute()
 
         if not game_data_response.data:
             return jsonify({"status": "error", "message": "Partie non trouvée."}), 404
@@ -925,9 +1658,15 @@ def give_up_chess():
         # 4. Mettre à jour la colonne 'abandon' avec la couleur du gagnant
         update_data = {
             'abandon': winner_color,
+            'finished_at': datetime.now(timezone.utc).isoformat(),
         }
 
         update_response = supabase.table('chess').update(update_data).eq('uuid', game_uuid).execute()
+        chess_sessions.invalidate(game_uuid)
+        if update_response.data:
+            game_event_hub.publish(build_snapshot(
+                game_uuid, game['fen_state'], white_player, black_player, winner_color, event="abandon"
+            ))
 
         if update_response.data:
             return jsonify({
@@ -986,17 +1725,158 @@ def get_give_up_chess():
         print(f"[GET GIVE UP ERROR] General error: {e}")
         return jsonify({"status": "error", "message": f"Erreur interne du serveur: {str(e)}"}), 500
         
+def game_event_stream(game_uuid, since, render, keep_waiting=False):
+    """Flux SSE des changements d'une partie ; `render(instantané)` donne la ligne data.
+
+    Se termine à la fin de la partie, ou par un évènement 'gone' si la partie
+    a disparu (supprimée, archivée) : sans cela le flux n'enverrait plus que
+    des keep-alive et un EventSource resterait connecté indéfiniment.
+    Avec `keep_waiting`, chaque keep-alive d'une partie sans adversaire
+    rafraîchit son attente dans la file de matchmaking.
+    """
+    version = since
+    while True:
+        current = game_event_hub.wait(game_uuid, version, GAME_EVENTS_HEARTBEAT)
+        if current is None:
+            # Instantané oublié (partie supprimée) ou évincé du hub : on vérifie en base
+            try:
+                current = current_game_snapshot(game_uuid)
+            except PostgrestAPIError as e:
+                if "0 rows" not in str(e):
+                    raise
+                yield f"event: gone\ndata: {json.dumps({'game_uuid': game_uuid})}\n\n"
+                return
+        if current["version"] <= version:
+            if keep_waiting and current["game_status"] == "created":
+                matchmaker.touch(game_uuid)
+            yield ": keep-alive\n\n"
+            continue
+        version = current["version"]
+        yield f"id: {version}\nevent: state\ndata: {render(current)}\n\n"
+        if current["game_status"] in FINISHED_STATUSES:
+            return
+
+
+@app.route('/game_events/<game_uuid>', methods=['GET'])
+def game_events(game_uuid):
+    """
+    Attend un changement d'état de la partie (coup, arrivée du Noir, abandon)
+    au lieu d'interroger get_game_state / get_give_up_chess en boucle.
+
+    - Long-poll (défaut) : ?since=<version> ; répond dès qu'une version plus
+      récente existe, sinon {"status": "timeout"} après ?timeout= secondes.
+    - SSE : ?mode=sse ou en-tête Accept: text/event-stream ; un évènement
+      'state' par changement jusqu'à la fin de la partie.
+    """
+    since = request.args.get('since', default=-1, type=int)
+    timeout = min(request.args.get('timeout', default=GAME_EVENTS_MAX_WAIT, type=float), GAME_EVENTS_MAX_WAIT)
+
+    try:
+        snapshot = current_game_snapshot(game_uuid)
+    except PostgrestAPIError as e:
+        if "0 rows" in str(e):
+            return jsonify({"status": "error", "message": "Partie non trouvée."}), 404
+        print(f"[GAME EVENTS ERROR] Supabase error: {e}")
+        return jsonify({"status": "error", "message": f"Erreur de base de données: {e.message}"}), 500
+    except Exception as e:
+        print(f"[GAME EVENTS ERROR] General error: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+    if snapshot["game_status"] == "created":
+        # Le joueur en attente suit sa partie : elle reste appariable
+        matchmaker.touch(game_uuid)
+
+    wants_sse = request.args.get('mode') == 'sse' or 'text/event-stream' in request.headers.get('Accept', '')
+    if not wants_sse:
+        if snapshot["version"] <= since:
+            snapshot = game_event_hub.wait(game_uuid, since, timeout)
+        if snapshot is None or snapshot["version"] <= since:
+            return jsonify({"status": "timeout", "version": since}), 200
+        return jsonify({"status": "success", **snapshot}), 200
+
+    # Reprise automatique du navigateur après coupure
+    last_event_id = request.headers.get('Last-Event-ID')
+    if last_event_id and last_event_id.isdigit():
+        since = int(last_event_id)
+
+    return Response(stream_with_context(game_event_stream(game_uuid, since, json.dumps, keep_waiting=True)), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/spectate/<game_uuid>', methods=['GET'])
+def spectate(game_uuid):
+    """
+    Suivi d'une partie par des spectateurs : FEN, coups, joueurs, abandon.
+
+    Tous les spectateurs partagent un instantané reconstruit une fois par
+    changement de la partie (spectators.py) : la charge en base ne dépend pas
+    de leur nombre. Mêmes modes que /game_events :
+    - Long-poll (défaut) : ?since=<version>&timeout= ; ETag / If-None-Match -> 304.
+    - SSE : ?mode=sse ou Accept: text/event-stream ; un évènement 'state' par changement.
+    """
+    since = request.args.get('since', default=-1, type=int)
+    timeout = min(request.args.get('timeout', default=GAME_EVENTS_MAX_WAIT, type=float), GAME_EVENTS_MAX_WAIT)
+
+    try:
+        event = current_game_snapshot(game_uuid)
+    except PostgrestAPIError as e:
+        if "0 rows" in str(e):
+            return jsonify({"status": "error", "message": "Partie non trouvée."}), 404
+        print(f"[SPECTATE ERROR] Supabase error: {e}")
+        return jsonify({"status": "error", "message": f"Erreur de base de données: {e.message}"}), 500
+    except Exception as e:
+        print(f"[SPECTATE ERROR] General error: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+    wants_sse = request.args.get('mode') == 'sse' or 'text/event-stream' in request.headers.get('Accept', '')
+    if not wants_sse:
+        try:
+            with spectator_feed.watch(game_uuid):
+                if event["version"] <= since:
+                    event = game_event_hub.wait(game_uuid, since, timeout)
+                if event is None or event["version"] <= since:
+                    return jsonify({"status": "timeout", "version": since}), 200
+                snapshot, cached = spectator_feed.get(game_uuid, event)
+        except Exception as e:
+            print(f"[SPECTATE ERROR] General error: {e}")
+            return jsonify({"status": "error", "message": str(e)}), 500
+        return send_snapshot(snapshot, cached)
+
+    # Reprise automatique du navigateur après coupure
+    last_event_id = request.headers.get('Last-Event-ID')
+    if last_event_id and last_event_id.isdigit():
+        since = int(last_event_id)
+
+    def render(current):
+        snapshot, _ = spectator_feed.get(game_uuid, current)
+        return snapshot.body.decode('utf-8').rstrip()
+
+    def stream():
+        # Le spectateur reste compté jusqu'à la fin du flux (fin de partie, partie disparue, déconnexion)
+        with spectator_feed.watch(game_uuid):
+            yield from game_event_stream(game_uuid, since, render)
+
+    return Response(stream_with_context(stream()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
 #------------------------------------------ Jeu de Casino -------------------------------
 
 
 @app.route('/Casino_update_data', methods=['POST'])
 def casino_update_data():
-    
-    data = request.get_json(force=True)
+    body, code = save_casino_data(request.get_json(force=True))
+    return jsonify(body), code
+
+
+def save_casino_data(data):
+    """Validation + sauvegarde Casino ; renvoie (réponse, code HTTP). Partagé avec /save_all."""
     username = (data.get('username') or "").strip()
 
     if not username:
-        return jsonify({"status": "error", "message": "Username manquant"}), 400
+        return {"status": "error", "message": "Username manquant"}, 400
     try:
         new_money = int(data.get('money', 0))
         success = data.get('success', {})
@@ -1011,50 +1891,64 @@ def casino_update_data():
         response = supabase.table("Casino").upsert(payload, on_conflict="username").execute()
         
         if response.data:
-            return jsonify({"status": "success", "message": "Sauvegarde Casino réussie"}), 200
+            return {"status": "success", "message": "Sauvegarde Casino réussie"}, 200
         else:
-            return jsonify({"status": "error", "message": "Échec de l'UPSERT Casino"}), 500
+            return {"status": "error", "message": "Échec de l'UPSERT Casino"}, 500
             
     except Exception as e:
         print(f"[SAVE STICKMAN RUNNER ERROR] {e}")
-        return jsonify({"status": "error", "message": str(e)}), 500
+        return {"status": "error", "message": str(e)}, 500
         
 @app.route('/Casino_get_data', methods=['POST'])
 def casino_get_data():
-    
-    data = request.get_json(force=True)
+    body, code = load_casino_data(request.get_json(force=True))
+    return jsonify(body), code
+
+
+def load_casino_data(data):
+    """Lecture Casino ; renvoie (réponse, code HTTP). Partagé avec /profile."""
     username = (data.get('username') or "").strip()
 
     if not username:
-        return jsonify({"status": "error", "message": "Username manquant"}), 400
+        return {"status": "error", "message": "Username manquant"}, 400
     try:
-    
-        columns = 'money, success'
-        response = supabase.table("Casino").select(columns).eq('username', username).limit(1).execute()
+        response = supabase.table("Casino").select('money, success').eq('username', username).limit(1).execute()
+        return casino_load_body(response.data[0] if response.data else None)
 
-        if not response.data:
-            return jsonify({
-                "status": "not_found", 
-                "message": "Données Casino introuvables. Initialisation...",
-                "data": {"money": 0, "success": {} }
-            }), 200
+    except Exception as e:
+        print(f"[LOAD Casino ERROR] {e}")
+        return {"status": "error", "message": str(e)}, 500
+
+
+def casino_load_body(row):
+    """Réponse de Casino_get_data pour la ligne lue (None si absente). Partagé avec asgi.py."""
+    if not row:
+        return {
+            "status": "not_found", 
+            "message": "Données Casino introuvables. Initialisation...",
+            "data": {"money": 0, "success": {} }
+        }, 200
+
+    return {
+        "status": "success", 
+        "message": "Données Casino chargées",
+        "data": {
+            "money": int(row.get('money', 0)),
+            "success": row.get('success', {} )
+        }
+    }, 200
 
-        row = response.data[0]
+# Revenu passif Gun Merge : gain par seconde de chaque arme (ID -> gain)
+GUN_MERGE_GAIN_MAP = {1: 1, 2: 3, 3: 8, 4: 20, 5: 50, 6: 120, 7: 300, 8: 800, 9: 2000, 10: 5000}
+# Absence minimale (secondes) pour réclamer un gain
+HL_MIN_ABSENCE_SECONDS = 10
 
-        return jsonify({
-            "status": "success", 
-            "message": "Données Casino chargées",
-            "data": {
-                "money": int(row.get('money', 0)),
-                "success": row.get('success', {} )
-            }
-        }), 200
 
-    except Exception as e:
-        print(f"[LOAD Casino ERROR] {e}")
-        return jsonify({"status": "error", "message": str(e)}), 500
+def gun_merge_income_per_sec(save):
+    """Revenu par seconde de l'inventaire, stocké à la sauvegarde (colonne income_per_sec)."""
+    inventory = save.get("inventory", []) if isinstance(save, dict) else []
+    return sum(GUN_MERGE_GAIN_MAP.get(item['id'], 0) for item in inventory if item and 'id' in item)
 
-from datetime import datetime, timezone
 
 @app.route('/get_HL_money', methods=['POST'])
 def get_HL_money():
@@ -1062,46 +1956,32 @@ def get_HL_money():
     username = (data.get('username') or "").strip()
 
     try:
-        # 1. RÉCUPÉRER les données d'abord
-        response = supabase.table("Gun_Merge").select("*").eq("username", username).single().execute()
-        
+        # 1. RÉCLAMER en une seule requête : last_claim ne passe à 1 que si le gain
+        # n'est pas déjà réclamé et que l'absence dure au moins HL_MIN_ABSENCE_SECONDS
+        # (deux appels simultanés ne peuvent pas réclamer tous les deux)
+        response = supabase.rpc("claim_hl_income", {
+            "p_username": username,
+            "min_seconds": HL_MIN_ABSENCE_SECONDS
+        }).execute()
+
         if not response.data:
             return jsonify({"gain": 0})
 
-        db_data = response.data
-        
-        # 2. VÉRIFIER le last_claim immédiatement
-        if db_data.get("last_claim") == 1:
-            return jsonify({"status": "success", "gain": 0, "msg": "Déjà réclamé"})
+        db_data = response.data[0]
 
-        # 3. CALCULER le temps AVANT de faire un update
-        last_hl = db_data.get("gain_HL")
-        if not last_hl:
+        # 2. Réclamation refusée : déjà réclamé, ou absence trop courte
+        if not db_data.get("claimed"):
+            if db_data.get("last_claim") == 1:
+                return jsonify({"status": "success", "gain": 0, "msg": "Déjà réclamé"})
             return jsonify({"gain": 0})
 
-        # Conversion des dates
-        start_time = datetime.fromisoformat(last_hl.replace('Z', '+00:00'))
-        now_time = datetime.now(timezone.utc)
-        
-        seconds_absent = (now_time - start_time).total_seconds()
-
-        if seconds_absent < 10: # Trop court pour un gain
-            return jsonify({"gain": 0})
+        # 3. CALCUL DU GAIN à partir du revenu précalculé à la sauvegarde
+        start_time = datetime.fromisoformat(db_data["gain_HL"].replace('Z', '+00:00'))
+        seconds_absent = (datetime.now(timezone.utc) - start_time).total_seconds()
+        income_per_sec = float(db_data.get("income_per_sec") or 0)
 
-        # 4. CALCUL DU GAIN
-        save_json = db_data.get("save", {})
-        inventory = save_json.get("inventory", [])
-        
-        # Calcul du income_per_sec (assure-toi que la map correspond à tes IDs)
-        gain_map = {1:1, 2:3, 3:8, 4:20, 5:50, 6:120, 7:300, 8:800, 9:2000, 10:5000}
-        income_per_sec = sum(gain_map.get(item['id'], 0) for item in inventory if item and 'id' in item)
-        
         final_gain = round((seconds_absent * income_per_sec * 0.5), 1)
 
-        # 5. SEULEMENT MAINTENANT, on bloque le claim pour la suite
-        # On ne touche pas à 'save', donc le trigger ne changera pas gain_HL
-        supabase.table("Gun_Merge").update({"last_claim": 1}).eq("username", username).execute()
-
         return jsonify({
             "status": "success", 
             "gain": final_gain,
@@ -1113,20 +1993,37 @@ def get_HL_money():
         return jsonify({"status": "error", "gain": 0}), 500
 @app.route('/gun_merge_update_data', methods=['POST'])
 def gun_merge_update_data():
-    data = request.get_json(force=True)
+    body, code = save_gun_merge_data(request.get_json(force=True))
+    return jsonify(body), code
+
+
+def save_gun_merge_data(data):
+    """Validation + sauvegarde Gun Merge ; renvoie (réponse, code HTTP). Partagé avec /save_all.
+
+    Deux formes : {"username", "save"} (sauvegarde complète) ou
+    {"username", "version", "patch"} (différence contre la version renvoyée
+    par la sauvegarde ou le chargement précédent, voir gun_merge_saves.py).
+    """
     username = (data.get('username') or "").strip()
     save_data = data.get('save')
 
+    if username and save_data is None and data.get('patch') is not None:
+        return save_gun_merge_patch(username, data.get('version'), data.get('patch'))
+
     if not username or not save_data:
-        return jsonify({"status": "error", "message": "Données manquantes"}), 400
+        return {"status": "error", "message": "Données manquantes"}, 400
 
     try:
         # L'utilisation de l'upsert va déclencher le Trigger SQL
         # Le Trigger mettra à jour 'gain_HL' si 'save' a changé
+        version = new_save_version()
         payload = {
             "username": username,
             "save": save_data,
-            "last_claim": 0  # On remet à 0 car le joueur est présent
+            "last_claim": 0,  # On remet à 0 car le joueur est présent
+            # Calculé une fois ici plutôt qu'à chaque réclamation (get_HL_money)
+            "income_per_sec": gun_merge_income_per_sec(save_data),
+            "save_version": version
         }
 
         response = supabase.table("Gun_Merge")\
@@ -1134,64 +2031,242 @@ def gun_merge_update_data():
             .execute()
 
         if response.data:
-            return jsonify({
+            gun_merge_save_cache.put(username, version, save_data)
+            record_gun_merge_save("full", payload)
+            return {
                 "status": "success",
-                "message": "Sauvegarde réussie et claim réarmé"
-            }), 200
+                "message": "Sauvegarde réussie et claim réarmé",
+                "version": version
+            }, 200
         else:
-            return jsonify({"status": "error", "message": "Échec insertion"}), 500
+            return {"status": "error", "message": "Échec insertion"}, 500
 
     except Exception as e:
         print(f"[SAVE ERROR] {e}")
-        return jsonify({"status": "error", "message": str(e)}), 500
+        return {"status": "error", "message": str(e)}, 500
+
+
+def save_gun_merge_patch(username, version, patch):
+    """Sauvegarde par différence : patch appliqué à la sauvegarde `version`.
+
+    Seuls les champs de premier niveau modifiés sont envoyés à la base
+    (RPC patch_gun_merge_save, conditionnée par la version). Si la version
+    n'est plus la version courante, on répond 409 avec la version en base :
+    le client renvoie alors sa sauvegarde complète.
+    """
+    if not version:
+        return {"status": "error", "message": "Version manquante"}, 400
+
+    try:
+        current = gun_merge_save_cache.get(username, version)
+        if current is None:
+            # Pas en cache (autre worker, redémarrage) : une lecture de la sauvegarde
+            response = supabase.table("Gun_Merge")\
+                .select("save, save_version")\
+                .eq("username", username)\
+                .limit(1)\
+                .execute()
+            row = response.data[0] if response.data else None
+            if row is None or row.get("save_version") != version:
+                record_gun_merge_save("conflict")
+                return gun_merge_version_conflict(username, row.get("save_version") if row else None)
+            current = row["save"] or {}
+
+        try:
+            new_save = apply_patch(current, patch)
+        except ValueError as e:
+            return {"status": "error", "message": f"Patch invalide : {e}"}, 400
+        if not isinstance(new_save, dict):
+            return {"status": "error", "message": "Patch invalide : la sauvegarde doit rester un objet"}, 400
+
+        changes, removed = top_level_changes(current, new_save)
+        params = {
+            "p_username": username,
+            "base_version": version,
+            "new_version": new_save_version(),
+            "changes": changes,
+            "removed": removed,
+            # Revenu passif recalculé seulement si l'inventaire a changé
+            "income": gun_merge_income_per_sec(new_save) if "inventory" in changes or "inventory" in removed else None
+        }
+        new_version = supabase.rpc("patch_gun_merge_save", params).execute().data
+        if not new_version:
+            record_gun_merge_save("conflict")
+            return gun_merge_version_conflict(username, None)
+
+        gun_merge_save_cache.put(username, new_version, new_save)
+        record_gun_merge_save("patch", params)
+        return {
+            "status": "success",
+            "message": "Sauvegarde réussie et claim réarmé",
+            "version": new_version
+        }, 200
+
+    except Exception as e:
+        print(f"[SAVE PATCH ERROR] {e}")
+        return {"status": "error", "message": str(e)}, 500
+
+
+def gun_merge_version_conflict(username, current_version):
+    gun_merge_save_cache.discard(username)
+    return {
+        "status": "conflict",
+        "message": "Version de sauvegarde périmée : renvoyer la sauvegarde complète",
+        "version": current_version
+    }, 409
+
+
+def record_gun_merge_save(mode, written=None):
+    """Compte les sauvegardes Gun Merge par forme et les octets envoyés à la base."""
+    if not METRICS_ENABLED:
+        return
+    app_metrics.inc("gun_merge_saves_total", (("mode", mode),))
+    if written is not None:
+        app_metrics.inc("gun_merge_save_bytes_total", (("mode", mode),), len(json.dumps(written)))
+
+
+app_metrics.describe("gun_merge_saves_total", "counter", "Sauvegardes Gun Merge par forme (full, patch, conflict).")
+app_metrics.describe("gun_merge_save_bytes_total", "counter", "Octets JSON envoyés à la base par les sauvegardes Gun Merge.")
+gun_merge_save_cache = SaveCache(GUN_MERGE_SAVE_CACHE_SIZE)
+
+
 @app.route('/gun_merge_get_data', methods=['POST'])
 def gun_merge_get_data():
+    body, code = load_gun_merge_data(request.get_json(force=True))
+    return jsonify(body), code
 
-    data = request.get_json(force=True)
+
+def load_gun_merge_data(data):
+    """Lecture Gun Merge ; renvoie (réponse, code HTTP). Partagé avec /profile."""
     username = (data.get('username') or "").strip()
 
     if not username:
-        return jsonify({"status": "error", "message": "Username manquant"}), 400
+        return {"status": "error", "message": "Username manquant"}, 400
 
     try:
-
-        response = supabase.table("Gun_Merge")\
-            .select("save")\
-            .eq("username", username)\
-            .limit(1)\
-            .execute()
-
         # Si aucun save → créer ligne automatiquement
-        if not response.data:
+        row, _ = load_or_create(supabase, "Gun_Merge", GUN_MERGE_LOAD_COLUMNS, username, gun_merge_new_row)
+        return gun_merge_load_body(username, row, gun_merge_save_cache)
 
-            default_save = {
-                "xp": 0,
-                "money": 1,
-                "buyPrice": 1,
-                "inventory": [None, None, None, None, None],
-                "currentLevel": 1
-            }
+    except Exception as e:
+        print(f"[LOAD GUN MERGE ERROR] {e}")
+        return {"status": "error", "message": str(e)}, 500
 
-            supabase.table("Gun_Merge").insert({
-                "username": username,
-                "save": default_save
-            }).execute()
 
-            return jsonify({
-                "status": "success",
-                "data": default_save
-            }), 200
+#------------------------------------------ Sauvegarde groupée -------------------------------
+# Accès base de /save_all et /profile exécutés en parallèle sur un pool borné
+# (partagé par toutes les requêtes du worker)
+FANOUT_THREADS = int(os.environ.get("FANOUT_THREADS", 8))
+fanout_executor = ThreadPoolExecutor(max_workers=FANOUT_THREADS, thread_name_prefix="fanout")
 
+GAME_SAVERS = {
+    "skull_arena": save_skull_arena_data,
+    "astro_dodge": save_astro_dodge_data,
+    "stickman_runner": save_stickman_runner_data,
+    "casino": save_casino_data,
+    "gun_merge": save_gun_merge_data,
+}
 
-        return jsonify({
-            "status": "success",
-            "data": response.data[0]["save"]
-        }), 200
 
+@app.route('/save_all', methods=['POST'])
+def save_all():
+    """Sauvegarde plusieurs jeux en une requête.
+    Corps : {"username": "...", "games": {"skull_arena": {...}, "casino": {...}, ...}}
+    Chaque entrée a le même format que la route *_update_data du jeu ; le résultat est rendu par jeu.
+    """
+    data = request.get_json(force=True) or {}
+    username = (data.get('username') or "").strip()
+    games = data.get('games')
+
+    if not username:
+        return jsonify({"status": "error", "message": "Username manquant"}), 400
+    if not isinstance(games, dict) or not games:
+        return jsonify({"status": "error", "message": "Aucun jeu à sauvegarder"}), 400
+
+    results = {}
+    futures = {}
+    for game, payload in games.items():
+        saver = GAME_SAVERS.get(game)
+        if saver is None:
+            results[game] = {"status": "error", "message": "Jeu inconnu", "code": 400}
+            continue
+        if not isinstance(payload, dict):
+            results[game] = {"status": "error", "message": "Données invalides", "code": 400}
+            continue
+        payload = dict(payload, username=username)
+        # Le contexte de requête suit la tâche (métriques attribuées à /save_all)
+        futures[game] = fanout_executor.submit(copy_current_request_context(saver), payload)
+
+    for game, future in futures.items():
+        try:
+            body, code = future.result()
+        except Exception as e:
+            print(f"[SAVE ALL ERROR] {game}: {e}")
+            body, code = {"status": "error", "message": str(e)}, 500
+        results[game] = dict(body, code=code)
+
+    failed = [game for game, result in results.items() if result["code"] >= 400]
+    if not failed:
+        status = "success"
+    elif len(failed) < len(results):
+        status = "partial"
+    else:
+        status = "error"
+    return jsonify({"status": status, "results": results}), 200 if not failed else 207
+
+
+#------------------------------------------ Profil complet -------------------------------
+def load_fdpiece_sections(data):
+    """Une seule lecture de FDPiece pour les sections get_time_FDPrice, get_evo_pass et get_sub.
+    Comme get_time_FDPrice, la ligne est créée si elle n'existe pas.
+    """
+    username = (data.get('username') or "").strip()
+    try:
+        row, created = load_or_create(supabase, "FDPiece", FDPIECE_LOAD_COLUMNS, username, fdpiece_new_row)
+        return fdpiece_sections_body(row, created)
 
     except Exception as e:
-        print(f"[LOAD GUN MERGE ERROR] {e}")
-        return jsonify({"status": "error", "message": str(e)}), 500
+        print(f"[PROFILE FDPiece ERROR] {e}")
+        error = ({"status": "error", "message": str(e)}, 500)
+        return {"time_fdprice": error, "evo_pass": error, "sub": error}
+
+
+PROFILE_LOADERS = {
+    "skull_arena": load_skull_arena_data,
+    "astro_dodge": load_astro_dodge_data,
+    "stickman_runner": load_stickman_runner_data,
+    "casino": load_casino_data,
+    "gun_merge": load_gun_merge_data,
+}
+
+
+@app.route('/profile/<username>', methods=['GET'])
+def profile(username):
+    """Charge tout le profil d'un joueur en une requête (lectures des tables en parallèle).
+    Chaque section a la forme de la réponse de la route d'origine (y compris les valeurs
+    par défaut "not_found"), avec son code HTTP dans "code".
+    """
+    username = (username or "").strip()
+    if not username:
+        return jsonify({"status": "error", "message": "Username manquant"}), 400
+
+    data = {"username": username}
+    futures = {
+        section: fanout_executor.submit(copy_current_request_context(loader), data)
+        for section, loader in PROFILE_LOADERS.items()
+    }
+    fdpiece_future = fanout_executor.submit(copy_current_request_context(load_fdpiece_sections), data)
+    ban_future = fanout_executor.submit(copy_current_request_context(load_ban_status), username)
+
+    sections = {section: future.result() for section, future in futures.items()}
+    sections.update(fdpiece_future.result())
+    sections["ban"] = ban_future.result()
+
+    return jsonify({
+        "status": "success",
+        "username": username,
+        "data": {section: dict(body, code=code) for section, (body, code) in sections.items()}
+    }), 200
 
 
 #-----------------------------------
@@ -1199,106 +2274,246 @@ def gun_merge_get_data():
 #-----------------------------------
 
 
+PLAYER_STATUS_ONLINE = "🟢 online"
+ADMIN_ORIGIN = "https://clickerbutmultiplayer.xo.je"
+
+
+def encode_players_cursor(phase, last_seen, player_id):
+    raw = json.dumps([phase, last_seen, player_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_players_cursor(cursor):
+    """(phase, (last_seen, ID)) du dernier joueur renvoyé ; ValueError si le curseur est invalide."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        phase, last_seen, player_id = json.loads(raw)
+    except Exception:
+        raise ValueError("Curseur invalide")
+    if phase not in ("online", "offline") or not isinstance(player_id, str):
+        raise ValueError("Curseur invalide")
+    return phase, (last_seen, player_id)
+
+
+def postgrest_value(value):
+    """Valeur entre guillemets pour un filtre or_ (les virgules, points et parenthèses y sont réservés)."""
+    return '"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def fetch_players_by_last_seen(after, limit):
+    """Une page de la table Player triée par la base.
+
+    Ordre : last_seen décroissant (NULL en dernier) puis ID, ce qui rend la clé
+    (last_seen, ID) unique : la page suivante reprend strictement après `after`
+    (pagination par clé, sans OFFSET), servie par l'index (last_seen, ID).
+    """
+    query = supabase.table(TABLE_NAME_Player).select("ID, last_seen")
+    if after is not None:
+        last_seen, player_id = after
+        player_id = postgrest_value(player_id)
+        if last_seen is None:
+            query = query.or_(f"and(last_seen.is.null,ID.gt.{player_id})")
+        else:
+            seen = postgrest_value(last_seen)
+            query = query.or_(f"last_seen.lt.{seen},last_seen.is.null,and(last_seen.eq.{seen},ID.gt.{player_id})")
+
+    return query.order("last_seen", desc=True, nullsfirst=False).order("ID").limit(limit).execute().data
+
+
+def load_players_status_page(cursor, limit):
+    """Jusqu'à `limit` joueurs après `cursor` : en ligne d'abord, puis hors ligne.
+
+    Les joueurs en ligne viennent du registre de présence (mémoire) ; les
+    autres de la table Player, en sautant ceux que le registre voit en ligne.
+    Renvoie (joueurs, curseur suivant) ; le curseur est None une fois la liste épuisée.
+    """
+    phase, after = decode_players_cursor(cursor) if cursor else ("online", None)
+    players = []
+
+    if phase == "online":
+        players = [{"id": player_id, "status": PLAYER_STATUS_ONLINE, "last_seen": last_seen}
+                   for player_id, last_seen in presence_registry.online(after, limit)]
+        if len(players) >= limit:
+            last = players[-1]
+            return players, encode_players_cursor("online", last["last_seen"], last["id"])
+        phase, after = "offline", None
+
+    online_ids = presence_registry.online_ids()
+    while len(players) < limit:
+        wanted = limit - len(players)
+        rows = fetch_players_by_last_seen(after, wanted)
+        for row in rows:
+            after = (row.get("last_seen"), row.get("ID"))
+            if row.get("ID") in online_ids:
+                continue
+            players.append({"id": row.get("ID"), "status": "🔴 offline", "last_seen": row.get("last_seen")})
+        if len(rows) < wanted:
+            return players, None
+    return players, encode_players_cursor("offline", after[0], after[1])
+
+
+def stream_players_status(cursor):
+    """Liste complète encodée au fil des pages (mémoire bornée à une page).
+
+    "status" est écrit en dernier : une erreur en cours de flux est signalée
+    dans le document lui-même, le code HTTP 200 étant déjà parti.
+    """
+    count = 0
+    yield '{"data":['
+    try:
+        while True:
+            players, cursor = load_players_status_page(cursor, PLAYERS_STATUS_MAX_PAGE_SIZE)
+            for player in players:
+                yield ("," if count else "") + json.dumps(player, ensure_ascii=False)
+                count += 1
+            if cursor is None:
+                break
+    except Exception as e:
+        print(f"[GET ALL PLAYERS ERROR] {e}")
+        yield "]," + json.dumps({"count": count, "status": "error", "message": str(e)}, ensure_ascii=False)[1:]
+        return
+    yield "]," + json.dumps({
+        "count": count,
+        "status": "success",
+        "message": f"Liste de {count} joueurs récupérée."
+    }, ensure_ascii=False)[1:]
+
+
 @app.route('/get_all_players_status', methods=['GET', 'OPTIONS'])
 def get_all_players_status():
     """
-    Récupère tous les joueurs et les trie :
-    1. Tous les joueurs "🟢 online".
-    2. Tous les joueurs "🔴 offline", triés par 'last_seen' du plus récent au plus ancien.
+    Liste paginée des joueurs :
+    1. Les joueurs "🟢 online" (registre de présence en mémoire), puis
+    2. les joueurs "🔴 offline" (table Player, triée par la base) ;
+    chaque groupe par 'last_seen' du plus récent au plus ancien.
+
+    Paramètres : limit (taille de page, PLAYERS_STATUS_PAGE_SIZE par défaut),
+    cursor (valeur "next_cursor" de la page précédente), stream=true pour
+    recevoir toute la liste en une réponse encodée au fil de l'eau.
     """
     if request.method == "OPTIONS":
         return build_cors_preflight_response()
 
+    cursor = request.args.get("cursor") or None
     try:
-        # 1. Récupérer tous les joueurs avec les colonnes nécessaires
-        # Colonnes de la table Player : ID, Status, last_seen
-        response = supabase.table(TABLE_NAME_Player).select("ID, Status, last_seen").execute()
-        all_players = response.data
-
-        online_players = []
-        offline_players = []
-
-        # 2. Séparer les joueurs en ligne et hors ligne
-        for player in all_players:
-            player_data = {
-                "id": player.get("ID"),
-                "status": player.get("Status", "🔴 offline"),
-                "last_seen": player.get("last_seen")
-            }
-            if player_data["status"] == "🟢 online":
-                online_players.append(player_data)
-            else:
-                offline_players.append(player_data)
-
-        # 3. Trier les joueurs hors ligne par 'last_seen' (du plus récent au plus ancien)
-        # Convertit la chaîne last_seen en objet datetime pour un tri correct, gère les None
-        def sort_key(player):
-            last_seen_str = player.get("last_seen")
-            if last_seen_str:
-                try:
-                    # Assurez-vous que le format est correct (Supabase utilise l'ISO 8601)
-                    return datetime.fromisoformat(last_seen_str.replace('Z', '+00:00'))
-                except ValueError:
-                    return datetime.min.replace(tzinfo=timezone.utc) # Date très ancienne pour les erreurs
-            return datetime.min.replace(tzinfo=timezone.utc) # Date très ancienne pour les joueurs sans last_seen
-
-        # Tri inverse (descendant) pour le plus récent d'abord
-        offline_players.sort(key=sort_key, reverse=True)
-
-        # 4. Combiner la liste (Online d'abord, puis Offline triés)
-        final_list = online_players + offline_players
-
-        # 5. Renvoyer la liste
+        limit = int(request.args.get("limit", PLAYERS_STATUS_PAGE_SIZE))
+        if cursor:
+            decode_players_cursor(cursor)
+    except ValueError as e:
+        response = jsonify({"status": "error", "message": str(e)})
+        response.headers.add("Access-Control-Allow-Origin", ADMIN_ORIGIN)
+        return response, 400
+    limit = max(1, min(limit, PLAYERS_STATUS_MAX_PAGE_SIZE))
+
+    if request.args.get("stream") == "true":
+        response = Response(stream_with_context(stream_players_status(cursor)), mimetype="application/json")
+        response.headers.add("Access-Control-Allow-Origin", ADMIN_ORIGIN)
+        return response, 200
+
+    try:
+        players, next_cursor = load_players_status_page(cursor, limit)
         response = jsonify({
             "status": "success",
-            "message": f"Liste de {len(final_list)} joueurs récupérée.",
-            "data": final_list
+            "message": f"Liste de {len(players)} joueurs récupérée.",
+            "data": players,
+            "next_cursor": next_cursor
         })
         # Ajout des headers CORS dans le handler OPTIONS, mais aussi ici pour le GET
-        response.headers.add("Access-Control-Allow-Origin", "https://clickerbutmultiplayer.xo.je")
+        response.headers.add("Access-Control-Allow-Origin", ADMIN_ORIGIN)
         return response, 200
 
     except Exception as e:
         print(f"[GET ALL PLAYERS ERROR] {e}")
         response = jsonify({"status": "error", "message": str(e)})
-        response.headers.add("Access-Control-Allow-Origin", "https://clickerbutmultiplayer.xo.je")
+        response.headers.add("Access-Control-Allow-Origin", ADMIN_ORIGIN)
         return response, 500
 
 #recuperer le counter du nombre de chaque jeux
 
+# Les lancements de jeux sont comptés en mémoire et écrits toutes les
+# PLAY_COUNT_FLUSH_INTERVAL secondes par un incrément atomique (RPC increment_play_count,
+# voir supabase_functions.sql)
+PLAY_COUNT_FLUSH_INTERVAL = float(os.environ.get("PLAY_COUNT_FLUSH_INTERVAL", 5))
+
+
+def increment_play_count(game_name, amount):
+    response = supabase.rpc("increment_play_count", {"game_name": game_name, "amount": amount}).execute()
+    return response.data
+
+
+def load_play_counts():
+    response = supabase.table("Play_Count").select("name, counter").execute()
+    return response.data or []
+
+
+play_counters = PlayCounters(increment_play_count, load_play_counts)
+background.register("play_count_flush", PLAY_COUNT_FLUSH_INTERVAL, play_counters.flush)
+atexit.register(play_counters.flush)
+
+
+@app.route('/online_players', methods=['GET', 'OPTIONS'])
+def online_players():
+    """Joueurs en ligne, servis par le registre de présence (aucune lecture de Player)."""
+    if request.method == "OPTIONS":
+        return build_cors_preflight_response()
+
+    players = [{"id": player_id, "last_seen": last_seen} for player_id, last_seen in presence_registry.online()]
+    return jsonify({"status": "success", "count": len(players), "data": players}), 200
+
+
+@app.route('/is_online/<player_id>', methods=['GET', 'OPTIONS'])
+def is_online(player_id):
+    if request.method == "OPTIONS":
+        return build_cors_preflight_response()
+
+    last_seen = presence_registry.last_seen(player_id)
+    return jsonify({
+        "status": "success",
+        "id": player_id,
+        "online": last_seen is not None,
+        "last_seen": datetime.fromtimestamp(last_seen, timezone.utc).isoformat() if last_seen is not None else None
+    }), 200
+
+
 @app.route('/get_play_counter', methods=['GET'])
 def get_play_counter():
     """
     Récupère le nom et le nombre de parties pour chaque jeu.
     Table : Play_Count, Colonnes : name, counter
+    Les incréments pas encore écrits en base sont ajoutés aux valeurs lues.
     """
+    return snapshot_response(("play_counter",), play_counter_body)
+
+
+def play_counter_body():
+    """Réponse de get_play_counter (réponse, code HTTP), servie en instantané."""
     try:
-        # Récupération des données depuis Supabase
+        # Récupération des données depuis Supabase (+ incréments en attente)
         # On sélectionne uniquement les colonnes nécessaires : 'name' et 'counter'
-        response = supabase.table("Play_Count").select("name, counter").execute()
+        rows = play_counters.read()
 
-        if not response.data:
-            return jsonify({
+        if not rows:
+            return {
                 "status": "success", 
                 "message": "Aucune donnée trouvée.", 
                 "data": []
-            }), 200
+            }, 200
 
         # Renvoie les données au format JSON
         # Format : [{"name": "jeu1", "counter": 10}, {"name": "jeu2", "counter": 50}]
-        return jsonify({
+        return {
             "status": "success",
-            "data": response.data
-        }), 200
+            "data": rows
+        }, 200
 
     except Exception as e:
         print(f"[ERROR Get_Play_Counter] {e}")
-        return jsonify({"status": "error", "message": str(e)}), 500
+        return {"status": "error", "message": str(e)}, 500
 
 @app.route('/add1to_count', methods=['GET'])
 def add1to_count():
     """
-    Incrémente le compteur d'un jeu de +1.
+    Incrémente le compteur d'un jeu de +1 (en mémoire, écrit en base par lots).
     Usage : /add1to_count?name=Skull Arena
     """
     game_name = request.args.get('name')
@@ -1307,23 +2522,18 @@ def add1to_count():
         return jsonify({"status": "error", "message": "Le paramètre 'name' est requis."}), 400
 
     try:
-        # 1. On récupère la valeur actuelle du compteur pour ce jeu
-        response = supabase.table("Play_Count").select("counter").eq("name", game_name).execute()
-
-        if response.data and len(response.data) > 0:
-            current_count = response.data[0]['counter'] or 0
-            new_count = current_count + 1
+        # 1. Le jeu doit exister dans Play_Count (lu en base seulement s'il est inconnu)
+        if play_counters.value(game_name) is None:
+            return jsonify({"status": "error", "message": f"Jeu '{game_name}' non trouvé dans la table."}), 404
 
-            # 2. On met à jour avec la nouvelle valeur
-            supabase.table("Play_Count").update({"counter": new_count}).eq("name", game_name).execute()
+        # 2. Incrément en mémoire, sans aller-retour base
+        play_counters.increment(game_name)
 
-            return jsonify({
-                "status": "success",
-                "game": game_name,
-                "new_counter": new_count
-            }), 200
-        else:
-            return jsonify({"status": "error", "message": f"Jeu '{game_name}' non trouvé dans la table."}), 404
+        return jsonify({
+            "status": "success",
+            "game": game_name,
+            "new_counter": play_counters.value(game_name)
+        }), 200
 
     except Exception as e:
         print(f"[ERROR add1to_count] {e}")
@@ -1334,6 +2544,11 @@ def add1to_count():
 @app.route('/get_latest_version', methods=['GET'])
 def get_latest_version():
     """Récupère la dernière mise à jour (version, title, description)"""
+    return snapshot_response(("latest_version",), latest_version_body)
+
+
+def latest_version_body():
+    """Réponse de get_latest_version (réponse, code HTTP), servie en instantané."""
     try:
         # On trie par Version descendante et on limite à 1 pour avoir la plus récente
         response = supabase.table("Last_Maj") \
@@ -1343,16 +2558,16 @@ def get_latest_version():
             .execute()
 
         if response.data:
-            return jsonify({
+            return {
                 "status": "success",
                 "data": response.data[0]
-            }), 200
+            }, 200
         else:
-            return jsonify({"status": "error", "message": "Aucune mise à jour trouvée"}), 404
+            return {"status": "error", "message": "Aucune mise à jour trouvée"}, 404
             
     except Exception as e:
         print(f"[ERROR get_latest_version] {e}")
-        return jsonify({"status": "error", "message": str(e)}), 500
+        return {"status": "error", "message": str(e)}, 500
 
 @app.route('/add_version', methods=['GET'])
 def add_version():
@@ -1373,6 +2588,9 @@ def add_version():
         
         # Insertion dans la table Supabase [cite: 186, 243]
         response = supabase.table("Last_Maj").insert(payload).execute()
+        # Les autres workers la verront à l'expiration de leur instantané
+        snapshot_cache.invalidate("latest_version")
+        snapshot_cache.invalidate("all_versions")
         
         return jsonify({
             "status": "success", 
@@ -1388,27 +2606,32 @@ def add_version():
 @app.route('/get_all_versions', methods=['GET'])
 def get_all_versions():
     """Récupère toutes les lignes de la table Last_Maj, triées par version."""
+    return snapshot_response(("all_versions",), all_versions_body)
+
+
+def all_versions_body():
+    """Réponse de get_all_versions (réponse, code HTTP), servie en instantané."""
     try:
         # On sélectionne toutes les colonnes et on trie par Version (la plus récente en premier)
         # On utilise le nom exact de la table "Last_Maj" tel que défini dans votre schéma [cite: 116]
         response = supabase.table("Last_Maj").select("*").order("Version", desc=True).execute()
 
         if not response.data:
-            return jsonify({
+            return {
                 "status": "success", 
                 "message": "Aucune mise à jour enregistrée.", 
                 "data": []
-            }), 200
+            }, 200
 
         # Renvoie les données au format JSON, similaire à la gestion des compteurs [cite: 118]
-        return jsonify({
+        return {
             "status": "success",
             "data": response.data
-        }), 200
+        }, 200
 
     except Exception as e:
         print(f"[ERROR get_all_versions] {e}")
-        return jsonify({"status": "error", "message": str(e)}), 500
+        return {"status": "error", "message": str(e)}, 500
 
 #--------------- gestion sanctions ---------------------
 @app.route('/do_ban', methods=['POST'])
@@ -1489,6 +2712,12 @@ def get_ban():
     if not player_id:
         return jsonify({"status": "error", "message": "Le paramètre 'id' est requis."}), 400
 
+    body, code = load_ban_status(player_id)
+    return jsonify(body), code
+
+
+def load_ban_status(player_id):
+    """Lecture de la sanction du joueur ; renvoie (réponse, code HTTP). Partagé avec /profile."""
     try:
         # On cherche le joueur par son ID [cite: 8, 12]
         response = supabase.table(TABLE_NAME_Player) \
@@ -1496,23 +2725,27 @@ def get_ban():
             .eq("ID", player_id) \
             .single() \
             .execute()
+        return ban_status_body(player_id, response.data)
 
-        if not response.data:
-            return jsonify({"status": "error", "message": "Joueur non trouvé."}), 404
+    except Exception as e:
+        print(f"[GET BAN ERROR] {e}")
+        return {"status": "error", "message": str(e)}, 500
 
-        sanction = response.data.get("Sanction")
-        is_banned = (sanction == "ban")
 
-        return jsonify({
-            "status": "success",
-            "player_id": player_id,
-            "is_banned": is_banned,
-            "sanction_detail": sanction
-        }), 200
+def ban_status_body(player_id, row):
+    """Réponse de get_ban pour la ligne lue. Partagé avec asgi.py."""
+    if not row:
+        return {"status": "error", "message": "Joueur non trouvé."}, 404
 
-    except Exception as e:
-        print(f"[GET BAN ERROR] {e}")
-        return jsonify({"status": "error", "message": str(e)}), 500
+    sanction = row.get("Sanction")
+    is_banned = (sanction == "ban")
+
+    return {
+        "status": "success",
+        "player_id": player_id,
+        "is_banned": is_banned,
+        "sanction_detail": sanction
+    }, 200
 #-------------------------------------- CCCCCAAAAAAASSSSSSIIIIINNNNOOOOOOOO -----------------------
 
 
@@ -1886,14 +3119,88 @@ def stripe_webhook():
     return "Unhandled event type", 200
 
 
+# ----------------------------------------------------------------------
+# --- MÉTRIQUES PROMETHEUS ---
+# ----------------------------------------------------------------------
+metrics_store = WorkerMetricsStore(app_metrics, METRICS_DIR)
+
+
+PRESENCE_BUFFER_GAUGES = {
+    "heartbeats": "Battements de présence reçus depuis le démarrage des workers.",
+    "coalesced": "Battements fusionnés avec un battement du même joueur encore en attente.",
+    "flushed_rows": "Lignes Player écrites par le tampon de présence.",
+    "flush_batches": "Lots d'écriture de présence envoyés.",
+    "flush_errors": "Lots d'écriture de présence en erreur.",
+}
+
+
+def component_gauges():
+    """Jauges des composants en mémoire (évaluées à chaque export, additionnées entre workers)."""
+    samples = [
+        ("presence_pending_heartbeats", (), presence_buffer.pending_count()),
+        ("presence_registry_online", (), presence_registry.count()),
+        ("chess_sessions_cached", (), chess_sessions.stats()["size"]),
+        ("game_events_waiters", (), game_event_hub.stats()["waiters"]),
+    ]
+    # Profondeur de file lue en base : exportée par le seul worker qui la compte
+    depth = matchmaker.depth()
+    if depth is not None:
+        samples.append(("matchmaking_queue_depth", (), depth))
+    # Compteurs du tampon de présence (battements reçus, fusionnés, écrits) de ce worker
+    presence_stats = presence_buffer.stats()
+    for key in PRESENCE_BUFFER_GAUGES:
+        samples.append((f"presence_buffer_{key}", (), presence_stats[key]))
+    for game_uuid, count in spectator_feed.viewers().items():
+        samples.append(("chess_spectators", (("game_uuid", game_uuid),), count))
+    for name, value in play_counters.pending().items():
+        samples.append(("play_count_pending", (("game", name),), value))
+    return samples
+
+
+app_metrics.describe("presence_pending_heartbeats", "gauge", "Battements de présence en attente d'écriture.")
+app_metrics.describe("presence_registry_online", "gauge", "Joueurs en ligne vus par le registre de chaque worker (somme).")
+for _key, _help in PRESENCE_BUFFER_GAUGES.items():
+    app_metrics.describe(f"presence_buffer_{_key}", "gauge", _help)
+app_metrics.describe("chess_sessions_cached", "gauge", "Parties d'échecs en cache.")
+app_metrics.describe("matchmaking_queue_depth", "gauge", "Joueurs en attente d'adversaire (toute la base).")
+app_metrics.describe("game_events_waiters", "gauge", "Clients en attente sur /game_events.")
+app_metrics.describe("chess_spectators", "gauge", "Spectateurs connectés à /spectate, par partie (seules les parties regardées).")
+app_metrics.describe("play_count_pending", "gauge", "Incréments Play_Count pas encore écrits.")
+app_metrics.register_collector(component_gauges)
+
+if METRICS_ENABLED:
+    background.register("metrics_dump", METRICS_DUMP_INTERVAL, metrics_store.dump)
+
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    """Métriques de tous les workers (format texte Prometheus)."""
+    try:
+        body = metrics_store.render()
+    except Exception as e:
+        print(f"[METRICS ERROR] {e}")
+        return jsonify({"error": str(e)}), 500
+    return Response(body, content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+# ----------------------------------------------------------------------
+# --- TÂCHES D'ARRIÈRE-PLAN (une instance par worker gunicorn) ---
+# ----------------------------------------------------------------------
+# BACKGROUND_TASKS=0 permet de les désactiver (tests, benchmarks)
+if os.environ.get("BACKGROUND_TASKS", "1") != "0":
+    # Chargement initial des classements (sinon chargés à la première lecture)
+    for _index in (skull_arena_leaderboard, astro_dodge_leaderboard, stickman_runner_leaderboard):
+        try:
+            _index.reconcile()
+        except Exception as e:
+            print(f"[LEADERBOARD SEED ERROR] {e}")
+    game_event_channel.start()
+    background.start_all()
+
 # ----------------------------------------------------------------------
 # --- DÉMARRAGE DU SERVEUR ---
 # ----------------------------------------------------------------------
 if __name__ == "__main__":
-    # Démarre le thread de vérification d'activité en arrière-plan
-    activity_thread = threading.Thread(target=check_player_activity, daemon=True)
-    activity_thread.start()
-    
     port = int(os.environ.get("PORT", 5000))
     # '0.0.0.0' est utilisé pour écouter toutes les interfaces publiques
     app.run(host='0.0.0.0', port=port)
@@ -0,0 +1,301 @@
+"""
+Mode de service ASGI pour les routes limitées par les allers-retours base.
+
+    uvicorn asgi:application --host 0.0.0.0 --port $PORT
+
+Les lectures appelées au démarrage d'un client (chargements des jeux,
+get_ban, /profile) sont servies par des vues asynchrones avec le client de
+stockage asynchrone (storage.create_async_storage) : pendant un appel
+Supabase, le worker continue de servir les autres requêtes au lieu de bloquer
+un thread. Un worker garde ainsi des centaines de requêtes en vol.
+
+Toutes les autres routes passent par l'application Flask (mêmes URL, mêmes
+réponses), exécutée sur un pool de ASGI_WSGI_THREADS threads. Les vues
+asynchrones construisent leurs réponses avec les mêmes fonctions que les
+routes Flask (*_load_body, ban_status_body, profile_loads.py) et
+enregistrent la présence et les métriques de la même façon.
+"""
+import asyncio
+import json
+import os
+import time
+from urllib.parse import parse_qs
+
+from a2wsgi import WSGIMiddleware
+
+import app as server
+import storage
+from metrics import InstrumentedClient, route_label
+from profile_loads import (
+    FDPIECE_LOAD_COLUMNS, GUN_MERGE_LOAD_COLUMNS, fdpiece_new_row, fdpiece_sections_body,
+    gun_merge_load_body, gun_merge_new_row, load_or_create_async
+)
+
+ASGI_WSGI_THREADS = int(os.environ.get("ASGI_WSGI_THREADS", 32))
+
+flask_application = WSGIMiddleware(server.app, workers=ASGI_WSGI_THREADS)
+
+CORS_HEADERS = [
+    (b"access-control-allow-origin", b"*"),
+    (b"access-control-allow-methods", b"GET, POST, OPTIONS"),
+    (b"access-control-allow-headers", b"Content-Type, Authorization"),
+]
+
+_db = None
+
+
+async def get_db():
+    """Client de stockage asynchrone (créé au démarrage, ou à la première requête)."""
+    global _db
+    if _db is None:
+        client = await storage.create_async_storage(server.storage_client)
+        _db = InstrumentedClient(client, server.app_metrics) if server.METRICS_ENABLED else client
+    return _db
+
+
+class AsyncRequest:
+    def __init__(self, scope, body):
+        self.method = scope["method"]
+        self.path = scope["path"]
+        self.args = {key: values[0] for key, values in parse_qs(scope["query_string"].decode("latin1")).items()}
+        self.headers = {name.decode("latin1").lower(): value.decode("latin1") for name, value in scope["headers"]}
+        self.body = body
+
+    def get_json(self):
+        try:
+            return json.loads(self.body) if self.body else None
+        except ValueError:
+            return None
+
+
+def record_heartbeat(request, data):
+    """Même règle que update_last_seen (app.py) : battement en tampon, sans accès base.
+
+    `data` est le corps JSON déjà validé (dict, ou None hors POST).
+    """
+    player_id = server.player_from_authorization(request.headers.get("authorization"))
+    if player_id:
+        server.record_presence(player_id)
+        return
+    if request.path in server.ADMIN_ROUTES or request.args.get("admin") == "true":
+        return
+    if request.method == "POST":
+        player_id = (data.get("id") or data.get("player_id") or data.get("username")) if data else None
+    else:
+        player_id = request.args.get("id") or request.args.get("user") or request.args.get("username")
+    player_id = str(player_id or "").strip()
+    if player_id:
+        server.record_presence(player_id)
+
+
+# ----------------------------------------------------------------------
+# --- VUES ASYNCHRONES ---
+# ----------------------------------------------------------------------
+ROUTES = {}          # (méthode, chemin) -> vue
+PREFIX_ROUTES = []   # (méthode, préfixe, règle, vue) : un paramètre en fin de chemin
+
+
+def route(method, rule):
+    def decorator(func):
+        if "<" in rule:
+            PREFIX_ROUTES.append((method, rule[:rule.index("<")], rule, func))
+        else:
+            ROUTES[(method, rule)] = func
+        return func
+    return decorator
+
+
+async def fetch_first_row(table, columns, column, value):
+    db = await get_db()
+    response = await db.table(table).select(columns).eq(column, value).limit(1).execute()
+    return response.data[0] if response.data else None
+
+
+# Chargements de jeux : (table, colonnes, mise en forme, étiquette des logs)
+GAME_LOADS = {
+    "skull_arena": (server.TABLE_NAME_Skull_Arena, server.SKULL_ARENA_LOAD_COLUMNS,
+                    server.skull_arena_load_body, "LOAD SKULL ARENA"),
+    "astro_dodge": (server.TABLE_NAME_ASTRO_DODGE, server.ASTRO_DODGE_LOAD_COLUMNS,
+                    server.astro_dodge_load_body, "LOAD ASTRO DODGE"),
+    "stickman_runner": (server.TABLE_NAME_STICKMAN_RUNNER, server.STICKMAN_RUNNER_LOAD_COLUMNS,
+                        server.stickman_runner_load_body, "LOAD STICKMAN RUNNER"),
+    "casino": ("Casino", "money, success", server.casino_load_body, "LOAD Casino"),
+}
+
+
+async def load_game(game, username):
+    table, columns, body_func, tag = GAME_LOADS[game]
+    if not username:
+        return {"status": "error", "message": "Username manquant"}, 400
+    try:
+        return body_func(await fetch_first_row(table, columns, "username", username))
+    except Exception as e:
+        print(f"[{tag} ERROR] {e}")
+        return {"status": "error", "message": str(e)}, 500
+
+
+async def load_gun_merge(username):
+    if not username:
+        return {"status": "error", "message": "Username manquant"}, 400
+    try:
+        row, _ = await load_or_create_async(await get_db(), "Gun_Merge", GUN_MERGE_LOAD_COLUMNS, username,
+                                            gun_merge_new_row)
+        return gun_merge_load_body(username, row, server.gun_merge_save_cache)
+    except Exception as e:
+        print(f"[LOAD GUN MERGE ERROR] {e}")
+        return {"status": "error", "message": str(e)}, 500
+
+
+async def load_ban(player_id):
+    try:
+        db = await get_db()
+        response = await db.table(server.TABLE_NAME_Player) \
+            .select("ID, Sanction") \
+            .eq("ID", player_id) \
+            .single() \
+            .execute()
+        return server.ban_status_body(player_id, response.data)
+    except Exception as e:
+        print(f"[GET BAN ERROR] {e}")
+        return {"status": "error", "message": str(e)}, 500
+
+
+async def load_fdpiece(username):
+    try:
+        row, created = await load_or_create_async(await get_db(), "FDPiece", FDPIECE_LOAD_COLUMNS, username,
+                                                  fdpiece_new_row)
+        return fdpiece_sections_body(row, created)
+    except Exception as e:
+        print(f"[PROFILE FDPiece ERROR] {e}")
+        error = ({"status": "error", "message": str(e)}, 500)
+        return {"time_fdprice": error, "evo_pass": error, "sub": error}
+
+
+def game_load_view(game):
+    async def view(request):
+        data = request.get_json()
+        username = (data.get("username") or "").strip()
+        if game == "gun_merge":
+            return await load_gun_merge(username)
+        return await load_game(game, username)
+    return view
+
+
+for _game, _path in [("skull_arena", "/skull_arena_get_data"),
+                     ("astro_dodge", "/astro_dodge_get_data"),
+                     ("stickman_runner", "/stickman_runner_get_data"),
+                     ("casino", "/Casino_get_data"),
+                     ("gun_merge", "/gun_merge_get_data")]:
+    route("POST", _path)(game_load_view(_game))
+
+
+@route("GET", "/get_ban")
+async def get_ban(request):
+    player_id = request.args.get("id")
+    if not player_id:
+        return {"status": "error", "message": "Le paramètre 'id' est requis."}, 400
+    return await load_ban(player_id)
+
+
+@route("GET", "/profile/<username>")
+async def profile(request, username):
+    """Version asynchrone de /profile : les 7 lectures partent en même temps sur la boucle d'événements."""
+    username = username.strip()
+    if not username:
+        return {"status": "error", "message": "Username manquant"}, 400
+
+    games = list(GAME_LOADS)
+    results = await asyncio.gather(
+        *(load_game(game, username) for game in games),
+        load_gun_merge(username),
+        load_fdpiece(username),
+        load_ban(username),
+    )
+    sections = dict(zip(games, results))
+    sections["gun_merge"] = results[len(games)]
+    sections.update(results[len(games) + 1])
+    sections["ban"] = results[len(games) + 2]
+
+    return {
+        "status": "success",
+        "username": username,
+        "data": {section: dict(body, code=code) for section, (body, code) in sections.items()}
+    }, 200
+
+
+# ----------------------------------------------------------------------
+# --- APPLICATION ASGI ---
+# ----------------------------------------------------------------------
+def match(scope):
+    method, path = scope["method"], scope["path"]
+    view = ROUTES.get((method, path))
+    if view is not None:
+        return path, view, {}
+    for route_method, prefix, rule, view in PREFIX_ROUTES:
+        if method == route_method and path.startswith(prefix) and "/" not in path[len(prefix):]:
+            return rule, view, {rule[rule.index("<") + 1:-1]: path[len(prefix):]}
+    return None
+
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            try:
+                await get_db()
+            except Exception as e:
+                print(f"[ASGI STARTUP ERROR] {e}")
+                await send({"type": "lifespan.startup.failed", "message": str(e)})
+                return
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+
+    matched = match(scope) if scope["type"] == "http" else None
+    if matched is None:
+        await flask_application(scope, receive, send)
+        return
+
+    rule, view, params = matched
+    started = time.perf_counter()
+    token = route_label.set(rule)
+    try:
+        request = AsyncRequest(scope, await read_body(receive))
+        data = request.get_json()
+        if request.method == "POST" and not isinstance(data, dict):
+            # Corps absent, invalide ou non objet (liste...) : refusé avant tout traitement
+            body, code = {"status": "error", "message": "JSON invalide"}, 400
+        else:
+            record_heartbeat(request, data if isinstance(data, dict) else None)
+            body, code = await view(request, **params)
+    except Exception as e:
+        print(f"[ASGI ERROR] {rule}: {e}")
+        body, code = {"status": "error", "message": str(e)}, 500
+    finally:
+        route_label.reset(token)
+
+    payload = (server.app.json.dumps(body, separators=(",", ":")) + "\n").encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": code,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(payload)).encode())]
+        + CORS_HEADERS,
+    })
+    await send({"type": "http.response.body", "body": payload})
+    server.observe_request(rule, scope["method"], code, time.perf_counter() - started)
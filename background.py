@@ -0,0 +1,59 @@
+"""
+Tâches périodiques exécutées en arrière-plan (threads daemon).
+
+Chaque worker gunicorn importe app.py et démarre ses propres tâches via
+start_all(). Les tâches qui ne doivent tourner qu'une fois par déploiement
+gèrent elles-mêmes leur élection (voir sweeper.py).
+"""
+import threading
+
+
+class PeriodicTask:
+    """Appelle `func()` toutes les `interval` secondes dans un thread daemon."""
+
+    def __init__(self, name, interval, func):
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.func()
+            except Exception as e:
+                # Une erreur ne doit jamais tuer le thread : on réessaie au prochain tour
+                print(f"[TÂCHE {self.name}] Erreur: {e}")
+
+
+_tasks = []
+
+
+def register(name, interval, func):
+    """Enregistre une tâche périodique (démarrée par start_all)."""
+    task = PeriodicTask(name, interval, func)
+    _tasks.append(task)
+    return task
+
+
+def start_all():
+    for task in _tasks:
+        task.start()
+
+
+def stop_all(timeout=None):
+    for task in _tasks:
+        task.stop(timeout)
@@ -0,0 +1,140 @@
+"""
+Benchmark de l'historique des coups : tableau JSON (moves_list) contre binaire (moves_packed).
+
+Pour des parties de 20, 100 et 300 demi-coups, sur le backend SQLite
+(fichier temporaire, latence simulée par appel avec --latency-ms) :
+- octets stockés par coup ;
+- octets envoyés à la base pour écrire le dernier coup (ancien format :
+  tout l'historique ; nouveau : le coup ajouté) ;
+- latence p50 de cette écriture et du décodage de get_moves.
+
+Usage :
+    python benchmarks/bench_moves.py
+    python benchmarks/bench_moves.py --plies 20,100,300 --repeat 200 --json bench_moves.json
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import chess  # noqa: E402
+
+import storage  # noqa: E402
+from move_history import pack_moves, to_base64, unpack_moves  # noqa: E402
+from recording import percentile  # noqa: E402
+
+GAME_UUID = "bench-moves"
+
+
+def random_game(plies, seed=0):
+    """Partie aléatoire d'au moins `plies` demi-coups légaux (UCI)."""
+    while True:
+        rng = random.Random(seed)
+        board = chess.Board()
+        moves = []
+        while len(moves) < plies and not board.is_game_over(claim_draw=False):
+            move = rng.choice(list(board.legal_moves))
+            board.push(move)
+            moves.append(move.uci())
+        if len(moves) == plies:
+            return moves, board.fen()
+        seed += 1
+
+
+def timed(func, repeat):
+    durations = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - started)
+    durations.sort()
+    return round(percentile(durations, 0.50) * 1000, 3)
+
+
+def measure(db, plies, repeat):
+    moves, fen = random_game(plies)
+    previous = moves[:-1]
+
+    # Ancien format : chaque coup réécrit tout le tableau JSON
+    json_update = {"fen_state": fen, "moves_list": moves}
+
+    def write_json():
+        db.table("chess").update(json_update).eq("uuid", GAME_UUID).execute()
+
+    # Nouveau format : seul le dernier coup est ajouté (2 octets, en base64)
+    append_params = {"p_game_uuid": GAME_UUID, "fen": fen, "stored_bytes": 2 * len(previous),
+                     "moves": to_base64(pack_moves(moves[-1:]))}
+    reset_params = {"p_game_uuid": GAME_UUID, "fen": fen, "stored_bytes": 0,
+                    "moves": to_base64(pack_moves(previous))}
+
+    def reset():
+        # Historique vidé puis réécrit à N-1 coups (l'ajout n'accepte que la taille attendue)
+        db.table("chess").update({"moves_packed": None}).eq("uuid", GAME_UUID).execute()
+        db.rpc("save_chess_moves", reset_params).execute()
+
+    def write_packed():
+        reset()
+        db.rpc("save_chess_moves", append_params).execute()
+
+    def write_reset_only():
+        reset()
+
+    json_write_ms = timed(write_json, repeat)
+    # L'ajout n'est mesurable qu'après remise à N-1 coups : on retranche cette remise
+    packed_write_ms = round(max(timed(write_packed, repeat) - timed(write_reset_only, repeat), 0.0), 3)
+
+    json_text = json.dumps(moves)
+    packed = pack_moves(moves)
+    return {
+        "plies": plies,
+        "json_bytes_per_move": round(len(json_text) / plies, 2),
+        "packed_bytes_per_move": round(len(packed) / plies, 2),
+        "json_write_bytes": len(json.dumps(json_update)),
+        "packed_write_bytes": len(json.dumps(append_params)),
+        "json_write_p50_ms": json_write_ms,
+        "packed_write_p50_ms": packed_write_ms,
+        "json_decode_p50_ms": timed(lambda: json.loads(json_text), repeat),
+        "packed_decode_p50_ms": timed(lambda: unpack_moves(packed), repeat),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--plies", default="20,100,300")
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="latence simulée par appel base")
+    parser.add_argument("--json", dest="json_path", help="écrit les résultats en JSON")
+    args = parser.parse_args(argv)
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        db = storage.SQLiteClient(os.path.join(tmp, "moves.db"), latency=args.latency_ms / 1000)
+        db.table("chess").insert({"uuid": GAME_UUID, "fen_state": chess.STARTING_FEN, "moves_list": []}).execute()
+        for plies in [int(p) for p in args.plies.split(",") if p.strip()]:
+            results.append(measure(db, plies, args.repeat))
+
+    print(f"\nLatence simulée par appel base : {args.latency_ms} ms, {args.repeat} mesures par point")
+    print(f"{'coups':>6}{'o/coup json':>13}{'o/coup bin':>12}{'écrit json':>12}{'écrit bin':>11}"
+          f"{'p50 json ms':>13}{'p50 bin ms':>12}{'déc. json ms':>14}{'déc. bin ms':>13}")
+    print("-" * 106)
+    for r in results:
+        print(f"{r['plies']:>6}{r['json_bytes_per_move']:>13}{r['packed_bytes_per_move']:>12}"
+              f"{r['json_write_bytes']:>12}{r['packed_write_bytes']:>11}"
+              f"{r['json_write_p50_ms']:>13}{r['packed_write_p50_ms']:>12}"
+              f"{r['json_decode_p50_ms']:>14}{r['packed_decode_p50_ms']:>13}")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"latency_ms": args.latency_ms, "results": results}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,328 @@
+"""
+Benchmark hors ligne de toutes les routes de app.py.
+
+L'application est pilotée par le client de test Flask ; la base est le
+backend SQLite en mémoire enveloppé dans RecordingClient, qui compte les
+aller-retours et ajoute une latence par appel (--latency-ms) pour simuler
+Supabase.
+
+Pour chaque route : p50 / p99 (ms), requêtes/s, aller-retours base par
+requête (pendant la requête), écritures différées par requête (tampons
+vidés en arrière-plan), octets renvoyés par la base par requête, codes HTTP.
+
+Usage :
+    python benchmarks/bench_routes.py --iterations 50 --latency-ms 20
+    python benchmarks/bench_routes.py --only chess,casino --save-baseline bench_baseline.json
+    python benchmarks/bench_routes.py --baseline bench_baseline.json --tolerance 0.25
+
+Avec --baseline, le code de sortie vaut 1 si une route fait plus
+d'aller-retours qu'avant ou si son p50 dépasse la référence de plus de
+--tolerance (et de --slack-ms en absolu).
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+os.environ.setdefault("STORAGE_BACKEND", "sqlite")
+os.environ.setdefault("SQLITE_PATH", ":memory:")
+os.environ["BACKGROUND_TASKS"] = "0"
+os.environ.setdefault("SESSION_SECRET", "benchmark")
+
+import app as server  # noqa: E402
+from recording import CallRecorder, RecordingClient, percentile  # noqa: E402
+from werkzeug.security import generate_password_hash  # noqa: E402
+
+USER = "bench_user"
+PASSWORD = "bench_password"
+KNIGHT_DANCE = ["g1f3", "g8f6", "f3g1", "f6g8"]
+
+
+# ----------------------------------------------------------------------
+# --- DONNÉES DE DÉPART ---
+# ----------------------------------------------------------------------
+def seed(db):
+    db.table("Player").insert({"ID": USER, "Password": generate_password_hash(PASSWORD), "Status": "🔴 offline"}).execute()
+    db.table("Player").insert([
+        {"ID": f"bench_player_{i}", "Password": "x", "Status": "🔴 offline",
+         "last_seen": (datetime.now(timezone.utc) - timedelta(minutes=i)).isoformat()}
+        for i in range(200)
+    ]).execute()
+    db.table("Skull_Arena_DataBase").insert([
+        {"username": f"bench_player_{i}", "Best_Vague": i, "Crane": i} for i in range(200)
+    ]).execute()
+    db.table("Astro_Dodge").insert([
+        {"username": f"bench_player_{i}", "PR_Score": i * 10, "Coins": i} for i in range(200)
+    ]).execute()
+    db.table("Stickman_Runner").insert([
+        {"username": f"bench_player_{i}", "best_score": i * 3, "credit": i, "grade": "Bronze"} for i in range(200)
+    ]).execute()
+    db.table("Casino").insert({"username": USER, "money": 100, "success": {"first_win": True}}).execute()
+    db.table("Gun_Merge").insert({"username": USER, "save": default_gun_merge_save()}).execute()
+    db.table("Play_Count").insert([{"name": name, "counter": 0} for name in ("Skull Arena", "Astro Dodge", "Chess")]).execute()
+    db.table("Last_Maj").insert([
+        {"Version": v, "Title": f"Version {v}", "Description": "Notes de version " * 20} for v in range(1, 101)
+    ]).execute()
+    db.table("FDPiece").insert({"username": USER, "Time": 0, "FDPiece": 1000, "Pass": 0}).execute()
+    db.table("chess").insert({
+        "uuid": "bench-game", "fen_state": server.INITIAL_FEN, "white_player_id": "bench_white",
+        "black_player_id": "bench_black", "joueurs": "bench_white,bench_black", "moves_list": []
+    }).execute()
+
+
+def default_gun_merge_save():
+    return {"xp": 10, "money": 500, "buyPrice": 4, "currentLevel": 3,
+            "inventory": [{"id": 1}, {"id": 2}, {"id": 3}, None, {"id": 5}]}
+
+
+def prepare_games(prefix):
+    def prepare(db, n):
+        db.table("chess").insert([{
+            "uuid": f"{prefix}-{i}", "fen_state": server.INITIAL_FEN, "white_player_id": f"{prefix}_w{i}",
+            "black_player_id": f"{prefix}_b{i}", "joueurs": f"{prefix}_w{i},{prefix}_b{i}", "moves_list": []
+        } for i in range(n)]).execute()
+    return prepare
+
+
+def prepare_idle_gun_merge(db, n):
+    db.table("Gun_Merge").insert([{"username": f"idle_{i}", "save": default_gun_merge_save()} for i in range(n)]).execute()
+    long_ago = (datetime.now(timezone.utc) - timedelta(hours=1)).isoformat()
+    for i in range(n):
+        db.table("Gun_Merge").update({"gain_HL": long_ago, "last_claim": 0}).eq("username", f"idle_{i}").execute()
+
+
+def knight_dance(i):
+    player = "bench_white" if i % 2 == 0 else "bench_black"
+    return "POST", "/make_move", {"json": {"game_uuid": "bench-game", "username": player, "move_uci": KNIGHT_DANCE[i % 4]}}
+
+
+# ----------------------------------------------------------------------
+# --- SCÉNARIOS : (famille, nom, requête(i), préparation(db, n)) ---
+# ----------------------------------------------------------------------
+def post(path, payload):
+    return lambda i: ("POST", path, {"json": payload(i) if callable(payload) else payload})
+
+
+def get(path):
+    return lambda i: ("GET", path(i) if callable(path) else path, {})
+
+
+SCENARIOS = [
+    ("misc", "home", get("/"), None),
+    ("misc", "stay_alive", get("/stay_alive"), None),
+    ("misc", "metrics", get("/metrics"), None),
+    ("auth", "signup", post("/signup", lambda i: {"id": f"signup_{i}", "password": "pw"}), None),
+    ("auth", "login", post("/login", {"id": USER, "password": PASSWORD}), None),
+    ("auth", "logout", post("/logout", {"id": USER}), None),
+    ("auth", "friends_control", post("/friends_control", {"action": "get_friends_list", "username": USER}), None),
+    ("presence", "online_players", get("/online_players"), None),
+    ("presence", "is_online", get(f"/is_online/{USER}"), None),
+
+    ("skull_arena", "skull_arena_update_data", post("/skull_arena_update_data", lambda i: {
+        "username": USER, "best_wave": i, "skulls": 5, "up_damage": 1, "up_range": 1, "up_speed": 1, "up_fire": 1}), None),
+    ("skull_arena", "skull_arena_get_data", post("/skull_arena_get_data", {"username": USER}), None),
+    ("skull_arena", "skull_arena_get_leaderboard", get("/skull_arena_get_leaderboard"), None),
+    ("astro_dodge", "astro_dodge_update_data", post("/astro_dodge_update_data", lambda i: {
+        "username": USER, "score": i, "credit": 3, "Voiture": "Standard"}), None),
+    ("astro_dodge", "astro_dodge_get_data", post("/astro_dodge_get_data", {"username": USER}), None),
+    ("astro_dodge", "astro_dodge_get_leaderboard", get("/astro_dodge_get_leaderboard"), None),
+    ("stickman_runner", "stickman_runner_update_data", post("/stickman_runner_update_data", lambda i: {
+        "username": USER, "best_score": i, "credit": 2, "grade": "Argent"}), None),
+    ("stickman_runner", "stickman_runner_get_data", post("/stickman_runner_get_data", {"username": USER}), None),
+    ("stickman_runner", "stickman_runner_get_leaderboard", get("/stickman_runner_get_leaderboard"), None),
+
+    ("chess", "find_or_create_match", post("/find_or_create_match", lambda i: {"username": f"mm_{i}"}), None),
+    ("chess", "make_move", knight_dance, None),
+    ("chess", "get_moves", get("/get_moves/bench-game"), None),
+    ("chess", "get_game_state", get("/get_game_state?game_uuid=bench-game"), None),
+    ("chess", "game_events", get("/game_events/bench-game?since=-1"), None),
+    ("chess", "spectate", get("/spectate/bench-game?since=-1"), None),
+    ("chess", "queue_premoves", post("/queue_premoves", lambda i: {
+        "game_uuid": f"premove-{i}", "username": f"premove_b{i}", "premoves": [{"if": "e2e4", "play": "e7e5"}]}),
+     prepare_games("premove")),
+    ("chess", "give_up_chess", post("/give_up_chess", lambda i: {"game_uuid": f"giveup-{i}", "username": f"giveup_w{i}"}),
+     prepare_games("giveup")),
+    ("chess", "get_give_up_chess", get("/get_give_up_chess?game_uuid=bench-game"), None),
+    ("chess", "destroy_match", post("/destroy_match", lambda i: {"game_uuid": f"destroy-{i}", "username": f"destroy_w{i}"}),
+     prepare_games("destroy")),
+    ("chess", "chess_cache_stats", get("/chess_cache_stats"), None),
+    ("chess", "matchmaking_stats", get("/matchmaking_stats"), None),
+
+    ("casino", "Casino_update_data", post("/Casino_update_data", lambda i: {"username": USER, "money": i, "success": {"a": i}}), None),
+    ("casino", "Casino_get_data", post("/Casino_get_data", {"username": USER}), None),
+    ("casino", "get_casino_data", get(f"/get_casino_data?username={USER}"), None),
+    ("casino", "update_casino_money", post("/update_casino_money", lambda i: {"username": USER, "money": i}), None),
+    ("casino", "update_casino_success", post("/update_casino_success", lambda i: {"username": USER, "success": {"b": i}}), None),
+
+    ("gun_merge", "gun_merge_update_data", post("/gun_merge_update_data", lambda i: {
+        "username": USER, "save": dict(default_gun_merge_save(), xp=i)}), None),
+    ("gun_merge", "gun_merge_get_data", post("/gun_merge_get_data", {"username": USER}), None),
+    ("gun_merge", "get_HL_money", post("/get_HL_money", lambda i: {"username": f"idle_{i}"}), prepare_idle_gun_merge),
+    ("save_all", "save_all", post("/save_all", lambda i: {"username": USER, "games": {
+        "skull_arena": {"best_wave": i, "skulls": 5},
+        "astro_dodge": {"score": i, "credit": 3, "Voiture": "Standard"},
+        "stickman_runner": {"best_score": i, "credit": 2, "grade": "Argent"},
+        "casino": {"money": i, "success": {"a": i}},
+        "gun_merge": {"save": dict(default_gun_merge_save(), xp=i)}}}), None),
+    ("save_all", "profile", get(f"/profile/{USER}"), None),
+
+    ("counters", "get_play_counter", get("/get_play_counter"), None),
+    ("counters", "add1to_count", get("/add1to_count?name=Chess"), None),
+    ("versions", "get_latest_version", get("/get_latest_version"), None),
+    ("versions", "get_all_versions", get("/get_all_versions"), None),
+    ("versions", "add_version", get(lambda i: f"/add_version?version={1000 + i}&title=bench&description=bench"), None),
+
+    ("fdpiece", "get_time_FDPrice", post("/get_time_FDPrice", {"username": USER}), None),
+    ("fdpiece", "send_time", post("/send_time", lambda i: {"username": USER, "Time": i}), None),
+    ("fdpiece", "send_FDPrice", post("/send_FDPrice", {"username": USER, "FDPiece": 1}), None),
+    ("fdpiece", "get_evo_pass", post("/get_evo_pass", {"username": USER}), None),
+    ("fdpiece", "set_evo_pass", post("/set_evo_pass", lambda i: {"username": USER, "Pass": i % 5}), None),
+    ("fdpiece", "set_sub", post("/set_sub", {"username": USER, "sub": "medium", "price": 0}), None),
+    ("fdpiece", "get_sub", post("/get_sub", {"username": USER}), None),
+    ("fdpiece", "stripe_webhook", post("/stripe_webhook", {"type": "checkout.session.completed", "data": {"object": {
+        "metadata": {"client_reference_id": USER, "virtual_amount": "10"}}}}), None),
+
+    ("admin", "get_all_players_status", get("/get_all_players_status"), None),
+    ("admin", "do_ban", post("/do_ban", {"id": "bench_player_1"}), None),
+    ("admin", "remove_sanction", post("/remove_sanction", {"id": "bench_player_1"}), None),
+    ("admin", "get_all_ban", get("/get_all_ban"), None),
+    ("admin", "get_ban", get(f"/get_ban?id={USER}"), None),
+]
+
+
+# ----------------------------------------------------------------------
+# --- EXÉCUTION ---
+# ----------------------------------------------------------------------
+def flush_deferred_writes():
+    """Vide les tampons d'écriture différée (leurs appels comptent comme différés)."""
+    server.presence_buffer.flush()
+    server.play_counters.flush()
+
+
+def run_scenario(client, recorder, db, name, make_request, prepare, iterations, warmup):
+    if prepare:
+        prepare(db, iterations + warmup)
+
+    # Indices consécutifs entre échauffement et mesure (les scénarios à état, comme
+    # make_move, rejouent une séquence)
+    for i in range(warmup):
+        method, path, kwargs = make_request(i)
+        client.open(path, method=method, **kwargs)
+    flush_deferred_writes()
+    recorder.reset()
+
+    durations = []
+    statuses = Counter()
+    started = time.perf_counter()
+    for i in range(warmup, warmup + iterations):
+        method, path, kwargs = make_request(i)
+        recorder.in_request = True
+        t0 = time.perf_counter()
+        response = client.open(path, method=method, **kwargs)
+        durations.append(time.perf_counter() - t0)
+        recorder.in_request = False
+        statuses[response.status_code] += 1
+    elapsed = time.perf_counter() - started
+    flush_deferred_writes()
+
+    request_calls, deferred_calls = recorder.totals()
+    durations.sort()
+    return {
+        "route": name,
+        "iterations": iterations,
+        "p50_ms": round(percentile(durations, 0.50) * 1000, 3),
+        "p99_ms": round(percentile(durations, 0.99) * 1000, 3),
+        "rps": round(iterations / elapsed, 1) if elapsed else 0.0,
+        "round_trips_per_request": round(request_calls / iterations, 3),
+        "deferred_per_request": round(deferred_calls / iterations, 3),
+        "db_response_bytes_per_request": round(recorder.request_bytes / iterations, 1),
+        "statuses": {str(code): count for code, count in sorted(statuses.items())},
+        "calls": {f"{table}.{op}": count for (table, op), count in sorted(recorder.request_calls.items())},
+    }
+
+
+def compare(results, baseline, tolerance, slack_ms):
+    failures = []
+    for result in results:
+        reference = baseline.get(result["route"])
+        if not reference:
+            continue
+        if result["round_trips_per_request"] > reference["round_trips_per_request"] + 1e-9:
+            failures.append(f"{result['route']}: aller-retours {reference['round_trips_per_request']} -> "
+                            f"{result['round_trips_per_request']}")
+        limit = reference["p50_ms"] * (1 + tolerance) + slack_ms
+        if result["p50_ms"] > limit:
+            failures.append(f"{result['route']}: p50 {reference['p50_ms']} ms -> {result['p50_ms']} ms "
+                            f"(limite {limit:.3f} ms)")
+    return failures
+
+
+def print_report(results, latency_ms):
+    print(f"\nLatence simulée par appel base : {latency_ms} ms")
+    header = (f"{'route':34} {'p50 ms':>9} {'p99 ms':>9} {'req/s':>9} {'RT/req':>7} {'diff/req':>8} "
+              f"{'o/req':>8}  statuts")
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        statuses = ", ".join(f"{code}x{count}" for code, count in r["statuses"].items())
+        print(f"{r['route']:34} {r['p50_ms']:9.3f} {r['p99_ms']:9.3f} {r['rps']:9.1f} "
+              f"{r['round_trips_per_request']:7.2f} {r['deferred_per_request']:8.2f} "
+              f"{r['db_response_bytes_per_request']:8.1f}  {statuses}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="latence simulée par appel base")
+    parser.add_argument("--only", default="", help="familles ou routes, séparées par des virgules")
+    parser.add_argument("--json", dest="json_path", help="écrit les résultats en JSON")
+    parser.add_argument("--save-baseline", help="enregistre les résultats comme référence")
+    parser.add_argument("--baseline", help="référence à comparer (échec si régression)")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="hausse relative du p50 tolérée")
+    parser.add_argument("--slack-ms", type=float, default=0.5, help="marge absolue sur le p50")
+    args = parser.parse_args(argv)
+
+    recorder = CallRecorder(args.latency_ms / 1000.0)
+    db = server.supabase
+    seed(db)
+    server.supabase = RecordingClient(db, recorder)
+    client = server.app.test_client()
+
+    selected = {name.strip() for name in args.only.split(",") if name.strip()}
+    results = []
+    for family, name, make_request, prepare in SCENARIOS:
+        if selected and family not in selected and name not in selected:
+            continue
+        results.append(run_scenario(client, recorder, db, name, make_request, prepare, args.iterations, args.warmup))
+
+    print_report(results, args.latency_ms)
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"latency_ms": args.latency_ms, "results": results}, f, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump({r["route"]: r for r in results}, f, indent=2)
+        print(f"\nRéférence enregistrée dans {args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            failures = compare(results, json.load(f), args.tolerance, args.slack_ms)
+        if failures:
+            print("\nRÉGRESSIONS :")
+            for failure in failures:
+                print(f"  - {failure}")
+            return 1
+        print("\nAucune régression par rapport à la référence.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
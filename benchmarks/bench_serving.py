@@ -0,0 +1,187 @@
+"""
+Benchmark du mode de service : gunicorn (WSGI, threads) contre uvicorn (ASGI, asgi.py).
+
+Chaque mode est lancé dans un sous-process sur une base SQLite temporaire
+avec une latence simulée par appel base (SQLITE_LATENCY_MS), puis chargé
+par --concurrency connexions keep-alive simultanées.
+
+Pour chaque mode et chaque route : p50 / p99 (ms), requêtes/s, erreurs.
+
+Usage :
+    python benchmarks/bench_serving.py --concurrency 200 --requests 2000 --latency-ms 50
+    python benchmarks/bench_serving.py --modes asgi --routes profile
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from recording import percentile  # noqa: E402
+
+USER = "bench_user"
+
+ROUTES = {
+    "skull_arena_get_data": ("POST", "/skull_arena_get_data", {"username": USER}),
+    "profile": ("GET", f"/profile/{USER}", None),
+    "get_ban": ("GET", f"/get_ban?id={USER}", None),
+    # Route non convertie : servie par Flask dans les deux modes
+    "get_all_versions": ("GET", "/get_all_versions", None),
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def server_command(mode, port, threads):
+    if mode == "sync":
+        return [sys.executable, "-m", "gunicorn", "app:app", "--workers", "1", "--worker-class", "gthread",
+                "--threads", str(threads), "--bind", f"127.0.0.1:{port}", "--log-level", "warning",
+                "--backlog", "4096"]
+    return [sys.executable, "-m", "uvicorn", "asgi:application", "--workers", "1", "--port", str(port),
+            "--log-level", "warning", "--no-access-log", "--backlog", "4096"]
+
+
+def start_server(mode, port, threads, env):
+    process = subprocess.Popen(server_command(mode, port, threads), cwd=ROOT, env=env)
+    deadline = time.monotonic() + 20
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/", timeout=1)
+            return process
+        except httpx.HTTPError:
+            if process.poll() is not None:
+                raise RuntimeError(f"le serveur {mode} s'est arrêté (code {process.returncode})")
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"le serveur {mode} ne répond pas")
+
+
+def seed(base_url):
+    httpx.post(f"{base_url}/signup", json={"id": USER, "password": "bench_password"}, timeout=30)
+    httpx.post(f"{base_url}/save_all", json={"username": USER, "games": {
+        "skull_arena": {"best_wave": 12, "skulls": 5},
+        "astro_dodge": {"score": 40, "credit": 3, "Voiture": "Standard"},
+        "stickman_runner": {"best_score": 300, "credit": 2, "grade": "Argent"},
+        "casino": {"money": 100, "success": {"a": 1}},
+    }}, timeout=30)
+
+
+async def send_request(reader, writer, method, path, body):
+    """Requête HTTP/1.1 keep-alive minimale : le client de charge doit coûter moins de CPU que le serveur."""
+    headers = f"{method} {path} HTTP/1.1\r\nHost: bench\r\nContent-Type: application/json\r\n" \
+              f"Content-Length: {len(body)}\r\n\r\n"
+    writer.write(headers.encode("latin1") + body)
+    status_line = await reader.readline()
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin1").partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    await reader.readexactly(length)
+    return int(status_line.split()[1])
+
+
+async def load(port, method, path, payload, concurrency, total):
+    latencies = []
+    statuses = {}
+    remaining = iter(range(total))
+    body = json.dumps(payload).encode() if payload is not None else b""
+
+    async def worker():
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        try:
+            for _ in remaining:
+                started = time.perf_counter()
+                try:
+                    status = await send_request(reader, writer, method, path, body)
+                except (OSError, asyncio.IncompleteReadError, ValueError, IndexError):
+                    status = "erreur"
+                    writer.close()
+                    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+                latencies.append(time.perf_counter() - started)
+                statuses[status] = statuses.get(status, 0) + 1
+        finally:
+            writer.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "req_per_s": round(total / elapsed, 1),
+        "statuses": {str(k): v for k, v in statuses.items()},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", default="sync,asgi")
+    parser.add_argument("--routes", default=",".join(ROUTES))
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="latence simulée par appel base")
+    parser.add_argument("--threads", type=int, default=32, help="threads gunicorn (sync) / pool WSGI (asgi)")
+    parser.add_argument("--json", dest="json_path", help="écrit les résultats en JSON")
+    args = parser.parse_args(argv)
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in [m.strip() for m in args.modes.split(",") if m.strip()]:
+            env = dict(
+                os.environ,
+                STORAGE_BACKEND="sqlite",
+                SQLITE_PATH=os.path.join(tmp, f"{mode}.db"),
+                SQLITE_LATENCY_MS=str(args.latency_ms),
+                BACKGROUND_TASKS="0",
+                SESSION_SECRET=os.environ.get("SESSION_SECRET", "benchmark"),
+                METRICS_DIR=os.path.join(tmp, f"{mode}_metrics"),
+                ASGI_WSGI_THREADS=str(args.threads),
+            )
+            port = free_port()
+            base_url = f"http://127.0.0.1:{port}"
+            process = start_server(mode, port, args.threads, env)
+            try:
+                seed(base_url)
+                for name in [r.strip() for r in args.routes.split(",") if r.strip()]:
+                    method, path, payload = ROUTES[name]
+                    result = asyncio.run(load(port, method, path, payload, args.concurrency, args.requests))
+                    results.append(dict(result, mode=mode, route=name))
+            finally:
+                process.terminate()
+                process.wait()
+
+    print(f"\nLatence simulée par appel base : {args.latency_ms} ms, "
+          f"{args.concurrency} clients simultanés, {args.requests} requêtes par route")
+    print(f"{'mode':<6}{'route':<24}{'p50 ms':>10}{'p99 ms':>10}{'req/s':>10}  statuts")
+    print("-" * 76)
+    for r in results:
+        statuses = " ".join(f"{code}x{count}" for code, count in sorted(r["statuses"].items()))
+        print(f"{r['mode']:<6}{r['route']:<24}{r['p50_ms']:>10}{r['p99_ms']:>10}{r['req_per_s']:>10}  {statuses}")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"latency_ms": args.latency_ms, "concurrency": args.concurrency, "results": results}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
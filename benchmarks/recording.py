@@ -0,0 +1,122 @@
+"""
+Faux client Supabase pour les benchmarks : enregistre chaque aller-retour base.
+
+RecordingClient enveloppe un vrai client (en pratique le backend SQLite
+en mémoire de storage.py, pour avoir des données cohérentes) et, à chaque
+execute() :
+- attend `latency` secondes (latence réseau simulée, injectable) ;
+- enregistre la table, l'opération et si l'appel a eu lieu pendant une
+  requête HTTP (thread de la requête) ou en arrière-plan (écritures différées) ;
+- additionne la taille de la réponse en octets (JSON compact, voir
+  metrics.response_bytes), pas en nombre de lignes.
+"""
+import threading
+import time
+from collections import Counter
+
+from flask import has_request_context
+
+from metrics import response_bytes
+
+_ACTIONS = ("select", "insert", "upsert", "update", "delete")
+
+
+class CallRecorder:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.request_calls = Counter()
+        self.deferred_calls = Counter()
+        self.request_bytes = 0
+        self.deferred_bytes = 0
+
+    @property
+    def in_request(self):
+        return getattr(self._local, "in_request", False)
+
+    @in_request.setter
+    def in_request(self, value):
+        self._local.in_request = value
+
+    def _counted_in_request(self):
+        # Les tâches lancées avec le contexte de la requête (ex : /save_all) comptent pour la requête
+        return self.in_request or has_request_context()
+
+    def record(self, table, operation):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            target = self.request_calls if self._counted_in_request() else self.deferred_calls
+            target[(table, operation)] += 1
+
+    def record_response(self, response):
+        size = response_bytes(getattr(response, "data", None))
+        with self._lock:
+            if self._counted_in_request():
+                self.request_bytes += size
+            else:
+                self.deferred_bytes += size
+
+    def reset(self):
+        with self._lock:
+            self.request_calls = Counter()
+            self.deferred_calls = Counter()
+            self.request_bytes = 0
+            self.deferred_bytes = 0
+
+    def totals(self):
+        with self._lock:
+            return sum(self.request_calls.values()), sum(self.deferred_calls.values())
+
+
+class _RecordedQuery:
+    """Proxy d'un request builder : suit l'opération et intercepte execute()."""
+
+    def __init__(self, target, recorder, table, operation="select"):
+        self._target = target
+        self._recorder = recorder
+        self._table = table
+        self._operation = operation
+
+    def __getattr__(self, name):
+        value = getattr(self._target, name)
+        operation = name if name in _ACTIONS else self._operation
+        if not callable(value):
+            # ex : query.not_ -> on garde le proxy sur l'objet renvoyé
+            return _RecordedQuery(value, self._recorder, self._table, operation)
+
+        def call(*args, **kwargs):
+            return _RecordedQuery(value(*args, **kwargs), self._recorder, self._table, operation)
+        return call
+
+    def execute(self):
+        self._recorder.record(self._table, self._operation)
+        response = self._target.execute()
+        self._recorder.record_response(response)
+        return response
+
+
+class RecordingClient:
+    def __init__(self, inner, recorder):
+        self._inner = inner
+        self.recorder = recorder
+
+    def table(self, name):
+        return _RecordedQuery(self._inner.table(name), self.recorder, name)
+
+    def from_(self, name):
+        return self.table(name)
+
+    def rpc(self, name, params=None):
+        return _RecordedQuery(self._inner.rpc(name, params), self.recorder, f"rpc:{name}", "rpc")
+
+    def __getattr__(self, name):
+        return getattr(self._inner, name)
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
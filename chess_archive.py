@@ -0,0 +1,92 @@
+"""
+Nettoyage de la table chess : parties jamais rejointes et parties terminées.
+
+La table chess ne garde que les parties en cours. Une tâche périodique
+(ChessReaper, un seul worker grâce au verrou fichier de sweeper.py) :
+- supprime les parties sans joueur Noir dont l'attente n'est plus rafraîchie ;
+- déplace les parties terminées (mat, nulle, abandon ; colonne finished_at)
+  vers chess_archive, sous forme de PGN compressé (zlib) construit avec
+  python-chess, une fois passé un court délai de grâce pendant lequel les
+  clients peuvent encore relire l'état final.
+"""
+import os
+import zlib
+
+import chess
+import chess.pgn
+
+from sweeper import LeaderTask
+
+
+def game_outcome(board, abandon=None):
+    """(résultat PGN, cause de fin) d'une partie ; ("*", None) si elle n'est pas terminée."""
+    if abandon in ("white", "black"):
+        # abandon contient la couleur du gagnant
+        return ("1-0" if abandon == "white" else "0-1"), "abandon"
+    outcome = board.outcome(claim_draw=False)
+    if outcome is None:
+        return "*", None
+    return outcome.result(), outcome.termination.name.lower()
+
+
+def build_pgn(row, moves, initial_fen=chess.STARTING_FEN):
+    """PGN d'une ligne chess (coups UCI rejoués depuis `initial_fen`).
+
+    Renvoie (texte PGN, résultat, cause de fin, nombre de demi-coups).
+    Un coup illégal arrête la relecture : le PGN contient les coups valides.
+    """
+    board = chess.Board(initial_fen)
+    for uci in moves:
+        try:
+            move = chess.Move.from_uci(uci)
+        except ValueError:
+            break
+        if move not in board.legal_moves:
+            break
+        board.push(move)
+
+    result, termination = game_outcome(board, row.get("abandon"))
+    game = chess.pgn.Game.from_board(board)
+    game.headers["Event"] = "project_3_API"
+    game.headers["Site"] = row["uuid"]
+    game.headers["Date"] = (row.get("created_at") or "")[:10].replace("-", ".") or "????.??.??"
+    game.headers["White"] = row.get("white_player_id") or "?"
+    game.headers["Black"] = row.get("black_player_id") or "?"
+    game.headers["Result"] = result
+    if termination:
+        game.headers["Termination"] = termination
+    text = game.accept(chess.pgn.StringExporter(headers=True, variations=False, comments=False))
+    return text, result, termination, board.ply()
+
+
+def compress_pgn(text):
+    return zlib.compress(text.encode("utf-8"), 9)
+
+
+def decompress_pgn(data):
+    return zlib.decompress(data).decode("utf-8")
+
+
+class ChessReaper(LeaderTask):
+    """Exécute `reap_func()` puis `archive_func()` si ce process est leader.
+
+    Chacune renvoie le nombre de parties supprimées / archivées.
+    """
+
+    name = "CHESS REAPER"
+    counts = ("reaped", "archived")
+
+    def __init__(self, reap_func, archive_func, lock_path):
+        super().__init__(lock_path)
+        self.reap_func = reap_func
+        self.archive_func = archive_func
+
+    def work(self):
+        reaped = self.reap_func()
+        archived = self.archive_func()
+        return {"reaped": reaped, "archived": archived}
+
+    def report(self, counts):
+        if counts["reaped"] or counts["archived"]:
+            print(f"[CHESS REAPER] {counts['reaped']} partie(s) non rejointe(s) supprimée(s), "
+                  f"{counts['archived']} partie(s) terminée(s) archivée(s) (pid {os.getpid()})")
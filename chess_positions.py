@@ -0,0 +1,95 @@
+"""
+Coups légaux et issue d'une position d'échecs, mémorisés par FEN.
+
+make_move et get_game_state renvoient la liste des coups légaux (UCI) et
+l'issue réelle de la partie : le client valide ses coups localement au lieu
+de découvrir un coup illégal par un 400. Le calcul (chess.Board, génération
+des coups) est fait une fois par FEN dans un LRU borné ; une même position
+est demandée par les deux joueurs et par chaque interrogation de l'état.
+
+Le FEN ne contient pas l'historique : la répétition quintuple n'est connue
+que de l'appelant qui a le plateau complet (voir `fivefold` de state_fields).
+"""
+import threading
+from collections import OrderedDict
+
+import chess
+
+
+class Position:
+    """Coups légaux (tuple UCI, ordre de python-chess) et issue d'une position."""
+
+    __slots__ = ("legal_moves", "result", "termination", "winner")
+
+    def __init__(self, fen):
+        board = chess.Board(fen)
+        self.legal_moves = tuple(move.uci() for move in board.legal_moves)
+        outcome = board.outcome(claim_draw=False)
+        if outcome is None:
+            self.result = self.termination = self.winner = None
+        else:
+            self.result = outcome.result()
+            self.termination = outcome.termination.name.lower()
+            self.winner = None if outcome.winner is None else ("white" if outcome.winner else "black")
+
+
+class PositionCache:
+    """LRU FEN -> Position, borné à `capacity` positions."""
+
+    def __init__(self, capacity=10000):
+        self.capacity = max(1, int(capacity))
+        self._lock = threading.Lock()
+        self._positions = OrderedDict()
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, fen):
+        """Position de `fen` ; ValueError si le FEN est invalide."""
+        with self._lock:
+            position = self._positions.get(fen)
+            if position is not None:
+                self._positions.move_to_end(fen)
+                self._counters["hits"] += 1
+                return position
+            self._counters["misses"] += 1
+
+        # Calculée hors verrou : deux calculs simultanés du même FEN donnent le même résultat
+        position = Position(fen)
+        with self._lock:
+            self._positions[fen] = position
+            self._positions.move_to_end(fen)
+            while len(self._positions) > self.capacity:
+                self._positions.popitem(last=False)
+                self._counters["evictions"] += 1
+        return position
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["size"] = len(self._positions)
+        return stats
+
+
+def state_fields(position, abandon=None, black_player_id=None, fivefold=False):
+    """Champs game_status / outcome / legal_moves d'une réponse d'état de partie.
+
+    game_status suit les valeurs de game_events.build_snapshot : "created",
+    "active", "checkmate", "draw" ou "abandoned". Une partie terminée n'a
+    plus de coups légaux.
+    """
+    if abandon in ("white", "black"):
+        # abandon contient la couleur du gagnant
+        outcome = {"result": "1-0" if abandon == "white" else "0-1", "termination": "abandon", "winner": abandon}
+        game_status = "abandoned"
+    elif position.result is not None:
+        outcome = {"result": position.result, "termination": position.termination, "winner": position.winner}
+        game_status = "checkmate" if position.termination == "checkmate" else "draw"
+    elif fivefold:
+        outcome = {"result": "1/2-1/2", "termination": "fivefold_repetition", "winner": None}
+        game_status = "draw"
+    else:
+        return {
+            "game_status": "active" if black_player_id else "created",
+            "outcome": None,
+            "legal_moves": position.legal_moves,
+        }
+    return {"game_status": game_status, "outcome": outcome, "legal_moves": ()}
@@ -0,0 +1,182 @@
+"""
+Cache des parties d'échecs actives.
+
+Les parties en cours sont gardées en mémoire sous forme de chess.Board (avec
+l'historique, utile pour les règles de répétition) dans un LRU indexé par
+game_uuid. make_move valide le coup sur le plateau en cache puis l'ajoute en
+base seulement si l'historique stocké est celui du cache : un coup validé sur
+une session périmée (autre worker, abandon) est refusé, jamais écrasé.
+
+Un joueur peut aussi déposer des coups anticipés conditionnels ("si
+l'adversaire joue X, jouer Y") : la file est stockée avec la partie et relue
+à chaque coup écrit, puis jouée dès le coup adverse, quel que soit le worker
+qui le reçoit, sans nouvel aller-retour du client.
+"""
+import threading
+from collections import OrderedDict, deque
+
+import chess
+
+
+class ChessSession:
+    """État en mémoire d'une partie (plateau, joueurs, liste des coups UCI)."""
+
+    def __init__(self, game_uuid, row, initial_fen):
+        self.game_uuid = game_uuid
+        self.lock = threading.Lock()
+        self.white_player_id = row.get("white_player_id")
+        self.black_player_id = row.get("black_player_id")
+        self.abandon = row.get("abandon")
+        moves_list = row.get("moves_list")
+        self.moves_list = list(moves_list) if isinstance(moves_list, list) else []
+        # Coups déjà écrits en base (None = inconnu : la prochaine écriture sera complète)
+        self.stored_plies = row.get("stored_plies")
+        self.board = self._build_board(row.get("fen_state") or initial_fen, initial_fen)
+        # Coups anticipés (premoves) du joueur qui attend : (coup adverse attendu ou None, réponse)
+        self.set_premoves(row.get("premove_player"), row.get("premoves") or [])
+
+    def _build_board(self, fen_state, initial_fen):
+        # On rejoue l'historique pour garder la pile de coups ; si elle ne mène
+        # pas au FEN stocké (partie modifiée à la main...), le FEN fait foi.
+        board = chess.Board(initial_fen)
+        try:
+            for move_uci in self.moves_list:
+                board.push_uci(move_uci)
+        except ValueError:
+            return chess.Board(fen_state)
+        if board.fen() != fen_state:
+            return chess.Board(fen_state)
+        return board
+
+    def version(self):
+        """Numéro de version comparable à celui des instantanés du GameEventHub."""
+        return self.board.ply() + (1 if self.black_player_id else 0) + (1 if self.abandon else 0)
+
+    def expected_player(self):
+        return self.white_player_id if self.board.turn == chess.WHITE else self.black_player_id
+
+    def accepts(self, player_id, move_uci):
+        """Vrai si le coup est jouable tel quel sur le plateau en cache."""
+        if self.expected_player() != player_id:
+            return False
+        try:
+            return chess.Move.from_uci(move_uci) in self.board.legal_moves
+        except ValueError:
+            return False
+
+    def set_premoves(self, player_id, premoves):
+        """Remplace la file de coups anticipés de `player_id` (liste vide = annulation)."""
+        self.premove_player = player_id if premoves else None
+        self.premoves = deque(tuple(premove) for premove in premoves)
+
+    def stored_premoves(self):
+        """File de coups anticipés au format stocké en base ([[si, joue], ...])."""
+        return [list(premove) for premove in self.premoves]
+
+    def take_premove(self, last_move_uci):
+        """Réponse anticipée au coup adverse `last_move_uci`, si elle est prévue et légale.
+
+        Renvoie le chess.Move à jouer, sinon None ; une condition non remplie
+        ou une réponse devenue illégale annule toute la file.
+        """
+        if not self.premoves or self.expected_player() != self.premove_player:
+            return None
+        expected, reply = self.premoves.popleft()
+        move = chess.Move.from_uci(reply)
+        if (expected is None or expected == last_move_uci) and move in self.board.legal_moves:
+            if not self.premoves:
+                self.premove_player = None
+            return move
+        self.set_premoves(None, [])
+        return None
+
+
+def parse_premoves(board, premoves):
+    """Valide une liste [{"if": coup adverse ou absent, "play": réponse}, ...] (UCI).
+
+    Les coups sont vérifiés sur une copie de `board` (trait à l'adversaire)
+    tant que la suite est connue ; après une condition absente ("toute
+    réponse"), seule la syntaxe l'est, la légalité étant revérifiée au
+    moment de jouer. Renvoie [(si, joue)] ; ValueError si invalide.
+    """
+    if not isinstance(premoves, list):
+        raise ValueError("premoves doit être une liste")
+    simulated = board.copy()
+    known = True
+    parsed = []
+    for index, entry in enumerate(premoves):
+        if not isinstance(entry, dict) or not isinstance(entry.get("play"), str):
+            raise ValueError(f"Coup anticipé n°{index + 1} invalide")
+        expected = entry.get("if")
+        if expected is not None and not isinstance(expected, str):
+            raise ValueError(f"Condition du coup anticipé n°{index + 1} invalide")
+        expected_move = chess.Move.from_uci(expected) if expected is not None else None
+        reply = chess.Move.from_uci(entry["play"])
+        if known and expected_move is None:
+            known = False
+        if known:
+            if expected_move not in simulated.legal_moves:
+                raise ValueError(f"Condition illégale : {expected}")
+            simulated.push(expected_move)
+            if reply not in simulated.legal_moves:
+                raise ValueError(f"Coup anticipé illégal : {entry['play']}")
+            simulated.push(reply)
+        parsed.append((expected_move.uci() if expected_move else None, reply.uci()))
+    return parsed
+
+
+class ChessSessionCache:
+    """LRU de ChessSession. `loader(game_uuid)` lit la ligne chess en base."""
+
+    def __init__(self, loader, initial_fen, capacity=1000):
+        self.loader = loader
+        self.initial_fen = initial_fen
+        self.capacity = max(1, int(capacity))
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0, "reloads": 0}
+
+    def get(self, game_uuid):
+        with self._lock:
+            session = self._sessions.get(game_uuid)
+            if session is not None:
+                self._sessions.move_to_end(game_uuid)
+                self._counters["hits"] += 1
+                return session
+            self._counters["misses"] += 1
+        return self._load(game_uuid)
+
+    def reload(self, game_uuid):
+        """Relit la partie en base (cache potentiellement périmé)."""
+        with self._lock:
+            self._counters["reloads"] += 1
+        return self._load(game_uuid)
+
+    def _load(self, game_uuid):
+        session = ChessSession(game_uuid, self.loader(game_uuid), self.initial_fen)
+        with self._lock:
+            self._sessions[game_uuid] = session
+            self._sessions.move_to_end(game_uuid)
+            while len(self._sessions) > self.capacity:
+                self._sessions.popitem(last=False)
+                self._counters["evictions"] += 1
+        return session
+
+    def peek(self, game_uuid):
+        """Renvoie la session si elle est en cache, sans chargement ni statistique."""
+        with self._lock:
+            return self._sessions.get(game_uuid)
+
+    def invalidate(self, game_uuid):
+        with self._lock:
+            self._sessions.pop(game_uuid, None)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["size"] = len(self._sessions)
+            stats["capacity"] = self.capacity
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        return stats
+
@@ -0,0 +1,94 @@
+"""
+Compteurs de parties (Play_Count) incrémentés en mémoire et vidés périodiquement.
+
+Les incréments en attente sont gardés dans un seul dictionnaire par process,
+protégé par un verrou tenu le temps d'une addition. Le flush envoie chaque
+incrément en base de façon atomique (counter = counter + n) puis le retire
+des attentes : les totaux restent exacts même avec plusieurs workers, et la
+mémoire ne dépend que du nombre de jeux, pas du nombre de threads.
+"""
+import threading
+
+
+class PlayCounters:
+    """`increment_func(name, amount)` écrit l'incrément en base et renvoie la nouvelle valeur.
+    `load_func()` renvoie les lignes {"name", "counter"} de la table.
+    """
+
+    def __init__(self, increment_func, load_func):
+        self.increment_func = increment_func
+        self.load_func = load_func
+        self._lock = threading.Lock()
+        self._pending = {}
+        # Tenu pendant un flush : une lecture base + en attente reste cohérente
+        self._flush_lock = threading.Lock()
+        self._base = {}
+        # Noms absents de la table à la dernière lecture : oubliés au prochain flush périodique
+        self._missing = set()
+        self._counters = {"flushes": 0, "flush_writes": 0, "flush_errors": 0, "unknown_hits": 0}
+
+    def increment(self, name, amount=1):
+        """+amount pour `name`, sans accès base."""
+        with self._lock:
+            self._pending[name] = self._pending.get(name, 0) + amount
+
+    def pending(self):
+        """Incréments pas encore écrits en base, par nom de jeu."""
+        with self._lock:
+            return {name: delta for name, delta in self._pending.items() if delta}
+
+    def flush(self):
+        """Envoie les incréments en attente (un appel atomique par jeu modifié)."""
+        with self._flush_lock:
+            self._counters["flushes"] += 1
+            # Un jeu ajouté entre-temps en base redevient visible
+            self._missing.clear()
+            for name, delta in self.pending().items():
+                try:
+                    new_value = self.increment_func(name, delta)
+                except Exception as e:
+                    self._counters["flush_errors"] += 1
+                    print(f"[PLAY COUNT FLUSH ERROR] {name} (+{delta}): {e}")
+                    continue
+                with self._lock:
+                    # Les incréments arrivés pendant l'écriture restent en attente
+                    remaining = self._pending.get(name, 0) - delta
+                    if remaining:
+                        self._pending[name] = remaining
+                    else:
+                        self._pending.pop(name, None)
+                self._counters["flush_writes"] += 1
+                if new_value is not None:
+                    self._base[name] = new_value
+
+    def read(self):
+        """Lignes de la table avec les incréments en attente ajoutés."""
+        with self._flush_lock:
+            rows = [dict(row) for row in self.load_func()]
+            pending = self.pending()
+            self._missing.clear()
+        for row in rows:
+            self._base[row["name"]] = row.get("counter") or 0
+            row["counter"] = (row.get("counter") or 0) + pending.get(row["name"], 0)
+        return rows
+
+    def value(self, name):
+        """Dernière valeur connue en base + en attente ; None si le jeu n'existe pas.
+
+        Un nom inconnu déclenche une seule relecture de la table jusqu'au
+        prochain flush : les requêtes suivantes pour ce nom ne touchent pas la base.
+        """
+        if name not in self._base:
+            if name in self._missing:
+                self._counters["unknown_hits"] += 1
+                return None
+            self.read()
+            if name not in self._base:
+                self._missing.add(name)
+                return None
+        return self._base[name] + self.pending().get(name, 0)
+
+    def stats(self):
+        stats = dict(self._counters)
+        stats["pending"] = self.pending()
+        return stats
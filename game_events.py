@@ -0,0 +1,202 @@
+"""
+Notifications d'état des parties d'échecs (long-poll / Server-Sent Events).
+
+Chaque changement (coup, arrivée du second joueur, abandon) publie un
+instantané de la partie dans GameEventHub ; les clients abonnés à
+/game_events/<game_uuid> sont réveillés au lieu d'interroger la base.
+
+La version d'un instantané est dérivée de l'état de la partie
+(nombre de demi-coups + 1 si le Noir a rejoint + 1 si abandon). Elle est donc
+identique sur tous les workers et ne fait qu'augmenter, ce qui rend la
+diffusion entre workers (LocalChannel) idempotente et insensible à l'ordre.
+"""
+import json
+import os
+import socket
+import threading
+from collections import OrderedDict
+
+import chess
+
+FINISHED_STATUSES = ("checkmate", "draw", "abandoned")
+
+
+def ply_from_fen(fen):
+    """Nombre de demi-coups joués depuis la position initiale, d'après le FEN."""
+    fields = fen.split()
+    fullmove = int(fields[5]) if len(fields) > 5 else 1
+    return (fullmove - 1) * 2 + (0 if fields[1] == "w" else 1)
+
+
+def build_snapshot(game_uuid, fen, white_player_id, black_player_id, abandon=None, last_move=None, event="state"):
+    """Construit l'instantané publié aux abonnés (mêmes clés que get_game_state)."""
+    board = chess.Board(fen)
+    if abandon:
+        game_status = "abandoned"
+    elif board.is_checkmate():
+        game_status = "checkmate"
+    elif board.is_stalemate() or board.is_insufficient_material() or board.is_seventyfive_moves():
+        game_status = "draw"
+    elif black_player_id:
+        game_status = "active"
+    else:
+        game_status = "created"
+
+    ply = ply_from_fen(fen)
+    return {
+        "game_uuid": game_uuid,
+        "version": ply + (1 if black_player_id else 0) + (1 if abandon else 0),
+        "event": event,
+        "game_status": game_status,
+        "fen": fen,
+        "ply": ply,
+        "last_move": last_move,
+        "player_white_id": white_player_id,
+        "opponent_id": black_player_id,
+        "winner_color": abandon,
+    }
+
+
+class GameEventHub:
+    """Dernier instantané connu par partie + attente bloquante de la version suivante."""
+
+    def __init__(self, capacity=5000):
+        self.capacity = max(1, int(capacity))
+        self.channel = None
+        self._lock = threading.Lock()
+        self._snapshots = OrderedDict()
+        self._conditions = {}
+        self._waiters = {}
+        self._counters = {"published": 0, "received": 0, "stale_ignored": 0, "waits": 0, "timeouts": 0}
+
+    def get(self, game_uuid):
+        with self._lock:
+            return self._snapshots.get(game_uuid)
+
+    def publish(self, snapshot):
+        """Publie un instantané localement et vers les autres workers."""
+        with self._lock:
+            self._counters["published"] += 1
+        self.apply(snapshot)
+        if self.channel is not None:
+            self.channel.broadcast(snapshot)
+
+    def receive(self, snapshot):
+        """Instantané reçu d'un autre worker."""
+        with self._lock:
+            self._counters["received"] += 1
+        self.apply(snapshot)
+
+    def apply(self, snapshot):
+        """Enregistre l'instantané s'il est plus récent ; réveille les abonnés. Renvoie True si appliqué."""
+        game_uuid = snapshot["game_uuid"]
+        with self._lock:
+            current = self._snapshots.get(game_uuid)
+            if current is not None and current["version"] >= snapshot["version"]:
+                self._counters["stale_ignored"] += 1
+                return False
+            self._snapshots[game_uuid] = snapshot
+            self._snapshots.move_to_end(game_uuid)
+            if len(self._snapshots) > self.capacity:
+                # On évince la plus ancienne partie qui n'a pas d'abonné en attente
+                for candidate in self._snapshots:
+                    if candidate not in self._conditions:
+                        del self._snapshots[candidate]
+                        break
+            condition = self._conditions.get(game_uuid)
+            if condition is not None:
+                condition.notify_all()
+        return True
+
+    def forget(self, game_uuid):
+        with self._lock:
+            self._snapshots.pop(game_uuid, None)
+
+    def wait(self, game_uuid, since, timeout):
+        """Attend un instantané de version > `since` (au plus `timeout` s). Renvoie le dernier connu."""
+        with self._lock:
+            self._counters["waits"] += 1
+            condition = self._conditions.get(game_uuid)
+            if condition is None:
+                condition = self._conditions[game_uuid] = threading.Condition(self._lock)
+            self._waiters[game_uuid] = self._waiters.get(game_uuid, 0) + 1
+            try:
+                changed = condition.wait_for(
+                    lambda: self._snapshots.get(game_uuid, {"version": -1})["version"] > since, timeout
+                )
+                if not changed:
+                    self._counters["timeouts"] += 1
+                return self._snapshots.get(game_uuid)
+            finally:
+                self._waiters[game_uuid] -= 1
+                if not self._waiters[game_uuid]:
+                    del self._waiters[game_uuid]
+                    del self._conditions[game_uuid]
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["games"] = len(self._snapshots)
+            stats["waiters"] = sum(self._waiters.values())
+        return stats
+
+
+class LocalChannel:
+    """Diffusion entre les process d'une même machine par sockets Unix datagramme.
+
+    Chaque worker écoute sur <directory>/<pid>.sock ; broadcast() envoie le
+    message à toutes les autres sockets du répertoire (celles des process
+    morts sont supprimées au passage).
+    """
+
+    def __init__(self, directory, on_message):
+        self.directory = directory
+        self.on_message = on_message
+        self.path = None
+        self._sock = None
+        self._send_sock = None
+
+    @staticmethod
+    def available():
+        return hasattr(socket, "AF_UNIX")
+
+    def start(self):
+        if self._sock is not None or not self.available():
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self.path = os.path.join(self.directory, f"{os.getpid()}.sock")
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.bind(self.path)
+        # Envoi non bloquant : un worker saturé ne doit pas ralentir les autres
+        self._send_sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._send_sock.setblocking(False)
+        threading.Thread(target=self._listen, name="game_events_channel", daemon=True).start()
+
+    def _listen(self):
+        while True:
+            try:
+                data = self._sock.recv(65536)
+                self.on_message(json.loads(data))
+            except Exception as e:
+                print(f"[GAME EVENTS CHANNEL ERROR] {e}")
+
+    def broadcast(self, message):
+        if self._sock is None:
+            return
+        data = json.dumps(message).encode()
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if path == self.path or not name.endswith(".sock"):
+                continue
+            try:
+                self._send_sock.sendto(data, path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Worker arrêté : sa socket est orpheline
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+            except OSError as e:
+                print(f"[GAME EVENTS CHANNEL ERROR] envoi vers {name}: {e}")
@@ -0,0 +1,139 @@
+"""
+Sauvegardes Gun Merge par différence (patch JSON) contre une version connue.
+
+Chaque sauvegarde reçoit un jeton de version (save_version). Le client qui
+connaît la version courante envoie seulement un patch (opérations "add",
+"remove", "replace" de la RFC 6902) ; le serveur l'applique à sa copie en
+cache et n'écrit en base que les champs de premier niveau modifiés. Si la
+version ne correspond plus (sauvegarde faite ailleurs), le client renvoie
+la sauvegarde complète.
+"""
+import copy
+import threading
+import uuid
+from collections import OrderedDict
+
+
+def new_save_version():
+    return uuid.uuid4().hex[:16]
+
+
+def _pointer(path):
+    """Segments d'un JSON Pointer ("/inventory/2" -> ["inventory", "2"])."""
+    if path == "":
+        return []
+    if not isinstance(path, str) or not path.startswith("/"):
+        raise ValueError(f"Chemin de patch invalide : {path!r}")
+    return [part.replace("~1", "/").replace("~0", "~") for part in path[1:].split("/")]
+
+
+def _list_index(container, key, allow_end):
+    if key == "-" and allow_end:
+        return len(container)
+    if not key.isdigit() or (len(key) > 1 and key[0] == "0"):
+        raise ValueError(f"Index de liste invalide : {key!r}")
+    index = int(key)
+    if index > len(container) or (index == len(container) and not allow_end):
+        raise ValueError(f"Index de liste hors limites : {index}")
+    return index
+
+
+def apply_patch(document, operations):
+    """Applique un patch JSON à une copie de `document` ; ValueError si une opération est invalide."""
+    document = copy.deepcopy(document)
+    if not isinstance(operations, list):
+        raise ValueError("Le patch doit être une liste d'opérations")
+
+    for operation in operations:
+        if not isinstance(operation, dict):
+            raise ValueError("Opération de patch invalide")
+        op = operation.get("op")
+        parts = _pointer(operation.get("path"))
+        if op not in ("add", "remove", "replace"):
+            raise ValueError(f"Opération de patch non supportée : {op!r}")
+        if op != "remove" and "value" not in operation:
+            raise ValueError(f"Valeur manquante pour '{op}'")
+        if not parts:
+            if op == "remove":
+                raise ValueError("Impossible de supprimer la racine")
+            document = copy.deepcopy(operation["value"])
+            continue
+
+        parent = document
+        for key in parts[:-1]:
+            if isinstance(parent, list):
+                parent = parent[_list_index(parent, key, allow_end=False)]
+            elif isinstance(parent, dict) and key in parent:
+                parent = parent[key]
+            else:
+                raise ValueError(f"Chemin introuvable : {operation['path']}")
+
+        key = parts[-1]
+        value = copy.deepcopy(operation.get("value"))
+        if isinstance(parent, list):
+            index = _list_index(parent, key, allow_end=(op == "add"))
+            if op == "add":
+                parent.insert(index, value)
+            elif op == "remove":
+                del parent[index]
+            else:
+                parent[index] = value
+        elif isinstance(parent, dict):
+            if op != "add" and key not in parent:
+                raise ValueError(f"Chemin introuvable : {operation['path']}")
+            if op == "remove":
+                del parent[key]
+            else:
+                parent[key] = value
+        else:
+            raise ValueError(f"Chemin introuvable : {operation['path']}")
+
+    return document
+
+
+def top_level_changes(old, new):
+    """(champs de premier niveau modifiés ou ajoutés, champs supprimés) entre deux sauvegardes."""
+    changes = {key: value for key, value in new.items() if key not in old or old[key] != value}
+    removed = [key for key in old if key not in new]
+    return changes, removed
+
+
+class SaveCache:
+    """LRU username -> (version, sauvegarde) des dernières sauvegardes Gun Merge vues par ce worker."""
+
+    def __init__(self, capacity=1000):
+        self.capacity = max(1, int(capacity))
+        self._lock = threading.Lock()
+        self._saves = OrderedDict()
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, username, version):
+        """Copie de la sauvegarde en cache si sa version est `version`, sinon None."""
+        with self._lock:
+            entry = self._saves.get(username)
+            if entry is None or entry[0] != version:
+                self._counters["misses"] += 1
+                return None
+            self._saves.move_to_end(username)
+            self._counters["hits"] += 1
+            return copy.deepcopy(entry[1])
+
+    def put(self, username, version, save):
+        if version is None:
+            return
+        with self._lock:
+            self._saves[username] = (version, copy.deepcopy(save))
+            self._saves.move_to_end(username)
+            while len(self._saves) > self.capacity:
+                self._saves.popitem(last=False)
+                self._counters["evictions"] += 1
+
+    def discard(self, username):
+        with self._lock:
+            self._saves.pop(username, None)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["size"] = len(self._saves)
+        return stats
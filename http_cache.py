@@ -0,0 +1,121 @@
+"""
+Réponses JSON mises en cache : instantané court côté serveur, ETag et compression.
+
+Une route "instantanée" construit son corps au plus une fois par clé et par
+période `ttl` (ou jusqu'à invalidation) ; le JSON est sérialisé une seule
+fois et son empreinte sert d'ETag. Un client qui renvoie cet ETag dans
+If-None-Match reçoit un 304 sans corps, sans accès base tant que
+l'instantané est valide. Les corps de plus de `min_compress_bytes` sont
+envoyés en brotli (si le module `brotli` est installé) ou en gzip selon
+Accept-Encoding, et la version compressée est gardée avec l'instantané.
+"""
+import gzip
+import hashlib
+import threading
+import time
+
+try:
+    import brotli
+except ImportError:  # Dépendance optionnelle : gzip uniquement
+    brotli = None
+
+
+class Snapshot:
+    """Corps JSON sérialisé, code HTTP, ETag et versions compressées (calculées à la demande)."""
+
+    def __init__(self, body, status, expires_at):
+        self.body = body
+        self.status = status
+        self.etag = '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+        self.expires_at = expires_at
+        self._encoded = {}
+
+    def encoded(self, encoding):
+        data = self._encoded.get(encoding)
+        if data is None:
+            if encoding == "br":
+                data = brotli.compress(self.body)
+            else:
+                data = gzip.compress(self.body, compresslevel=6, mtime=0)
+            self._encoded[encoding] = data
+        return data
+
+
+def etag_matches(header, etag):
+    """Vrai si l'en-tête If-None-Match désigne `etag` (comparaison faible, '*' accepté)."""
+    if not header:
+        return False
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def accepted_encoding(header):
+    """'br', 'gzip' ou None selon Accept-Encoding (q=0 exclut un codage)."""
+    accepted = {}
+    for part in (header or "").split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name.strip().lower()] = quality
+    if brotli is not None and accepted.get("br", 0) > 0:
+        return "br"
+    if accepted.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+
+class SnapshotCache:
+    """Instantanés par clé, valables `ttl` secondes ou jusqu'à invalidate()."""
+
+    def __init__(self, ttl=5.0):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._snapshots = {}
+        self._counters = {"builds": 0, "hits": 0, "invalidations": 0}
+
+    def get(self, key, build):
+        """(instantané de `key`, True s'il venait du cache).
+
+        `key` est un tuple dont le premier élément nomme la ressource.
+        `build()` renvoie (corps en octets, code HTTP) ; seuls les 200 sont gardés.
+        """
+        now = time.monotonic()
+        with self._lock:
+            snapshot = self._snapshots.get(key)
+            if snapshot is not None and snapshot.expires_at > now:
+                self._counters["hits"] += 1
+                return snapshot, True
+
+        body, status = build()
+        snapshot = Snapshot(body, status, now + self.ttl)
+        with self._lock:
+            self._counters["builds"] += 1
+            if status == 200:
+                # Un instantané par ressource : celui d'une ancienne clé (révision périmée) est remplacé
+                for stale in [k for k in self._snapshots if k[0] == key[0] and k != key]:
+                    del self._snapshots[stale]
+                self._snapshots[key] = snapshot
+        return snapshot, False
+
+    def invalidate(self, name):
+        """Oublie les instantanés de la ressource `name` (premier élément de la clé)."""
+        with self._lock:
+            stale = [key for key in self._snapshots if key[0] == name]
+            for key in stale:
+                del self._snapshots[key]
+            self._counters["invalidations"] += len(stale)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["size"] = len(self._snapshots)
+        return stats
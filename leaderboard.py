@@ -0,0 +1,121 @@
+"""
+Index en mémoire des meilleurs scores (top N) d'un jeu.
+
+Les meilleurs scores ne font qu'augmenter (max côté sauvegarde), donc garder
+les N premières lignes suffit : un joueur hors du top ne peut y entrer qu'en
+battant son record, ce que la route de sauvegarde signale via offer().
+Une réconciliation périodique contre la table corrige les écarts (sauvegardes
+reçues par un autre worker gunicorn, modifications manuelles en base...).
+"""
+import threading
+
+
+class LeaderboardIndex:
+    """Top `size` lignes d'une table, triées par `score_column` décroissant.
+
+    `loader(size)` renvoie les lignes du top telles que lues en base
+    (dicts contenant au moins "username" et `score_column`).
+    """
+
+    def __init__(self, score_column, loader, size=10):
+        self.score_column = score_column
+        self.loader = loader
+        self.size = size
+        self._lock = threading.Lock()
+        self._rows = []
+        self._loaded = False
+        # Lignes offertes pendant un rechargement (rejouées sur le top chargé)
+        self._reconciling = 0
+        self._offered_during_load = []
+        # Incrémenté à chaque changement du top (clé des instantanés HTTP, voir http_cache.py)
+        self.revision = 0
+        self._counters = {"reads": 0, "offers": 0, "inserts": 0, "reconciles": 0, "drift_corrections": 0}
+
+    def _score(self, row):
+        return int(row.get(self.score_column) or 0)
+
+    def _sort(self, rows):
+        return sorted(rows, key=lambda row: -self._score(row))[:self.size]
+
+    def reconcile(self):
+        """Recharge le top depuis la table. Renvoie True si l'index avait dérivé.
+
+        Une ligne offerte pendant la lecture peut manquer au résultat : elle
+        est réappliquée au top chargé avant qu'il ne remplace l'index.
+        """
+        with self._lock:
+            self._reconciling += 1
+        try:
+            loaded = [dict(row) for row in self.loader(self.size)]
+        except Exception:
+            with self._lock:
+                self._end_load()
+            raise
+        rows = self._sort(loaded)
+        with self._lock:
+            for row in self._offered_during_load:
+                rows = self._merge(rows, row) or rows
+            self._end_load()
+            drifted = self._loaded and rows != self._rows
+            if rows != self._rows:
+                self.revision += 1
+            self._rows = rows
+            self._loaded = True
+            self._counters["reconciles"] += 1
+            if drifted:
+                self._counters["drift_corrections"] += 1
+        return drifted
+
+    def _end_load(self):
+        self._reconciling -= 1
+        if not self._reconciling:
+            self._offered_during_load = []
+
+    def _merge(self, rows, row):
+        """Top `rows` avec `row` ; None si la ligne n'y a pas sa place."""
+        current = next((r for r in rows if r.get("username") == row.get("username")), None)
+        if current is not None:
+            # Joueur déjà classé : on rafraîchit ses colonnes sans baisser son score
+            if self._score(row) < self._score(current):
+                row = dict(row, **{self.score_column: current[self.score_column]})
+            rows = [r for r in rows if r is not current]
+        elif len(rows) >= self.size and self._score(row) <= self._score(rows[-1]):
+            return None
+        return self._sort(rows + [row])
+
+    def ensure_loaded(self):
+        """Charge le top depuis la table s'il ne l'a jamais été (ce chargement incrémente `revision`)."""
+        if not self._loaded:
+            self.reconcile()
+
+    def top(self):
+        """Renvoie une copie du top (chargé depuis la table au premier appel)."""
+        self.ensure_loaded()
+        with self._lock:
+            self._counters["reads"] += 1
+            return [dict(row) for row in self._rows]
+
+    def offer(self, row):
+        """Signale une ligne sauvegardée ; met à jour le top si elle y a sa place."""
+        row = dict(row)
+        with self._lock:
+            self._counters["offers"] += 1
+            if self._reconciling:
+                self._offered_during_load.append(row)
+            if not self._loaded:
+                return
+
+            is_new = all(r.get("username") != row.get("username") for r in self._rows)
+            rows = self._merge(self._rows, row)
+            if rows is None:
+                return
+            if is_new:
+                self._counters["inserts"] += 1
+            self._rows = rows
+            self.revision += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["entries"] = len(self._rows)
+        return stats
@@ -0,0 +1,106 @@
+"""
+Matchmaking des parties d'échecs, partagé par tous les workers via la base.
+
+Un joueur en attente est une ligne chess ouverte (black_player_id NULL),
+rafraîchie (waiting_seen_at) tant que son client consulte la partie. La
+fonction SQL find_or_create_chess_match apparie atomiquement : sous un verrou
+transactionnel, elle renvoie la partie ouverte du joueur s'il attend déjà,
+sinon rejoint la plus ancienne partie ouverte encore fraîche (FIFO), sinon
+crée la sienne. Deux joueurs servis par des workers différents se trouvent
+donc toujours, et une partie n'est jamais rejointe deux fois.
+
+Les attentes non rafraîchies depuis `timeout` secondes ne sont plus
+appariées (puis supprimées par le nettoyage, voir chess_archive.py).
+La profondeur de la file est comptée par un seul worker (verrou fichier).
+"""
+import threading
+import time
+from collections import OrderedDict, deque
+
+from sweeper import LeaderLock
+
+
+class Matchmaker:
+    """Appariement via `match_func(player_id)` et statistiques de ce worker.
+
+    `match_func` renvoie la ligne de find_or_create_chess_match (result,
+    game_uuid, white_player_id, black_player_id, fen_state, waited_seconds).
+    `touch_func(game_uuid)` rafraîchit une attente, `depth_func()` compte les
+    attentes fraîches.
+    """
+
+    def __init__(self, match_func, touch_func, depth_func, lock_path, timeout=60,
+                 latency_samples=1000, touched_capacity=10000):
+        self.match_func = match_func
+        self.touch_func = touch_func
+        self.depth_func = depth_func
+        self.timeout = timeout
+        self.leader = LeaderLock(lock_path)
+        self._lock = threading.Lock()
+        self._touched = OrderedDict()   # game_uuid -> dernier rafraîchissement envoyé (monotonic)
+        self._touched_capacity = touched_capacity
+        self._latencies = deque(maxlen=latency_samples)
+        self._depth = None
+        self._counters = {"created": 0, "joined": 0, "rejoined": 0, "touches": 0}
+
+    def pair_or_enqueue(self, player_id):
+        """Ligne renvoyée par la base ; result vaut "joined", "created" ou "waiting" (attente déjà en cours)."""
+        row = self.match_func(player_id)
+        with self._lock:
+            if row["result"] == "joined":
+                self._counters["joined"] += 1
+                self._latencies.append(float(row.get("waited_seconds") or 0))
+                self._touched.pop(row["game_uuid"], None)
+            elif row["result"] == "created":
+                self._counters["created"] += 1
+            else:
+                self._counters["rejoined"] += 1
+            if row["result"] != "joined":
+                self._remember_touch(row["game_uuid"], time.monotonic())
+        return row
+
+    def _remember_touch(self, game_uuid, now):
+        self._touched[game_uuid] = now
+        self._touched.move_to_end(game_uuid)
+        while len(self._touched) > self._touched_capacity:
+            self._touched.popitem(last=False)
+
+    def touch(self, game_uuid):
+        """Signale que le joueur en attente consulte encore sa partie.
+
+        L'écriture en base est limitée à une par tiers de `timeout` et par partie.
+        """
+        now = time.monotonic()
+        with self._lock:
+            last = self._touched.get(game_uuid)
+            if last is not None and now - last < self.timeout / 3:
+                return False
+            self._remember_touch(game_uuid, now)
+            self._counters["touches"] += 1
+        self.touch_func(game_uuid)
+        return True
+
+    def refresh_depth(self):
+        """Tâche périodique : compte les joueurs en attente (worker leader seulement)."""
+        if not self.leader.try_acquire():
+            return None
+        depth = self.depth_func()
+        with self._lock:
+            self._depth = depth
+        return depth
+
+    def depth(self):
+        """Dernière profondeur de file connue, None si ce worker ne la mesure pas."""
+        with self._lock:
+            return self._depth if self.leader.held else None
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["depth"] = self._depth if self.leader.held else None
+            latencies = sorted(self._latencies)
+        if latencies:
+            stats["pairing_latency_p50_s"] = round(latencies[len(latencies) // 2], 3)
+            stats["pairing_latency_p99_s"] = round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))], 3)
+            stats["pairing_latency_max_s"] = round(latencies[-1], 3)
+        return stats
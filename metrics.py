@@ -0,0 +1,304 @@
+"""
+Métriques au format texte Prometheus (/metrics), sans dépendance externe.
+
+- InstrumentedClient enveloppe le client de stockage : chaque execute()
+  enregistre table, opération, route Flask, durée, nombre de lignes et
+  taille (octets JSON) de la réponse.
+- app.py enregistre la durée et le code HTTP de chaque requête.
+
+Chaque worker gunicorn accumule ses métriques en mémoire (un verrou, des
+additions) et les dépose régulièrement dans METRICS_DIR/<pid>.json ;
+/metrics fusionne les fichiers des workers vivants pour exposer des totaux
+par déploiement.
+"""
+import inspect
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from flask import has_request_context, request
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_ACTIONS = ("select", "insert", "upsert", "update", "delete")
+
+
+def response_bytes(data):
+    """Taille en octets des données d'une réponse base, encodées en JSON compact (comme sur le réseau)."""
+    if data is None:
+        return 0
+    return len(json.dumps(data, separators=(",", ":"), ensure_ascii=False, default=str).encode("utf-8"))
+
+
+class Metrics:
+    """Compteurs, histogrammes et jauges (collecteurs) d'un process."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._help = {}
+        self._collectors = []
+
+    def describe(self, name, kind, help_text):
+        self._help[name] = (kind, help_text)
+
+    def inc(self, name, labels, value=1):
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        index = bisect_left(self.buckets, value)
+        key = (name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            histogram[0][index] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def register_collector(self, func):
+        """`func()` renvoie une liste de (nom, labels, valeur), évaluée à chaque export."""
+        self._collectors.append(func)
+
+    def snapshot(self):
+        """État sérialisable en JSON (fusionnable avec celui des autres workers)."""
+        gauges = []
+        for collector in self._collectors:
+            try:
+                gauges.extend([name, list(labels), value] for name, labels, value in collector())
+            except Exception as e:
+                print(f"[METRICS COLLECTOR ERROR] {e}")
+        with self._lock:
+            return {
+                "buckets": list(self.buckets),
+                "help": {name: list(info) for name, info in self._help.items()},
+                "counters": [[name, list(labels), value] for (name, labels), value in self._counters.items()],
+                "histograms": [
+                    [name, list(labels), list(h[0]), h[1], h[2]] for (name, labels), h in self._histograms.items()
+                ],
+                "gauges": gauges,
+            }
+
+
+def _labels_key(labels):
+    return tuple(tuple(pair) for pair in labels)
+
+
+def merge_snapshots(snapshots):
+    """Additionne les snapshots de plusieurs workers."""
+    merged = {"buckets": None, "help": {}, "counters": {}, "histograms": {}, "gauges": {}}
+    for snap in snapshots:
+        merged["buckets"] = merged["buckets"] or snap["buckets"]
+        merged["help"].update(snap.get("help", {}))
+        for name, labels, value in snap["counters"]:
+            key = (name, _labels_key(labels))
+            merged["counters"][key] = merged["counters"].get(key, 0) + value
+        for name, labels, value in snap.get("gauges", []):
+            key = (name, _labels_key(labels))
+            merged["gauges"][key] = merged["gauges"].get(key, 0) + value
+        for name, labels, counts, total, count in snap["histograms"]:
+            key = (name, _labels_key(labels))
+            current = merged["histograms"].get(key)
+            if current is None:
+                merged["histograms"][key] = [list(counts), total, count]
+            else:
+                current[0] = [a + b for a, b in zip(current[0], counts)]
+                current[1] += total
+                current[2] += count
+    return merged
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels, extra=None):
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+def render_prometheus(merged):
+    """Format d'exposition texte Prometheus 0.0.4."""
+    lines = []
+    families = {}
+    for kind, series in (("counter", merged["counters"]), ("gauge", merged["gauges"]),
+                         ("histogram", merged["histograms"])):
+        for (name, labels), value in sorted(series.items()):
+            families.setdefault((name, kind), []).append((labels, value))
+
+    buckets = merged["buckets"] or []
+    for (name, kind), samples in sorted(families.items()):
+        help_text = merged["help"].get(name, [kind, name])[1]
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            if kind != "histogram":
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+                continue
+            counts, total, count = value
+            cumulative = 0
+            for bound, bucket_count in zip(list(buckets) + ["+Inf"], counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{_format_labels(labels, ('le', bound))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+class WorkerMetricsStore:
+    """Dépôt des snapshots par worker dans un répertoire partagé."""
+
+    def __init__(self, metrics, directory):
+        self.metrics = metrics
+        self.directory = directory
+
+    def dump(self):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.metrics.snapshot(), f)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _alive(pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        return True
+
+    def collect(self):
+        """Snapshots de tous les workers vivants (celui-ci inclus, à jour)."""
+        own = self.metrics.snapshot()
+        snapshots = [own]
+        if not os.path.isdir(self.directory):
+            return snapshots
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            pid = int(name[:-5]) if name[:-5].isdigit() else None
+            path = os.path.join(self.directory, name)
+            if pid is None or pid == os.getpid():
+                continue
+            if not self._alive(pid):
+                # Worker arrêté : ses compteurs disparaissent (vu comme une remise à zéro)
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+                continue
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+    def render(self):
+        return render_prometheus(merge_snapshots(self.collect()))
+
+
+# ----------------------------------------------------------------------
+# --- INSTRUMENTATION DU CLIENT DE STOCKAGE ---
+# ----------------------------------------------------------------------
+# Route des requêtes servies hors de Flask (vues asynchrones de asgi.py)
+route_label = ContextVar("route_label", default=None)
+
+
+def current_route():
+    route = route_label.get()
+    if route is not None:
+        return route
+    if has_request_context():
+        return request.url_rule.rule if request.url_rule is not None else "unmatched"
+    return "background"
+
+
+class _InstrumentedQuery:
+    """Proxy d'un request builder : suit l'opération et mesure execute()."""
+
+    __slots__ = ("_target", "_metrics", "_table", "_operation")
+
+    def __init__(self, target, metrics, table, operation="select"):
+        self._target = target
+        self._metrics = metrics
+        self._table = table
+        self._operation = operation
+
+    def __getattr__(self, name):
+        value = getattr(self._target, name)
+        operation = name if name in _ACTIONS else self._operation
+        if not callable(value):
+            return _InstrumentedQuery(value, self._metrics, self._table, operation)
+
+        def call(*args, **kwargs):
+            return _InstrumentedQuery(value(*args, **kwargs), self._metrics, self._table, operation)
+        return call
+
+    def execute(self):
+        labels = (("table", self._table), ("operation", self._operation), ("route", current_route()))
+        started = time.perf_counter()
+        try:
+            response = self._target.execute()
+        except Exception:
+            self._record(labels, started, "error")
+            raise
+        if inspect.isawaitable(response):
+            # Client asynchrone : la mesure se fait quand la coroutine est attendue
+            return self._execute_async(response, labels, started)
+        self._record(labels, started, "ok", response)
+        return response
+
+    async def _execute_async(self, pending, labels, started):
+        try:
+            response = await pending
+        except Exception:
+            self._record(labels, started, "error")
+            raise
+        self._record(labels, started, "ok", response)
+        return response
+
+    def _record(self, labels, started, status, response=None):
+        self._metrics.observe("supabase_call_duration_seconds", labels, time.perf_counter() - started)
+        self._metrics.inc("supabase_calls_total", labels + (("status", status),))
+        if response is not None:
+            data = response.data
+            rows = len(data) if isinstance(data, list) else (1 if data is not None else 0)
+            self._metrics.inc("supabase_response_rows_total", labels, rows)
+            self._metrics.inc("supabase_response_bytes_total", labels, response_bytes(data))
+
+
+class InstrumentedClient:
+    """Enveloppe un client Supabase (ou SQLite) et mesure chaque aller-retour."""
+
+    def __init__(self, inner, metrics):
+        self._inner = inner
+        self._metrics = metrics
+        metrics.describe("supabase_calls_total", "counter", "Appels base par table, opération, route et statut.")
+        metrics.describe("supabase_call_duration_seconds", "histogram", "Durée des appels base.")
+        metrics.describe("supabase_response_rows_total", "counter", "Lignes renvoyées par les appels base.")
+        metrics.describe("supabase_response_bytes_total", "counter", "Taille (octets JSON) des réponses base.")
+
+    def table(self, name):
+        return _InstrumentedQuery(self._inner.table(name), self._metrics, name)
+
+    def from_(self, name):
+        return self.table(name)
+
+    def rpc(self, name, params=None):
+        return _InstrumentedQuery(self._inner.rpc(name, params), self._metrics, f"rpc:{name}", "rpc")
+
+    def __getattr__(self, name):
+        return getattr(self._inner, name)
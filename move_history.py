@@ -0,0 +1,90 @@
+"""
+Historique des coups d'échecs en binaire compact (colonne chess.moves_packed).
+
+Chaque coup UCI tient sur 16 bits (gros-boutiste) :
+    case de départ (6 bits) | case d'arrivée (6 bits) | promotion (4 bits)
+soit 2 octets par coup, contre ~7 pour '"e2e4",' dans un tableau JSON.
+Un coup s'ajoute en concaténant ses 2 octets (RPC save_chess_moves) :
+l'historique n'est plus renvoyé en entier à chaque coup. Le coup nul
+"0000" est codé 0 (a1a1 sans promotion, impossible autrement).
+
+Les lignes encore au format JSON (moves_list) sont relues telles quelles ;
+la première écriture complète les convertit (voir supabase_functions.sql
+pour la migration en bloc).
+"""
+import base64
+import binascii
+
+_FILES = "abcdefgh"
+_PROMOTIONS = ("", "n", "b", "r", "q")
+
+
+def _square(name):
+    file, rank = name[0], name[1]
+    if file not in _FILES or rank not in "12345678":
+        raise ValueError(f"Case invalide : {name!r}")
+    return (int(rank) - 1) * 8 + _FILES.index(file)
+
+
+def _square_name(index):
+    return _FILES[index % 8] + str(index // 8 + 1)
+
+
+def encode_move(uci):
+    """Code 16 bits d'un coup UCI ('e2e4', 'a7a8q', '0000')."""
+    if uci == "0000":
+        return 0
+    if len(uci) not in (4, 5) or (len(uci) == 5 and uci[4] not in _PROMOTIONS[1:]):
+        raise ValueError(f"Coup UCI invalide : {uci!r}")
+    promotion = _PROMOTIONS.index(uci[4]) if len(uci) == 5 else 0
+    return _square(uci[0:2]) << 10 | _square(uci[2:4]) << 4 | promotion
+
+
+def decode_move(code):
+    if code == 0:
+        return "0000"
+    promotion = code & 0xF
+    if promotion >= len(_PROMOTIONS):
+        raise ValueError(f"Code de coup invalide : {code}")
+    return _square_name(code >> 10) + _square_name((code >> 4) & 0x3F) + _PROMOTIONS[promotion]
+
+
+def pack_moves(moves):
+    """Liste de coups UCI -> octets (2 par coup)."""
+    return b"".join(encode_move(uci).to_bytes(2, "big") for uci in moves)
+
+
+def unpack_moves(data):
+    """Octets -> liste de coups UCI."""
+    if len(data) % 2:
+        raise ValueError("Historique binaire tronqué")
+    return [decode_move(int.from_bytes(data[i:i + 2], "big")) for i in range(0, len(data), 2)]
+
+
+def to_base64(data):
+    """Forme transmise aux fonctions RPC (paramètre texte)."""
+    return base64.b64encode(data).decode("ascii")
+
+
+def column_bytes(value):
+    """Contenu de moves_packed tel que renvoyé par la base.
+
+    PostgREST renvoie un bytea en hexadécimal ('\\x0c1c...'), SQLite des
+    octets ; le base64 est aussi accepté. None ou vide -> b"".
+    """
+    if not value:
+        return b""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value)
+    if value.startswith("\\x"):
+        return binascii.unhexlify(value[2:])
+    return base64.b64decode(value)
+
+
+def row_moves(row):
+    """Coups UCI d'une ligne chess : moves_packed, sinon l'ancien tableau JSON moves_list."""
+    packed = column_bytes(row.get("moves_packed"))
+    if packed:
+        return unpack_moves(packed)
+    legacy = row.get("moves_list")
+    return list(legacy) if isinstance(legacy, list) else []
@@ -0,0 +1,211 @@
+"""
+Présence des joueurs, tenue en mémoire.
+
+- PresenceRegistry répond à "qui est en ligne" / "X est-il en ligne" sans
+  lire la table Player.
+- PresenceBuffer (write-behind) : au lieu d'un UPDATE Player par requête,
+  chaque battement est mis en tampon ; un thread en écrit un instantané par
+  lots toutes les quelques secondes.
+"""
+import heapq
+import threading
+import time
+from datetime import datetime, timezone
+
+
+class PresenceBuffer:
+    """Regroupe les last_seen par ID de joueur et les écrit par lots.
+
+    `flush_func(batch)` reçoit une liste de tuples (player_id, last_seen_iso)
+    d'au plus `batch_size` éléments et effectue l'écriture en base.
+    """
+
+    def __init__(self, flush_func, batch_size=500):
+        self.flush_func = flush_func
+        self.batch_size = max(1, int(batch_size))
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._counters = {
+            "heartbeats": 0,      # battements reçus
+            "coalesced": 0,       # battements fusionnés avec un battement déjà en attente
+            "flushed_rows": 0,    # lignes effectivement écrites
+            "flush_batches": 0,   # requêtes d'écriture envoyées
+            "flush_errors": 0,
+        }
+
+    def record(self, player_id, when=None):
+        """Enregistre un battement pour `player_id` (aucun accès base)."""
+        when = when or datetime.now(timezone.utc).isoformat()
+        with self._lock:
+            if player_id in self._pending:
+                self._counters["coalesced"] += 1
+            self._pending[player_id] = when
+            self._counters["heartbeats"] += 1
+
+    def discard(self, player_id):
+        """Oublie un battement en attente (ex : déconnexion explicite)."""
+        with self._lock:
+            self._pending.pop(player_id, None)
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self):
+        """Écrit tous les battements en attente, par lots de `batch_size`."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+
+        items = list(pending.items())
+        for start in range(0, len(items), self.batch_size):
+            batch = items[start:start + self.batch_size]
+            try:
+                self.flush_func(batch)
+            except Exception as e:
+                print(f"[PRESENCE FLUSH ERROR] {len(batch)} joueurs non écrits: {e}")
+                with self._lock:
+                    self._counters["flush_errors"] += 1
+                    # On remet le lot en attente sans écraser un battement plus récent
+                    for player_id, when in batch:
+                        self._pending.setdefault(player_id, when)
+                continue
+            with self._lock:
+                self._counters["flushed_rows"] += len(batch)
+                self._counters["flush_batches"] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["pending"] = len(self._pending)
+        return stats
+
+
+def _timestamp(value):
+    """Horodatage epoch d'un last_seen ISO 8601 (format Supabase ou isoformat())."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
+def _isoformat(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat()
+
+
+class PresenceRegistry:
+    """Joueurs en ligne (dernier battement depuis moins de `timeout` secondes), en mémoire.
+
+    `_last_seen` associe chaque joueur en ligne à l'horodatage de son dernier
+    battement ; `_expiry` est un tas (horodatage, ID) qui permet d'expirer les
+    joueurs les plus anciens en O(log n) chacun. Un nouveau battement empile
+    une nouvelle entrée : les anciennes, périmées, sont ignorées au dépilage.
+
+    `loader(since_iso)` renvoie les (ID, last_seen) des joueurs 'online' en
+    base depuis `since_iso` : la réconciliation périodique y ajoute les
+    battements reçus par les autres workers (après leur flush).
+    """
+
+    def __init__(self, timeout, loader=None):
+        self.timeout = timeout
+        self.loader = loader
+        self._lock = threading.Lock()
+        self._last_seen = {}
+        self._expiry = []
+        self._counters = {"heartbeats": 0, "expired": 0, "removed": 0, "reconciles": 0, "reconciled_rows": 0}
+
+    def _touch(self, player_id, timestamp):
+        # Précision ramenée à celle du last_seen ISO : un curseur relu en texte retombe sur la même clé
+        timestamp = _timestamp(_isoformat(timestamp))
+        if timestamp <= self._last_seen.get(player_id, float("-inf")):
+            return
+        self._last_seen[player_id] = timestamp
+        heapq.heappush(self._expiry, (timestamp, player_id))
+
+    def touch(self, player_id, when=None):
+        """Battement de `player_id` (horodatage epoch, maintenant par défaut)."""
+        timestamp = time.time() if when is None else when
+        with self._lock:
+            self._counters["heartbeats"] += 1
+            self._touch(player_id, timestamp)
+
+    def remove(self, player_id):
+        """Retire un joueur (déconnexion explicite) ; son entrée du tas devient périmée."""
+        with self._lock:
+            if self._last_seen.pop(player_id, None) is not None:
+                self._counters["removed"] += 1
+
+    def expire(self, now=None):
+        """Retire les joueurs sans battement depuis `timeout`. Renvoie leurs IDs."""
+        cutoff = (time.time() if now is None else now) - self.timeout
+        expired = []
+        with self._lock:
+            while self._expiry and self._expiry[0][0] < cutoff:
+                timestamp, player_id = heapq.heappop(self._expiry)
+                if self._last_seen.get(player_id) == timestamp:
+                    del self._last_seen[player_id]
+                    expired.append(player_id)
+            # Les entrées périmées (battements remplacés) ne sortent qu'à leur expiration :
+            # on reconstruit le tas s'il en contient trop
+            if len(self._expiry) > 2 * len(self._last_seen) + 64:
+                self._expiry = [(timestamp, player_id) for player_id, timestamp in self._last_seen.items()]
+                heapq.heapify(self._expiry)
+            self._counters["expired"] += len(expired)
+        return expired
+
+    def reconcile(self):
+        """Expire les joueurs inactifs puis fusionne les joueurs en ligne lus en base."""
+        self.expire()
+        if self.loader is None:
+            return 0
+        rows = [(player_id, _timestamp(last_seen))
+                for player_id, last_seen in self.loader(_isoformat(time.time() - self.timeout)) if last_seen]
+        with self._lock:
+            for player_id, timestamp in rows:
+                self._touch(player_id, timestamp)
+            self._counters["reconciles"] += 1
+            self._counters["reconciled_rows"] += len(rows)
+        return len(rows)
+
+    def last_seen(self, player_id):
+        """Horodatage epoch du dernier battement si le joueur est en ligne, sinon None."""
+        with self._lock:
+            timestamp = self._last_seen.get(player_id)
+        if timestamp is None or timestamp < time.time() - self.timeout:
+            return None
+        return timestamp
+
+    def is_online(self, player_id):
+        return self.last_seen(player_id) is not None
+
+    def online(self, after=None, limit=None):
+        """Joueurs en ligne [(ID, last_seen ISO)], du battement le plus récent au plus ancien (puis par ID).
+
+        `after` = (last_seen ISO, ID) : reprend strictement après ce joueur
+        (même ordre que get_all_players_status).
+        """
+        self.expire()
+        with self._lock:
+            keys = [(-timestamp, player_id) for player_id, timestamp in self._last_seen.items()]
+        if after is not None:
+            after_key = (-_timestamp(after[0]), after[1])
+            keys = [key for key in keys if key > after_key]
+        # Seule la page demandée est triée : O(n log limit) au lieu d'un tri complet par page
+        keys = sorted(keys) if limit is None else heapq.nsmallest(limit, keys)
+        return [(player_id, _isoformat(-timestamp)) for timestamp, player_id in keys]
+
+    def online_ids(self):
+        self.expire()
+        with self._lock:
+            return set(self._last_seen)
+
+    def count(self):
+        self.expire()
+        with self._lock:
+            return len(self._last_seen)
+
+    def stats(self):
+        self.expire()
+        with self._lock:
+            stats = dict(self._counters)
+            stats["online"] = len(self._last_seen)
+            stats["heap_entries"] = len(self._expiry)
+        return stats
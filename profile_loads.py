@@ -0,0 +1,89 @@
+"""
+Chargements Gun_Merge et FDPiece, partagés par les routes Flask (app.py) et
+les vues asynchrones (asgi.py).
+
+La ligne du joueur est lue, et créée avec ses valeurs par défaut si elle
+n'existe pas encore. Seul l'accès base diffère entre les deux modes de
+service : load_or_create() prend le client synchrone, load_or_create_async()
+le client asynchrone ; colonnes, ligne par défaut et mise en forme des
+réponses sont définies une seule fois ici.
+"""
+from gun_merge_saves import new_save_version
+
+GUN_MERGE_LOAD_COLUMNS = "save, save_version"
+FDPIECE_LOAD_COLUMNS = "Time, FDPiece, Pass, Abonnement"
+
+
+def load_or_create(db, table, columns, username, new_row):
+    """(ligne, créée) : ligne `username` de `table`, insérée via new_row(username) si absente."""
+    response = db.table(table).select(columns).eq("username", username).limit(1).execute()
+    if response.data:
+        return response.data[0], False
+    row = new_row(username)
+    db.table(table).insert(row).execute()
+    return row, True
+
+
+async def load_or_create_async(db, table, columns, username, new_row):
+    """Comme load_or_create, avec un client de stockage asynchrone."""
+    response = await db.table(table).select(columns).eq("username", username).limit(1).execute()
+    if response.data:
+        return response.data[0], False
+    row = new_row(username)
+    await db.table(table).insert(row).execute()
+    return row, True
+
+
+# ----------------------------------------------------------------------
+# --- GUN MERGE ---
+# ----------------------------------------------------------------------
+def gun_merge_default_save():
+    """Sauvegarde créée au premier chargement Gun Merge."""
+    return {
+        "xp": 0,
+        "money": 1,
+        "buyPrice": 1,
+        "inventory": [None, None, None, None, None],
+        "currentLevel": 1
+    }
+
+
+def gun_merge_new_row(username):
+    return {"username": username, "save": gun_merge_default_save(), "save_version": new_save_version()}
+
+
+def gun_merge_load_body(username, row, save_cache):
+    """Réponse de chargement Gun Merge ; la sauvegarde lue devient la base des patchs suivants."""
+    save_cache.put(username, row.get("save_version"), row["save"])
+    return {
+        "status": "success",
+        "data": row["save"],
+        "version": row.get("save_version")
+    }, 200
+
+
+# ----------------------------------------------------------------------
+# --- FDPIECE ---
+# ----------------------------------------------------------------------
+def fdpiece_new_row(username):
+    return {"username": username, "Time": 0, "FDPiece": 0}
+
+
+def fdpiece_sections_body(row, created=False):
+    """Sections get_time_FDPrice, get_evo_pass et get_sub du profil."""
+    if created:
+        return {
+            "time_fdprice": ({"status": "created", "Time": 0, "FDPiece": 0}, 200),
+            "evo_pass": ({"status": "success", "Pass": 0}, 200),
+            "sub": ({"status": "success", "Abonnement": None}, 200),
+        }
+
+    return {
+        "time_fdprice": ({
+            "status": "success",
+            "Time": int(row.get("Time", 0)),
+            "FDPiece": int(row.get("FDPiece", 0))
+        }, 200),
+        "evo_pass": ({"status": "success", "Pass": row.get("Pass", 0)}, 200),
+        "sub": ({"status": "success", "Abonnement": row.get("Abonnement")}, 200),
+    }
@@ -0,0 +1,39 @@
+"""
+Jetons de session signés et sans état.
+
+/login émet un jeton (itsdangerous, HMAC-SHA1 + horodatage) qui contient
+l'ID du joueur. Les requêtes suivantes l'envoient dans l'en-tête
+`Authorization: Bearer <jeton>` : la vérification ne coûte qu'un HMAC, sans
+accès base ni lecture du corps, et le hachage du mot de passe (PBKDF2) n'est
+calculé qu'au login.
+
+Le secret (SESSION_SECRET) doit être le même sur tous les workers ; sans
+lui (et hors SESSION_DEV_MODE), app.py n'émet ni ne vérifie de jeton. Un
+jeton reste valide jusqu'à son expiration (pas de révocation côté serveur).
+"""
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+
+class SessionTokens:
+    def __init__(self, secret, max_age):
+        self.max_age = max_age
+        self._serializer = URLSafeTimedSerializer(secret, salt="project_3_api.session")
+
+    def issue(self, player_id):
+        return self._serializer.dumps({"id": player_id})
+
+    def verify(self, token):
+        """ID du joueur si le jeton est valide et non expiré, sinon None."""
+        try:
+            payload = self._serializer.loads(token, max_age=self.max_age)
+        except BadSignature:  # SignatureExpired en hérite
+            return None
+        return payload.get("id") if isinstance(payload, dict) else None
+
+    @staticmethod
+    def from_header(value):
+        """Jeton extrait d'un en-tête Authorization ("Bearer <jeton>"), sinon None."""
+        scheme, _, token = (value or "").partition(" ")
+        if scheme.lower() != "bearer" or not token.strip():
+            return None
+        return token.strip()
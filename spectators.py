@@ -0,0 +1,108 @@
+"""
+Flux spectateur des parties d'échecs : un instantané partagé par partie.
+
+Tous les spectateurs d'une partie lisent le même instantané (FEN, coups,
+abandon...), construit une seule fois par version de la partie (voir
+game_events.py) et déjà sérialisé (http_cache.Snapshot : ETag, compression).
+Un seul thread le reconstruit à chaque changement, les autres attendent son
+résultat : la charge sur la base ne dépend pas du nombre de spectateurs.
+
+Le nombre de spectateurs connectés (requêtes en attente ou flux SSE ouverts)
+est suivi par partie.
+"""
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from http_cache import Snapshot
+
+
+class SpectatorFeed:
+    """LRU game_uuid -> (version, Snapshot) et compteur de spectateurs par partie.
+
+    `build(game_uuid, event, previous)` renvoie (corps, corps sérialisé en
+    octets) pour l'état `event` (instantané de GameEventHub) ; `previous` est
+    le dernier corps construit ou None, pour une construction incrémentale.
+    """
+
+    def __init__(self, build, capacity=1000):
+        self.build = build
+        self.capacity = max(1, int(capacity))
+        self._lock = threading.Lock()
+        self._snapshots = OrderedDict()
+        self._build_locks = {}
+        self._viewers = {}
+        self._counters = {"builds": 0, "hits": 0, "evictions": 0}
+
+    def get(self, game_uuid, event):
+        """(Snapshot de la version event["version"], True s'il était déjà construit)."""
+        version = event["version"]
+        with self._lock:
+            entry = self._snapshots.get(game_uuid)
+            if entry is not None and entry[0] >= version:
+                self._snapshots.move_to_end(game_uuid)
+                self._counters["hits"] += 1
+                return entry[1], True
+            build_lock = self._build_locks.setdefault(game_uuid, threading.Lock())
+
+        # Un seul constructeur par partie : les autres spectateurs attendent puis relisent
+        with build_lock:
+            with self._lock:
+                entry = self._snapshots.get(game_uuid)
+                if entry is not None and entry[0] >= version:
+                    self._counters["hits"] += 1
+                    return entry[1], True
+            body, data = self.build(game_uuid, event, entry[2] if entry is not None else None)
+            snapshot = Snapshot(data, 200, float("inf"))
+            with self._lock:
+                self._counters["builds"] += 1
+                self._snapshots[game_uuid] = (version, snapshot, body)
+                self._snapshots.move_to_end(game_uuid)
+                self._evict()
+        return snapshot, False
+
+    def _evict(self):
+        # On évince les parties les plus anciennes sans spectateur connecté
+        while len(self._snapshots) > self.capacity:
+            for candidate in self._snapshots:
+                if candidate not in self._viewers:
+                    del self._snapshots[candidate]
+                    self._build_locks.pop(candidate, None)
+                    self._counters["evictions"] += 1
+                    break
+            else:
+                return
+
+    def forget(self, game_uuid):
+        with self._lock:
+            self._snapshots.pop(game_uuid, None)
+            if game_uuid not in self._viewers:
+                self._build_locks.pop(game_uuid, None)
+
+    @contextmanager
+    def watch(self, game_uuid):
+        """Compte un spectateur connecté à `game_uuid` pendant le bloc."""
+        with self._lock:
+            self._viewers[game_uuid] = self._viewers.get(game_uuid, 0) + 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._viewers[game_uuid] -= 1
+                if not self._viewers[game_uuid]:
+                    del self._viewers[game_uuid]
+
+    def viewers(self, game_uuid=None):
+        """Spectateurs connectés à une partie, ou {game_uuid: nombre} pour toutes."""
+        with self._lock:
+            if game_uuid is not None:
+                return self._viewers.get(game_uuid, 0)
+            return dict(self._viewers)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["games"] = len(self._snapshots)
+            stats["watched_games"] = len(self._viewers)
+            stats["viewers"] = sum(self._viewers.values())
+        return stats
@@ -0,0 +1,781 @@
+"""
+Couche de stockage : choix du backend utilisé par app.py.
+
+Les routes utilisent l'API fluide du client Supabase
+(`table(...).select(...).eq(...).execute()`). Deux backends l'implémentent :
+
+- "supabase" (défaut) : le vrai client, SUPABASE_URL / SUPABASE_KEY requis ;
+- "sqlite" : une base SQLite embarquée (SQLITE_PATH, ":memory:" accepté) qui
+  reproduit le sous-ensemble utilisé par app.py avec la même sémantique
+  (upsert on_conflict, erreur PGRST116 de .single(), colonnes JSON).
+
+Le backend se choisit avec STORAGE_BACKEND, ce qui permet de mesurer le débit
+hors ligne et de comparer les deux. SQLITE_LATENCY_MS ajoute une latence
+réseau simulée à chaque appel SQLite.
+
+create_async_storage() fournit l'équivalent asynchrone (execute() à attendre)
+pour le mode de service ASGI (asgi.py).
+"""
+import asyncio
+import base64
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from supabase import PostgrestAPIError, acreate_client, create_client
+
+# ----------------------------------------------------------------------
+# --- SCHÉMA DES TABLES (backend SQLite) ---
+# ----------------------------------------------------------------------
+# Colonnes stockées en JSON (jsonb côté Supabase)
+JSON_COLUMNS = {
+    "Player": {"friends"},
+    "Casino": {"success"},
+    "Gun_Merge": {"save"},
+    "chess": {"moves_list", "premoves"},
+}
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS "Player" (
+    "ID" TEXT PRIMARY KEY,
+    "Password" TEXT,
+    "Status" TEXT NOT NULL DEFAULT '🔴 offline',
+    "last_seen" TEXT,
+    "friends" TEXT DEFAULT '[]',
+    "Sanction" TEXT
+);
+CREATE INDEX IF NOT EXISTS "Player_status_last_seen" ON "Player" ("Status", "last_seen" DESC, "ID");
+CREATE INDEX IF NOT EXISTS "Player_last_seen" ON "Player" ("last_seen" DESC, "ID");
+CREATE TABLE IF NOT EXISTS "Skull_Arena_DataBase" (
+    "username" TEXT PRIMARY KEY,
+    "Best_Vague" INTEGER DEFAULT 0,
+    "Crane" INTEGER DEFAULT 0,
+    "UP_Degat" INTEGER DEFAULT 0,
+    "UP_Portée" INTEGER DEFAULT 0,
+    "UP_Vitesse" INTEGER DEFAULT 0,
+    "UP_Cadence" INTEGER DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS "Astro_Dodge" (
+    "username" TEXT PRIMARY KEY,
+    "PR_Score" INTEGER DEFAULT 0,
+    "Coins" INTEGER DEFAULT 0,
+    "Voiture" TEXT DEFAULT 'Standard'
+);
+CREATE TABLE IF NOT EXISTS "Stickman_Runner" (
+    "username" TEXT PRIMARY KEY,
+    "best_score" INTEGER DEFAULT 0,
+    "credit" INTEGER DEFAULT 0,
+    "grade" TEXT DEFAULT ''
+);
+CREATE TABLE IF NOT EXISTS "chess" (
+    "uuid" TEXT PRIMARY KEY,
+    "created_at" TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now')),
+    "fen_state" TEXT,
+    "white_player_id" TEXT,
+    "black_player_id" TEXT,
+    "joueurs" TEXT,
+    "moves_list" TEXT DEFAULT '[]',
+    "moves_packed" BLOB,
+    "premove_player" TEXT,
+    "premoves" TEXT,
+    "abandon" TEXT,
+    "finished_at" TEXT,
+    "waiting_seen_at" TEXT
+);
+CREATE INDEX IF NOT EXISTS "chess_finished_at" ON "chess" ("finished_at") WHERE "finished_at" IS NOT NULL;
+CREATE INDEX IF NOT EXISTS "chess_waiting" ON "chess" ("created_at", "uuid") WHERE "black_player_id" IS NULL;
+CREATE INDEX IF NOT EXISTS "chess_waiting_seen_at" ON "chess" ("waiting_seen_at") WHERE "black_player_id" IS NULL;
+CREATE TABLE IF NOT EXISTS "chess_archive" (
+    "game_uuid" TEXT PRIMARY KEY,
+    "white_player_id" TEXT,
+    "black_player_id" TEXT,
+    "result" TEXT,
+    "termination" TEXT,
+    "plies" INTEGER,
+    "pgn_zlib" BLOB,
+    "created_at" TEXT,
+    "finished_at" TEXT,
+    "archived_at" TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now'))
+);
+CREATE TABLE IF NOT EXISTS "Casino" (
+    "username" TEXT PRIMARY KEY,
+    "money" INTEGER DEFAULT 0,
+    "success" TEXT DEFAULT '{}'
+);
+CREATE TABLE IF NOT EXISTS "Gun_Merge" (
+    "username" TEXT PRIMARY KEY,
+    "save" TEXT,
+    "gain_HL" TEXT,
+    "last_claim" INTEGER DEFAULT 0,
+    "income_per_sec" REAL DEFAULT 0,
+    "save_version" TEXT
+);
+CREATE TABLE IF NOT EXISTS "Play_Count" (
+    "name" TEXT PRIMARY KEY,
+    "counter" INTEGER DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS "Last_Maj" (
+    "Version" INTEGER PRIMARY KEY,
+    "Title" TEXT,
+    "Description" TEXT
+);
+CREATE TABLE IF NOT EXISTS "FDPiece" (
+    "username" TEXT PRIMARY KEY,
+    "Time" INTEGER DEFAULT 0,
+    "FDPiece" INTEGER DEFAULT 0,
+    "Pass" INTEGER DEFAULT 0,
+    "Abonnement" TEXT
+);
+
+-- Équivalent du trigger Supabase : gain_HL est horodaté quand 'save' change
+CREATE TRIGGER IF NOT EXISTS gun_merge_gain_hl_insert AFTER INSERT ON "Gun_Merge"
+BEGIN
+    UPDATE "Gun_Merge" SET "gain_HL" = strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now')
+    WHERE "username" = NEW."username";
+END;
+CREATE TRIGGER IF NOT EXISTS gun_merge_gain_hl_update AFTER UPDATE OF "save" ON "Gun_Merge"
+WHEN NEW."save" IS NOT OLD."save"
+BEGIN
+    UPDATE "Gun_Merge" SET "gain_HL" = strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now')
+    WHERE "username" = NEW."username";
+END;
+"""
+
+
+# ----------------------------------------------------------------------
+# --- FONCTIONS RPC (équivalents SQLite de supabase_functions.sql) ---
+# ----------------------------------------------------------------------
+def _increment_play_count(connection, game_name, amount):
+    row = connection.execute(
+        'UPDATE "Play_Count" SET "counter" = COALESCE("counter", 0) + ? WHERE "name" = ? RETURNING "counter"',
+        (amount, game_name),
+    ).fetchone()
+    return row["counter"] if row else None
+
+
+def _record_presence_batch(connection, heartbeats):
+    cursor = connection.executemany(
+        'UPDATE "Player" SET "Status" = \'🟢 online\', "last_seen" = ? WHERE "ID" = ?',
+        [(heartbeat["last_seen"], heartbeat["id"]) for heartbeat in heartbeats],
+    )
+    return cursor.rowcount
+
+
+BEST_SCORE_TABLES = ("Skull_Arena_DataBase", "Astro_Dodge", "Stickman_Runner")
+
+
+def _save_best_score(connection, table_name, score_column, payload):
+    if table_name not in BEST_SCORE_TABLES:
+        raise ValueError(f"save_best_score: table {table_name} non autorisée")
+    columns = list(payload)
+    assignments = ", ".join(
+        f"{_quote(column)} = MAX(COALESCE(t.{_quote(column)}, 0), excluded.{_quote(column)})"
+        if column == score_column else f"{_quote(column)} = excluded.{_quote(column)}"
+        for column in columns
+    )
+    row = connection.execute(
+        f"INSERT INTO {_quote(table_name)} AS t ({', '.join(_quote(c) for c in columns)}) "
+        f"VALUES ({', '.join('?' for _ in columns)}) "
+        f'ON CONFLICT ("username") DO UPDATE SET {assignments} RETURNING {_quote(score_column)}',
+        [payload[c] for c in columns],
+    ).fetchone()
+    return row[0] if row else None
+
+
+def _claim_hl_income(connection, p_username, min_seconds):
+    row = connection.execute(
+        'SELECT "gain_HL", "income_per_sec", "last_claim" FROM "Gun_Merge" WHERE "username" = ?',
+        (p_username,),
+    ).fetchone()
+    if row is None:
+        return []
+    result = dict(row, claimed=False)
+    limit = datetime.now(timezone.utc) - timedelta(seconds=min_seconds)
+    if row["last_claim"] != 1 and row["gain_HL"] and datetime.fromisoformat(row["gain_HL"]) <= limit:
+        connection.execute('UPDATE "Gun_Merge" SET "last_claim" = 1 WHERE "username" = ?', (p_username,))
+        result.update(last_claim=1, claimed=True)
+    return [result]
+
+
+def _patch_gun_merge_save(connection, p_username, base_version, new_version, changes, removed, income):
+    row = connection.execute(
+        'SELECT "save" FROM "Gun_Merge" WHERE "username" = ? AND "save_version" = ?',
+        (p_username, base_version),
+    ).fetchone()
+    if row is None:
+        return None
+    save = json.loads(row["save"]) if row["save"] else {}
+    for key in removed or []:
+        save.pop(key, None)
+    save.update(changes)
+    connection.execute(
+        'UPDATE "Gun_Merge" SET "save" = ?, "save_version" = ?, "last_claim" = 0, '
+        '"income_per_sec" = COALESCE(?, "income_per_sec") WHERE "username" = ?',
+        (json.dumps(save), new_version, income, p_username),
+    )
+    return new_version
+
+
+def _save_chess_moves(connection, p_game_uuid, fen, stored_bytes, moves, p_finished_at=None, p_premoves=None):
+    row = connection.execute(
+        'SELECT "moves_packed", "premove_player", "premoves" FROM "chess" WHERE "uuid" = ? AND "abandon" IS NULL',
+        (p_game_uuid,),
+    ).fetchone()
+    current = bytes(row["moves_packed"] or b"") if row else None
+    if current is None or len(current) != (stored_bytes or 0):
+        return None
+    packed = current + base64.b64decode(moves)
+    premoves = p_premoves if p_premoves is not None else json.loads(row["premoves"] or "[]")
+    premove_player = row["premove_player"]
+    if p_finished_at is not None:
+        premoves = []
+    if not premoves:
+        premove_player = None
+    connection.execute(
+        'UPDATE "chess" SET "fen_state" = ?, "moves_packed" = ?, '
+        '"moves_list" = CASE WHEN ? IS NULL THEN \'[]\' ELSE "moves_list" END, '
+        '"finished_at" = COALESCE(?, "finished_at"), "premove_player" = ?, "premoves" = ? WHERE "uuid" = ?',
+        (fen, packed, stored_bytes, p_finished_at, premove_player, json.dumps(premoves) if premoves else None,
+         p_game_uuid),
+    )
+    return {"moves_bytes": len(packed), "premove_player": premove_player, "premoves": premoves}
+
+
+def _find_or_create_chess_match(connection, p_player_id, p_game_uuid, p_fen, wait_timeout):
+    # La transaction de SQLiteClient.call sérialise les appels (équivalent du verrou consultatif)
+    now = datetime.now(timezone.utc)
+    now_iso = now.isoformat()
+    own = connection.execute(
+        'SELECT * FROM "chess" WHERE "black_player_id" IS NULL AND "white_player_id" = ? '
+        'ORDER BY "created_at" DESC LIMIT 1',
+        (p_player_id,),
+    ).fetchone()
+    if own is not None:
+        connection.execute('UPDATE "chess" SET "waiting_seen_at" = ? WHERE "uuid" = ?', (now_iso, own["uuid"]))
+        return [{"result": "waiting", "game_uuid": own["uuid"], "white_player_id": p_player_id,
+                 "black_player_id": None, "fen_state": own["fen_state"], "waited_seconds": 0.0}]
+
+    fresh_after = (now - timedelta(seconds=wait_timeout)).isoformat()
+    open_game = connection.execute(
+        'SELECT * FROM "chess" WHERE "black_player_id" IS NULL AND "white_player_id" != ? '
+        'AND COALESCE("waiting_seen_at", "created_at") >= ? ORDER BY "created_at", "uuid" LIMIT 1',
+        (p_player_id, fresh_after),
+    ).fetchone()
+    if open_game is not None:
+        connection.execute(
+            'UPDATE "chess" SET "black_player_id" = ?, "joueurs" = "white_player_id" || \',\' || ?, '
+            '"waiting_seen_at" = NULL WHERE "uuid" = ?',
+            (p_player_id, p_player_id, open_game["uuid"]),
+        )
+        waited = (now - datetime.fromisoformat(open_game["created_at"])).total_seconds()
+        return [{"result": "joined", "game_uuid": open_game["uuid"], "white_player_id": open_game["white_player_id"],
+                 "black_player_id": p_player_id, "fen_state": open_game["fen_state"], "waited_seconds": waited}]
+
+    connection.execute(
+        'INSERT INTO "chess" ("uuid", "created_at", "fen_state", "white_player_id", "black_player_id", "joueurs", '
+        '"moves_list", "waiting_seen_at") VALUES (?, ?, ?, ?, NULL, ?, \'[]\', ?)',
+        (p_game_uuid, now_iso, p_fen, p_player_id, p_player_id, now_iso),
+    )
+    return [{"result": "created", "game_uuid": p_game_uuid, "white_player_id": p_player_id,
+             "black_player_id": None, "fen_state": p_fen, "waited_seconds": 0.0}]
+
+
+def _archive_chess_games(connection, games):
+    for game in games:
+        connection.execute(
+            'INSERT INTO "chess_archive" ("game_uuid", "white_player_id", "black_player_id", "result", '
+            '"termination", "plies", "pgn_zlib", "created_at", "finished_at") '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT ("game_uuid") DO NOTHING',
+            (game["uuid"], game.get("white_player_id"), game.get("black_player_id"), game.get("result"),
+             game.get("termination"), game.get("plies"), base64.b64decode(game["pgn"]),
+             game.get("created_at"), game.get("finished_at")),
+        )
+    uuids = [game["uuid"] for game in games]
+    if not uuids:
+        return 0
+    cursor = connection.execute(
+        f'DELETE FROM "chess" WHERE "uuid" IN ({", ".join("?" for _ in uuids)})', uuids
+    )
+    return cursor.rowcount
+
+
+SQLITE_FUNCTIONS = {
+    "increment_play_count": _increment_play_count,
+    "record_presence_batch": _record_presence_batch,
+    "save_best_score": _save_best_score,
+    "claim_hl_income": _claim_hl_income,
+    "patch_gun_merge_save": _patch_gun_merge_save,
+    "save_chess_moves": _save_chess_moves,
+    "archive_chess_games": _archive_chess_games,
+    "find_or_create_chess_match": _find_or_create_chess_match,
+}
+
+
+def _quote(identifier):
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def _split_filters(filters):
+    """Découpe 'a,b,and(c,d)' sur les virgules hors parenthèses et hors guillemets."""
+    parts, current, depth, quoted, escaped = [], [], 0, False, False
+    for char in filters:
+        if escaped:
+            escaped = False
+        elif char == "\\" and quoted:
+            escaped = True
+        elif char == '"':
+            quoted = not quoted
+        elif not quoted and char == "(":
+            depth += 1
+        elif not quoted and char == ")":
+            depth -= 1
+        elif not quoted and depth == 0 and char == ",":
+            parts.append("".join(current).strip())
+            current = []
+            continue
+        current.append(char)
+    parts.append("".join(current).strip())
+    return [part for part in parts if part]
+
+
+def _unquote(value):
+    if len(value) >= 2 and value[0] == value[-1] == '"':
+        return re.sub(r"\\(.)", r"\1", value[1:-1])
+    return value
+
+
+def _single_row_error(count):
+    # Même erreur que PostgREST quand .single() ne trouve pas exactement une ligne
+    return PostgrestAPIError({
+        "message": "JSON object requested, multiple (or no) rows returned",
+        "code": "PGRST116",
+        "hint": None,
+        "details": f"The result contains {count} rows",
+    })
+
+
+class StorageResponse:
+    """Réponse d'exécution, même interface que APIResponse (attribut .data)."""
+
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+class _NotFilter:
+    """Permet d'écrire query.not_.is_(col, "null") comme avec postgrest."""
+
+    def __init__(self, query):
+        self._query = query
+
+    def is_(self, column, value):
+        return self._query._add_filter(column, "is", value, negate=True)
+
+    def eq(self, column, value):
+        return self._query._add_filter(column, "eq", value, negate=True)
+
+    def in_(self, column, values):
+        return self._query._add_filter(column, "in", values, negate=True)
+
+
+class SQLiteQuery:
+    """Sous-ensemble du request builder postgrest, exécuté sur SQLite."""
+
+    _OPERATORS = {"eq": "=", "neq": "!=", "lt": "<", "lte": "<=", "gt": ">", "gte": ">="}
+
+    def __init__(self, client, table):
+        self._client = client
+        self._table = table
+        self._json_columns = JSON_COLUMNS.get(table, set())
+        self._action = "select"
+        self._columns = None
+        self._payload = None
+        self._on_conflict = None
+        self._ignore_duplicates = False
+        self._where = []
+        self._params = []
+        self._order = []
+        self._limit = None
+        self._single = False
+        self._maybe_single = False
+        self._count = None
+
+    # --- Actions ---
+    def select(self, columns="*", count=None):
+        self._action = "select"
+        cols = [c.strip().strip('"') for c in columns.split(",")]
+        self._columns = None if cols == ["*"] else cols
+        self._count = count
+        return self
+
+    def insert(self, payload):
+        self._action = "insert"
+        self._payload = payload
+        return self
+
+    def upsert(self, payload, on_conflict="", ignore_duplicates=False):
+        self._action = "upsert"
+        self._payload = payload
+        self._on_conflict = on_conflict
+        self._ignore_duplicates = ignore_duplicates
+        return self
+
+    def update(self, payload):
+        self._action = "update"
+        self._payload = payload
+        return self
+
+    def delete(self):
+        self._action = "delete"
+        return self
+
+    # --- Filtres ---
+    def _add_filter(self, column, operator, value, negate=False):
+        clause, params = self._filter_sql(column, operator, value)
+        self._where.append(f"NOT ({clause})" if negate else clause)
+        self._params.extend(params)
+        return self
+
+    def _filter_sql(self, column, operator, value):
+        col = _quote(column)
+        if operator == "is":
+            if value in (None, "null"):
+                return f"{col} IS NULL", []
+            return f"{col} IS ?", [value == "true" if isinstance(value, str) else value]
+        if operator == "in":
+            values = list(value)
+            if not values:
+                return "0", []
+            return f"{col} IN ({', '.join('?' * len(values))})", values
+        return f"{col} {self._OPERATORS[operator]} ?", [value]
+
+    def eq(self, column, value):
+        return self._add_filter(column, "eq", value)
+
+    def neq(self, column, value):
+        return self._add_filter(column, "neq", value)
+
+    def lt(self, column, value):
+        return self._add_filter(column, "lt", value)
+
+    def lte(self, column, value):
+        return self._add_filter(column, "lte", value)
+
+    def gt(self, column, value):
+        return self._add_filter(column, "gt", value)
+
+    def gte(self, column, value):
+        return self._add_filter(column, "gte", value)
+
+    def is_(self, column, value):
+        return self._add_filter(column, "is", value)
+
+    def in_(self, column, values):
+        return self._add_filter(column, "in", values)
+
+    @property
+    def not_(self):
+        return _NotFilter(self)
+
+    def or_(self, filters):
+        """Filtre PostgREST 'col.op.valeur,and(col.op.valeur,...)' (valeurs entre guillemets acceptées)."""
+        clause, params = self._logic_sql("OR", filters)
+        self._where.append(clause)
+        self._params.extend(params)
+        return self
+
+    def _logic_sql(self, joiner, filters):
+        clauses, params = [], []
+        for part in _split_filters(filters):
+            for logic in ("and", "or"):
+                if part.startswith(f"{logic}(") and part.endswith(")"):
+                    clause, part_params = self._logic_sql(logic.upper(), part[len(logic) + 1:-1])
+                    break
+            else:
+                column, operator, value = part.split(".", 2)
+                clause, part_params = self._filter_sql(column, operator, _unquote(value))
+            clauses.append(clause)
+            params.extend(part_params)
+        return "(" + f" {joiner} ".join(clauses) + ")", params
+
+    # --- Modificateurs ---
+    def order(self, column, desc=False, nullsfirst=None):
+        direction = "DESC" if desc else "ASC"
+        nulls = ""
+        if nullsfirst is not None:
+            nulls = " NULLS FIRST" if nullsfirst else " NULLS LAST"
+        self._order.append(f"{_quote(column)} {direction}{nulls}")
+        return self
+
+    def limit(self, size):
+        self._limit = int(size)
+        return self
+
+    def single(self):
+        self._single = True
+        return self
+
+    def maybe_single(self):
+        self._maybe_single = True
+        return self
+
+    # --- Exécution ---
+    def _encode(self, row):
+        return {
+            key: json.dumps(value) if key in self._json_columns and value is not None else value
+            for key, value in row.items()
+        }
+
+    def _decode(self, row):
+        row = dict(row)
+        for key in self._json_columns & row.keys():
+            if isinstance(row[key], str):
+                row[key] = json.loads(row[key])
+        if self._columns is not None:
+            row = {col: row.get(col) for col in self._columns}
+        return row
+
+    def _where_sql(self):
+        return (" WHERE " + " AND ".join(self._where)) if self._where else ""
+
+    def _build(self):
+        table = _quote(self._table)
+        where = self._where_sql()
+
+        if self._action == "select":
+            sql = f"SELECT * FROM {table}{where}"
+            if self._order:
+                sql += " ORDER BY " + ", ".join(self._order)
+            if self._limit is not None:
+                sql += f" LIMIT {self._limit}"
+            return [(sql, list(self._params))]
+
+        if self._action == "update":
+            payload = self._encode(self._payload)
+            assignments = ", ".join(f"{_quote(k)} = ?" for k in payload)
+            sql = f"UPDATE {table} SET {assignments}{where} RETURNING *"
+            return [(sql, list(payload.values()) + list(self._params))]
+
+        if self._action == "delete":
+            return [(f"DELETE FROM {table}{where} RETURNING *", list(self._params))]
+
+        # insert / upsert : une requête par ligne, dans la même transaction
+        rows = self._payload if isinstance(self._payload, list) else [self._payload]
+        statements = []
+        for row in rows:
+            row = self._encode(row)
+            columns = ", ".join(_quote(k) for k in row)
+            placeholders = ", ".join("?" * len(row))
+            sql = f"INSERT INTO {table} ({columns}) VALUES ({placeholders})"
+            if self._action == "upsert":
+                conflict = ", ".join(_quote(c.strip()) for c in (self._on_conflict or "").split(",") if c.strip())
+                if not conflict:
+                    conflict = self._client.primary_key(self._table)
+                if self._ignore_duplicates:
+                    sql += f" ON CONFLICT ({conflict}) DO NOTHING"
+                else:
+                    updates = ", ".join(f"{_quote(k)} = excluded.{_quote(k)}" for k in row)
+                    sql += f" ON CONFLICT ({conflict}) DO UPDATE SET {updates}"
+            statements.append((sql + " RETURNING *", list(row.values())))
+        return statements
+
+    def execute(self):
+        self._client.simulate_latency()
+        return self._execute()
+
+    def _execute(self):
+        statements = self._build()
+        counting = self._count and self._action == "select"
+        if counting:
+            # Comme PostgREST : le total compte toutes les lignes filtrées, avant LIMIT
+            statements.insert(0, (f"SELECT COUNT(*) FROM {_quote(self._table)}{self._where_sql()}", list(self._params)))
+        try:
+            rows = self._client.run(statements)
+        except sqlite3.IntegrityError as e:
+            raise PostgrestAPIError({"message": str(e), "code": "23505", "hint": None, "details": None})
+
+        count = None
+        if counting:
+            count, rows = rows[0][0], rows[1:]
+        elif self._count:
+            count = len(rows)
+        data = [self._decode(row) for row in rows]
+
+        if self._single:
+            if len(data) != 1:
+                raise _single_row_error(len(data))
+            return StorageResponse(data[0], count)
+        if self._maybe_single:
+            if len(data) > 1:
+                raise _single_row_error(len(data))
+            return StorageResponse(data[0] if data else None, count)
+        return StorageResponse(data, count)
+
+
+class SQLiteRPC:
+    """Appel de fonction (équivalent de supabase.rpc) implémentée en Python."""
+
+    def __init__(self, client, name, params):
+        self._client = client
+        self._name = name
+        self._params = params or {}
+
+    def execute(self):
+        self._client.simulate_latency()
+        return self._execute()
+
+    def _execute(self):
+        func = self._client.functions.get(self._name)
+        if func is None:
+            raise PostgrestAPIError({
+                "message": f"Could not find the function public.{self._name}",
+                "code": "PGRST202",
+                "hint": None,
+                "details": None,
+            })
+        return StorageResponse(self._client.call(func, self._params))
+
+
+class SQLiteClient:
+    """Client compatible avec l'usage que fait app.py du client Supabase."""
+
+    def __init__(self, path, latency=0.0):
+        self.path = path
+        self.latency = latency
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.row_factory = sqlite3.Row
+        if path != ":memory:":
+            self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(SQLITE_SCHEMA)
+        # Fonctions appelables via rpc(nom, params) : func(connection, **params)
+        self.functions = dict(SQLITE_FUNCTIONS)
+
+    def table(self, name):
+        return SQLiteQuery(self, name)
+
+    def from_(self, name):
+        return self.table(name)
+
+    def rpc(self, name, params=None):
+        return SQLiteRPC(self, name, params)
+
+    def simulate_latency(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def primary_key(self, table):
+        with self.lock:
+            info = self.connection.execute(f"PRAGMA table_info({_quote(table)})").fetchall()
+        return ", ".join(_quote(row["name"]) for row in info if row["pk"])
+
+    def call(self, func, params):
+        """Exécute une fonction RPC dans une transaction."""
+        with self.lock:
+            self.connection.execute("BEGIN")
+            try:
+                result = func(self.connection, **params)
+            except Exception:
+                self.connection.execute("ROLLBACK")
+                raise
+            self.connection.execute("COMMIT")
+        return result
+
+    def run(self, statements):
+        """Exécute les requêtes dans une seule transaction et renvoie toutes les lignes."""
+        rows = []
+        with self.lock:
+            self.connection.execute("BEGIN")
+            try:
+                for sql, params in statements:
+                    rows.extend(self.connection.execute(sql, params).fetchall())
+            except Exception:
+                self.connection.execute("ROLLBACK")
+                raise
+            self.connection.execute("COMMIT")
+        return rows
+
+
+class _AsyncSQLiteQuery:
+    """Request builder SQLite dont execute() est une coroutine (même API que le client async Supabase)."""
+
+    def __init__(self, client, query):
+        self._client = client
+        self._query = query
+
+    def __getattr__(self, name):
+        value = getattr(self._query, name)
+        if not callable(value):
+            return _AsyncSQLiteQuery(self._client, value)
+
+        def call(*args, **kwargs):
+            return _AsyncSQLiteQuery(self._client, value(*args, **kwargs))
+        return call
+
+    async def execute(self):
+        # La latence simulée n'occupe pas de thread ; la requête SQLite elle-même est brève
+        if self._client.latency:
+            await asyncio.sleep(self._client.latency)
+        return self._query._execute()
+
+
+class AsyncSQLiteClient:
+    """Façade asynchrone d'un SQLiteClient (partage sa connexion et ses données)."""
+
+    def __init__(self, client):
+        self._client = client
+        self.latency = client.latency
+
+    def table(self, name):
+        return _AsyncSQLiteQuery(self, self._client.table(name))
+
+    def from_(self, name):
+        return self.table(name)
+
+    def rpc(self, name, params=None):
+        return _AsyncSQLiteQuery(self, self._client.rpc(name, params))
+
+
+# ----------------------------------------------------------------------
+# --- SÉLECTION DU BACKEND ---
+# ----------------------------------------------------------------------
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "supabase").strip().lower()
+
+
+def create_storage(backend=None):
+    """Crée le client de stockage selon STORAGE_BACKEND ("supabase" ou "sqlite")."""
+    backend = (backend or STORAGE_BACKEND).strip().lower()
+
+    if backend == "sqlite":
+        return SQLiteClient(
+            os.environ.get("SQLITE_PATH", "project_3_api.db"),
+            float(os.environ.get("SQLITE_LATENCY_MS", 0)) / 1000,
+        )
+
+    if backend == "supabase":
+        return create_client(*_supabase_credentials())
+
+    raise RuntimeError(f"STORAGE_BACKEND inconnu : {backend!r} (attendu : supabase ou sqlite)")
+
+
+def _supabase_credentials():
+    # NOTE : Assurez-vous que ces variables d'environnement sont bien définies
+    supabase_url = os.environ.get("SUPABASE_URL")
+    supabase_key = os.environ.get("SUPABASE_KEY")
+    if not supabase_url or not supabase_key:
+        raise RuntimeError("Variables d'environnement SUPABASE_URL ou SUPABASE_KEY manquantes")
+    return supabase_url, supabase_key
+
+
+async def create_async_storage(sync_client):
+    """Client asynchrone du même backend que `sync_client`.
+    SQLite : façade sur la même connexion (mêmes données, y compris ":memory:").
+    Supabase : client AsyncClient (httpx asynchrone).
+    """
+    if isinstance(sync_client, SQLiteClient):
+        return AsyncSQLiteClient(sync_client)
+    return await acreate_client(*_supabase_credentials())
@@ -0,0 +1,322 @@
+-- Fonctions SQL appelées par app.py via supabase.rpc(...), et index/contraintes dont dépendent ses requêtes.
+-- À exécuter dans l'éditeur SQL Supabase (idempotent).
+-- Le backend SQLite (storage.py) en fournit des équivalents Python.
+
+-- Incrément atomique du compteur de parties d'un jeu (flush de PlayCounters).
+-- Renvoie la nouvelle valeur, NULL si le jeu n'existe pas.
+create or replace function increment_play_count(game_name text, amount integer)
+returns integer
+language sql
+as $$
+    update "Play_Count"
+    set counter = coalesce(counter, 0) + amount
+    where name = game_name
+    returning counter;
+$$;
+
+-- Sauvegarde d'un jeu en un seul aller-retour : upsert de la ligne du joueur
+-- (clé username) en conservant le plus grand des deux scores pour score_column.
+-- Renvoie le meilleur score enregistré.
+create or replace function save_best_score(table_name text, score_column text, payload jsonb)
+returns integer
+language plpgsql
+as $$
+declare
+    columns text;
+    assignments text;
+    best integer;
+begin
+    if table_name not in ('Skull_Arena_DataBase', 'Astro_Dodge', 'Stickman_Runner') then
+        raise exception 'save_best_score: table % non autorisée', table_name;
+    end if;
+
+    select string_agg(format('%I', key), ', '),
+           string_agg(
+               case when key = score_column
+                    then format('%1$I = greatest(coalesce(t.%1$I, 0), excluded.%1$I)', key)
+                    else format('%1$I = excluded.%1$I', key)
+               end, ', ')
+      into columns, assignments
+      from jsonb_object_keys(payload) as key;
+
+    execute format(
+        'insert into %1$I as t (%2$s) select %2$s from jsonb_populate_record(null::%1$I, $1) '
+        'on conflict (username) do update set %3$s returning t.%4$I',
+        table_name, columns, assignments, score_column
+    ) into best using payload;
+
+    return best;
+end;
+$$;
+
+-- Statut des joueurs : jamais NULL ('🔴 offline' par défaut).
+update "Player" set "Status" = '🔴 offline' where "Status" is null;
+alter table "Player" alter column "Status" set default '🔴 offline';
+alter table "Player" alter column "Status" set not null;
+create index if not exists "Player_status_last_seen"
+    on "Player" ("Status", last_seen desc nulls last, "ID");
+
+-- get_all_players_status (joueurs hors ligne) : Player trié par last_seen desc, ID.
+-- L'index (Status, last_seen, ID) sert la réconciliation du registre de présence.
+create index if not exists "Player_last_seen"
+    on "Player" (last_seen desc nulls last, "ID");
+
+-- Présence : écrit en une requête un lot de battements [{"id", "last_seen"}, ...]
+-- (PresenceBuffer.flush), chaque joueur recevant son propre last_seen.
+-- UPDATE seulement : un ID inconnu ne crée pas de ligne Player.
+-- Renvoie le nombre de joueurs mis à jour.
+create or replace function record_presence_batch(heartbeats jsonb)
+returns integer
+language sql
+as $$
+    with updated as (
+        update "Player" p
+        set "Status" = '🟢 online',
+            last_seen = h.last_seen
+        from jsonb_to_recordset(heartbeats) as h(id text, last_seen timestamptz)
+        where p."ID" = h.id
+        returning 1
+    )
+    select count(*)::integer from updated;
+$$;
+
+-- Gun Merge : revenu passif par seconde, calculé à chaque sauvegarde (gun_merge_update_data).
+-- Le remplissage initial applique le même barème que GUN_MERGE_GAIN_MAP (app.py).
+alter table "Gun_Merge" add column if not exists income_per_sec double precision not null default 0;
+update "Gun_Merge" g
+set income_per_sec = coalesce((
+    select sum(case item->>'id'
+                   when '1' then 1 when '2' then 3 when '3' then 8 when '4' then 20 when '5' then 50
+                   when '6' then 120 when '7' then 300 when '8' then 800 when '9' then 2000 when '10' then 5000
+                   else 0 end)
+    from jsonb_array_elements(g.save->'inventory') as item
+    where jsonb_typeof(item) = 'object'
+), 0)
+where jsonb_typeof(g.save->'inventory') = 'array';
+
+-- Réclamation du revenu passif (get_HL_money) en une seule requête : last_claim
+-- passe à 1 seulement si le gain n'a pas déjà été réclamé et que l'absence dure
+-- au moins min_seconds. claimed indique si cet appel a obtenu la réclamation ;
+-- sinon la ligne est renvoyée telle quelle (aucune ligne si le joueur n'existe pas).
+create or replace function claim_hl_income(p_username text, min_seconds integer)
+returns table ("gain_HL" timestamptz, income_per_sec double precision, last_claim integer, claimed boolean)
+language sql
+as $$
+    with claim as (
+        update "Gun_Merge"
+        set last_claim = 1
+        where username = p_username
+          and last_claim is distinct from 1
+          and "gain_HL"::timestamptz <= now() - make_interval(secs => min_seconds)
+        returning "gain_HL"::timestamptz, income_per_sec, last_claim
+    )
+    select c."gain_HL", c.income_per_sec, c.last_claim, true from claim c
+    union all
+    select g."gain_HL"::timestamptz, g.income_per_sec, g.last_claim, false
+    from "Gun_Merge" g
+    where g.username = p_username and not exists (select 1 from claim);
+$$;
+
+-- Gun Merge : sauvegarde par différence. save_version est un jeton changé à
+-- chaque sauvegarde ; le patch ne s'applique que sur la version attendue et
+-- n'envoie que les champs de premier niveau modifiés (changes) ou supprimés
+-- (removed). Renvoie la nouvelle version, NULL si la version ne correspond plus.
+alter table "Gun_Merge" add column if not exists save_version text;
+
+create or replace function patch_gun_merge_save(
+    p_username text, base_version text, new_version text,
+    changes jsonb, removed text[], income double precision
+)
+returns text
+language sql
+as $$
+    update "Gun_Merge"
+    set save = (save - coalesce(removed, '{}')) || changes,
+        save_version = new_version,
+        last_claim = 0,
+        income_per_sec = coalesce(income, income_per_sec)
+    where username = p_username and save_version = base_version
+    returning save_version;
+$$;
+
+-- Échecs : historique des coups en binaire (2 octets par coup, voir move_history.py).
+alter table chess add column if not exists moves_packed bytea;
+
+-- Échecs : coups anticipés (premoves) en attente, partagés entre workers.
+-- premoves = [[coup adverse attendu ou null, réponse], ...] (UCI), file de premove_player.
+alter table chess add column if not exists premove_player text;
+alter table chess add column if not exists premoves jsonb;
+
+-- Écriture des coups d'une partie (make_move, avant de répondre au client).
+-- stored_bytes = taille de moves_packed sur laquelle le coup a été validé :
+-- les coups (base64) y sont ajoutés seulement si elle correspond, sans
+-- renvoyer l'historique. stored_bytes NULL = réécriture complète d'une partie
+-- encore au format JSON (moves_packed vide), qui abandonne le tableau moves_list.
+-- Une partie abandonnée n'accepte plus de coup. p_finished_at date la fin de
+-- partie (mat, nulle) dans la même écriture et vide la file de coups anticipés ;
+-- p_premoves remplace cette file (NULL : inchangée, '[]' : annulée).
+-- Renvoie {moves_bytes, premove_player, premoves} après écriture : make_move
+-- y lit la file à jour, quel que soit le worker qui l'a reçue. NULL si la
+-- partie a changé depuis la validation (coup joué via un autre worker,
+-- abandon) : le coup est alors refusé.
+drop function if exists save_chess_moves(uuid, text, integer, text);
+drop function if exists save_chess_moves(uuid, text, integer, text, timestamptz);
+create or replace function save_chess_moves(p_game_uuid uuid, fen text, stored_bytes integer, moves text,
+                                            p_finished_at timestamptz default null,
+                                            p_premoves jsonb default null)
+returns jsonb
+language sql
+as $$
+    update chess
+    set fen_state = fen,
+        moves_packed = coalesce(moves_packed, ''::bytea) || decode(moves, 'base64'),
+        moves_list = case when stored_bytes is null then '[]'::jsonb else moves_list end,
+        finished_at = coalesce(p_finished_at, finished_at),
+        premoves = case when p_finished_at is null then coalesce(p_premoves, premoves) end,
+        premove_player = case
+            when p_finished_at is null and jsonb_array_length(coalesce(p_premoves, premoves, '[]'::jsonb)) > 0
+            then premove_player
+        end
+    where uuid = p_game_uuid
+      and abandon is null
+      and octet_length(coalesce(moves_packed, ''::bytea)) = coalesce(stored_bytes, 0)
+    returning jsonb_build_object(
+        'moves_bytes', octet_length(moves_packed),
+        'premove_player', premove_player,
+        'premoves', coalesce(premoves, '[]'::jsonb)
+    );
+$$;
+
+-- Migration en bloc des parties encore au format JSON (même codage que move_history.py).
+create or replace function uci_move_code(uci text)
+returns bytea
+language sql
+immutable
+as $$
+    select case when uci = '0000' then '\x0000'::bytea else
+        set_byte(set_byte('\x0000'::bytea, 0, code >> 8), 1, code & 255)
+    end
+    from (
+        -- << et | ont la même priorité en SQL : parenthèses explicites
+        select (((ascii(substr(uci, 2, 1)) - 49) * 8 + ascii(substr(uci, 1, 1)) - 97) << 10)
+             | (((ascii(substr(uci, 4, 1)) - 49) * 8 + ascii(substr(uci, 3, 1)) - 97) << 4)
+             | (case when length(uci) = 5 then position(substr(uci, 5, 1) in 'nbrq') else 0 end) as code
+    ) as c;
+$$;
+
+update chess
+set moves_packed = (
+        select coalesce(string_agg(uci_move_code(m.uci), ''::bytea order by m.ply), ''::bytea)
+        from jsonb_array_elements_text(moves_list) with ordinality as m(uci, ply)
+    ),
+    moves_list = '[]'::jsonb
+where coalesce(octet_length(moves_packed), 0) = 0
+  and jsonb_typeof(moves_list) = 'array'
+  and jsonb_array_length(moves_list) > 0;
+
+-- Échecs : nettoyage de la table chess (ChessReaper, voir chess_archive.py).
+-- finished_at est renseigné à la fin d'une partie (mat, nulle, abandon) ;
+-- les parties abandonnées avant cette colonne sont datées à la migration.
+alter table chess add column if not exists finished_at timestamptz;
+update chess set finished_at = now() where abandon is not null and finished_at is null;
+
+create index if not exists chess_finished_at on chess (finished_at) where finished_at is not null;
+-- Parties terminées : PGN compressé (zlib) et résumé, hors de la table chaude.
+create table if not exists chess_archive (
+    game_uuid uuid primary key,
+    white_player_id text,
+    black_player_id text,
+    result text,
+    termination text,
+    plies integer,
+    pgn_zlib bytea,
+    created_at timestamptz,
+    finished_at timestamptz,
+    archived_at timestamptz default now()
+);
+
+-- Archivage d'un lot de parties (tableau JSON, pgn en base64) : insertion dans
+-- chess_archive et suppression des lignes chess dans la même transaction.
+-- Renvoie le nombre de parties retirées de chess.
+create or replace function archive_chess_games(games jsonb)
+returns integer
+language sql
+as $$
+    with archived as (
+        insert into chess_archive (game_uuid, white_player_id, black_player_id, result, termination,
+                                   plies, pgn_zlib, created_at, finished_at)
+        select (g->>'uuid')::uuid, g->>'white_player_id', g->>'black_player_id', g->>'result',
+               g->>'termination', (g->>'plies')::integer, decode(g->>'pgn', 'base64'),
+               (g->>'created_at')::timestamptz, (g->>'finished_at')::timestamptz
+        from jsonb_array_elements(games) as g
+        on conflict (game_uuid) do nothing
+        returning game_uuid
+    ), removed as (
+        delete from chess
+        where uuid in (select (g->>'uuid')::uuid from jsonb_array_elements(games) as g)
+        returning uuid
+    )
+    select count(*)::integer from removed;
+$$;
+
+-- Échecs : matchmaking partagé par tous les workers (voir matchmaking.py).
+-- Un joueur en attente est une ligne ouverte (black_player_id NULL) ;
+-- waiting_seen_at est rafraîchi tant que son client consulte la partie.
+alter table chess add column if not exists waiting_seen_at timestamptz;
+update chess set waiting_seen_at = created_at where black_player_id is null and waiting_seen_at is null;
+create index if not exists chess_waiting on chess (created_at, uuid) where black_player_id is null;
+create index if not exists chess_waiting_seen_at on chess (waiting_seen_at) where black_player_id is null;
+drop index if exists chess_unjoined_created_at;
+
+-- Appariement atomique : renvoie la partie ouverte du joueur s'il attend déjà
+-- ('waiting'), sinon rejoint la plus ancienne partie ouverte rafraîchie depuis
+-- moins de wait_timeout secondes ('joined'), sinon crée la partie p_game_uuid
+-- ('created'). Le verrou consultatif sérialise les appels : deux joueurs
+-- simultanés ne créent pas chacun une partie et ne rejoignent jamais la même.
+create or replace function find_or_create_chess_match(
+    p_player_id text, p_game_uuid uuid, p_fen text, wait_timeout double precision
+)
+returns table (
+    result text, game_uuid uuid, white_player_id text, black_player_id text,
+    fen_state text, waited_seconds double precision
+)
+language plpgsql
+as $$
+#variable_conflict use_column
+declare
+    game chess%rowtype;
+begin
+    perform pg_advisory_xact_lock(hashtext('chess_matchmaking'));
+
+    select o.* into game from chess o
+    where o.black_player_id is null and o.white_player_id = p_player_id
+    order by o.created_at desc
+    limit 1;
+    if found then
+        update chess set waiting_seen_at = now() where uuid = game.uuid;
+        return query select 'waiting'::text, game.uuid, game.white_player_id, null::text,
+                            game.fen_state, 0::double precision;
+        return;
+    end if;
+
+    select o.* into game from chess o
+    where o.black_player_id is null and o.white_player_id <> p_player_id
+      and coalesce(o.waiting_seen_at, o.created_at) >= now() - make_interval(secs => wait_timeout)
+    order by o.created_at, o.uuid
+    limit 1;
+    if found then
+        update chess
+        set black_player_id = p_player_id,
+            joueurs = game.white_player_id || ',' || p_player_id,
+            waiting_seen_at = null
+        where uuid = game.uuid;
+        return query select 'joined'::text, game.uuid, game.white_player_id, p_player_id,
+                            game.fen_state, extract(epoch from now() - game.created_at)::double precision;
+        return;
+    end if;
+
+    insert into chess (uuid, fen_state, white_player_id, black_player_id, joueurs, moves_list, waiting_seen_at)
+    values (p_game_uuid, p_fen, p_player_id, null, p_player_id, '[]'::jsonb, now());
+    return query select 'created'::text, p_game_uuid, p_player_id, null::text, p_fen, 0::double precision;
+end;
+$$;
@@ -0,0 +1,156 @@
+"""
+Balayage périodique des joueurs inactifs, une seule fois par déploiement.
+
+Tous les workers gunicorn démarrent un OfflineSweeper, mais seul celui qui
+détient le verrou fichier (fcntl.flock) exécute réellement le balayage.
+Le verrou est libéré par le système à la mort du process, un autre worker
+prend alors le relais au tour suivant.
+
+LeaderTask porte ce schéma (verrou, tours, erreurs, compteurs, métriques)
+pour toutes les tâches "un seul worker" : OfflineSweeper, ChessReaper
+(chess_archive.py).
+"""
+import os
+import threading
+from datetime import datetime, timezone
+
+try:
+    import fcntl
+except ImportError:  # Windows : pas de flock, le process est toujours leader
+    fcntl = None
+
+
+class LeaderLock:
+    """Verrou exclusif non bloquant sur un fichier local, gardé à vie par le process."""
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    def try_acquire(self):
+        if self._fd is not None:
+            return True
+        if fcntl is None:
+            self._fd = -1
+            return True
+
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is None:
+            return
+        if self._fd >= 0:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+        self._fd = None
+
+    @property
+    def held(self):
+        return self._fd is not None
+
+
+class LeaderTask:
+    """Tâche périodique exécutée seulement par le process leader (verrou fichier).
+
+    Les sous-classes implémentent work(), qui renvoie {compteur: n} pour le
+    tour (noms listés dans `counts`), et report() pour le log. stats() expose
+    le nombre de tours et d'erreurs, et last_<compteur> / total_<compteur>.
+    Avec `metrics` (metrics.Metrics) et `metric_prefix`, chaque tour alimente
+    aussi `runs_metric`, <prefix>_<compteur>_total et <prefix>_errors_total.
+    """
+
+    name = "LEADER TASK"
+    counts = ()
+    metric_prefix = None
+    runs_metric = None
+
+    def __init__(self, lock_path, metrics=None):
+        self.leader = LeaderLock(lock_path)
+        self.metrics = metrics if self.metric_prefix else None
+        self._lock = threading.Lock()
+        self._stats = {"runs": 0, "last_run_at": None, "errors": 0}
+        for count in self.counts:
+            self._stats[f"last_{count}"] = 0
+            self._stats[f"total_{count}"] = 0
+
+    def work(self):
+        raise NotImplementedError
+
+    def report(self, counts):
+        pass
+
+    def run_once(self):
+        """Un tour de la tâche. Renvoie ses compteurs, None si non leader ou en erreur."""
+        if not self.leader.try_acquire():
+            return None
+
+        try:
+            counts = self.work()
+        except Exception as e:
+            with self._lock:
+                self._stats["errors"] += 1
+            if self.metrics is not None:
+                self.metrics.inc(f"{self.metric_prefix}_errors_total", ())
+            print(f"[{self.name} ERROR] {e}")
+            return None
+
+        with self._lock:
+            self._stats["runs"] += 1
+            for count in self.counts:
+                self._stats[f"last_{count}"] = counts[count]
+                self._stats[f"total_{count}"] += counts[count]
+            self._stats["last_run_at"] = datetime.now(timezone.utc).isoformat()
+        if self.metrics is not None:
+            self.metrics.inc(self.runs_metric, ())
+            for count in self.counts:
+                self.metrics.inc(f"{self.metric_prefix}_{count}_total", (), counts[count])
+
+        self.report(counts)
+        return counts
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["is_leader"] = self.leader.held
+        return stats
+
+
+class OfflineSweeper(LeaderTask):
+    """Exécute `sweep_func()` si ce process est leader.
+
+    `sweep_func` doit renvoyer (lignes passées offline, joueurs 'online'
+    examinés). Avec `metrics` (metrics.Metrics), chaque tour alimente les
+    compteurs offline_sweep_* exportés par /metrics.
+    """
+
+    name = "SWEEPER"
+    counts = ("flipped", "inspected")
+    metric_prefix = "offline_sweep"
+    runs_metric = "offline_sweeps_total"
+
+    def __init__(self, sweep_func, lock_path, metrics=None):
+        super().__init__(lock_path, metrics)
+        self.sweep_func = sweep_func
+
+    def work(self):
+        flipped, inspected = self.sweep_func()
+        return {"flipped": flipped, "inspected": inspected}
+
+    def report(self, counts):
+        if counts["flipped"]:
+            print(f"[SWEEPER] {counts['flipped']}/{counts['inspected']} joueur(s) passé(s) offline (pid {os.getpid()})")
+
+    def run_once(self):
+        """Un tour de balayage. Renvoie le nombre de lignes basculées, None si non leader."""
+        counts = super().run_once()
+        return None if counts is None else counts["flipped"]
@@ -0,0 +1,28 @@
+"""
+Configuration commune des tests : backend SQLite en mémoire, sans tâches
+d'arrière-plan (les tests appellent flush() / run_once() eux-mêmes).
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+os.environ.setdefault("STORAGE_BACKEND", "sqlite")
+os.environ.setdefault("SQLITE_PATH", ":memory:")
+os.environ["BACKGROUND_TASKS"] = "0"
+os.environ.setdefault("SESSION_SECRET", "tests")
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def server():
+    """Module app.py, importé une fois (base SQLite en mémoire partagée par les tests)."""
+    import app
+    return app
+
+
+@pytest.fixture
+def client(server):
+    return server.app.test_client()
@@ -0,0 +1,51 @@
+"""
+Vues asynchrones (asgi.py) : mêmes réponses que les routes Flask, corps JSON validé.
+"""
+import asyncio
+
+import httpx
+import pytest
+
+
+@pytest.fixture
+def asgi_post(server):
+    import asgi
+
+    def post(path, **kwargs):
+        async def send():
+            transport = httpx.ASGITransport(app=asgi.application)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+                return await http.post(path, **kwargs)
+        return asyncio.run(send())
+    return post
+
+
+@pytest.mark.parametrize("body", [[1, 2], "texte", None])
+def test_non_object_body_is_rejected(asgi_post, body):
+    response = asgi_post("/gun_merge_get_data", json=body)
+    assert response.status_code == 400
+    assert response.json()["status"] == "error"
+
+
+def test_gun_merge_load_matches_flask(asgi_post, client):
+    created = asgi_post("/gun_merge_get_data", json={"username": "asgi_gm"})
+    assert created.status_code == 200
+    assert created.json()["data"]["inventory"] == [None, None, None, None, None]
+
+    # La ligne créée par la vue asynchrone est relue telle quelle par Flask
+    loaded = client.post("/gun_merge_get_data", json={"username": "asgi_gm"})
+    assert loaded.get_json() == created.json()
+
+
+def test_fdpiece_sections_created_then_read(server):
+    from profile_loads import fdpiece_new_row, load_or_create
+
+    username = "fdp_sections"
+    first = server.load_fdpiece_sections({"username": username})
+    assert first["time_fdprice"] == ({"status": "created", "Time": 0, "FDPiece": 0}, 200)
+
+    row, created = load_or_create(server.supabase, "FDPiece", "Time, FDPiece", username, fdpiece_new_row)
+    assert not created and row == {"Time": 0, "FDPiece": 0}
+    second = server.load_fdpiece_sections({"username": username})
+    assert second["time_fdprice"][0]["status"] == "success"
+    assert second["sub"] == ({"status": "success", "Abonnement": None}, 200)
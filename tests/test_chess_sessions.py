@@ -0,0 +1,164 @@
+"""
+Deux workers (deux imports d'app.py) sur la même base SQLite : un coup validé
+sur une session en cache périmée est refusé (409), jamais écrit par-dessus.
+"""
+import importlib.util
+import os
+import uuid
+
+import chess
+import pytest
+
+from conftest import ROOT
+from game_events import build_snapshot
+
+WHITE = "alice"
+BLACK = "bob"
+
+
+def load_worker(name):
+    spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, "app.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture(scope="module")
+def workers(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("workers") / "chess.db")
+    previous = os.environ.get("SQLITE_PATH")
+    os.environ["SQLITE_PATH"] = path
+    try:
+        a, b = load_worker("worker_a"), load_worker("worker_b")
+    finally:
+        os.environ["SQLITE_PATH"] = previous
+    return a, b
+
+
+def new_game(worker):
+    game_uuid = str(uuid.uuid4())
+    worker.supabase.table("chess").insert({
+        "uuid": game_uuid,
+        "fen_state": chess.STARTING_FEN,
+        "white_player_id": WHITE,
+        "black_player_id": BLACK,
+        "moves_list": [],
+    }).execute()
+    return game_uuid
+
+
+def play(worker, game_uuid, player_id, move_uci):
+    return worker.app.test_client().post(
+        "/make_move", json={"game_uuid": game_uuid, "username": player_id, "move_uci": move_uci}
+    )
+
+
+def stored_moves(worker, game_uuid):
+    return worker.app.test_client().get(f"/get_moves/{game_uuid}").get_json()["moves"]
+
+
+def test_stale_session_move_is_rejected(workers):
+    a, b = workers
+    game_uuid = new_game(a)
+
+    assert play(a, game_uuid, WHITE, "e2e4").status_code == 200
+    assert play(b, game_uuid, BLACK, "e7e5").status_code == 200
+    assert play(b, game_uuid, WHITE, "g1f3").status_code == 200
+
+    # La session de A en est toujours à 1.e4 : d7d6 y paraît légal
+    response = play(a, game_uuid, BLACK, "d7d6")
+    assert response.status_code == 409
+    assert response.get_json()["fen"] == b.chess_sessions.peek(game_uuid).board.fen()
+    assert stored_moves(a, game_uuid) == ["e2e4", "e7e5", "g1f3"]
+
+    # A a relu la partie : le coup joué sur la bonne position passe
+    assert play(a, game_uuid, BLACK, "b8c6").status_code == 200
+    assert stored_moves(b, game_uuid) == ["e2e4", "e7e5", "g1f3", "b8c6"]
+
+
+def test_move_after_give_up_on_other_worker_is_rejected(workers):
+    a, b = workers
+    game_uuid = new_game(a)
+
+    assert play(b, game_uuid, WHITE, "e2e4").status_code == 200
+    response = a.app.test_client().post("/give_up_chess", json={"game_uuid": game_uuid, "username": WHITE})
+    assert response.status_code == 200
+
+    assert play(b, game_uuid, BLACK, "e7e5").status_code == 409
+    assert stored_moves(a, game_uuid) == ["e2e4"]
+
+
+def test_newer_snapshot_from_other_worker_invalidates_session(workers):
+    a, b = workers
+    game_uuid = new_game(a)
+    assert play(a, game_uuid, WHITE, "e2e4").status_code == 200
+
+    board = chess.Board()
+    board.push_uci("e2e4")
+    a.receive_game_event(build_snapshot(game_uuid, board.fen(), WHITE, BLACK, None, "e2e4", event="move"))
+    assert a.chess_sessions.peek(game_uuid) is not None
+
+    board.push_uci("e7e5")
+    a.receive_game_event(build_snapshot(game_uuid, board.fen(), WHITE, BLACK, None, "e7e5", event="move"))
+    assert a.chess_sessions.peek(game_uuid) is None
+
+
+def queue(worker, game_uuid, player_id, premoves):
+    return worker.app.test_client().post(
+        "/queue_premoves", json={"game_uuid": game_uuid, "username": player_id, "premoves": premoves}
+    )
+
+
+def stored_premoves(worker, game_uuid):
+    query = worker.supabase.table("chess").select("premove_player, premoves").eq("uuid", game_uuid)
+    return query.single().execute().data
+
+
+def test_premoves_queued_on_other_worker_are_played(workers):
+    a, b = workers
+    game_uuid = new_game(a)
+    assert play(a, game_uuid, WHITE, "e2e4").status_code == 200
+    assert play(a, game_uuid, BLACK, "e7e5").status_code == 200
+
+    # Le Noir dépose sa file via B ; la session de A n'en sait rien
+    response = queue(b, game_uuid, BLACK, [{"if": "g1f3", "play": "b8c6"}, {"play": "g8f6"}])
+    assert response.status_code == 200
+    assert stored_premoves(a, game_uuid) == {"premove_player": BLACK, "premoves": [["g1f3", "b8c6"], [None, "g8f6"]]}
+
+    response = play(a, game_uuid, WHITE, "g1f3")
+    assert response.status_code == 200
+    assert response.get_json()["premove"] == "b8c6"
+    assert stored_moves(b, game_uuid) == ["e2e4", "e7e5", "g1f3", "b8c6"]
+    assert stored_premoves(a, game_uuid) == {"premove_player": BLACK, "premoves": [[None, "g8f6"]]}
+
+    # Le reste de la file est joué via B (après resynchronisation de sa session), puis la file est vide en base
+    assert play(b, game_uuid, WHITE, "f1c4").status_code == 409
+    response = play(b, game_uuid, WHITE, "f1c4")
+    assert response.get_json()["premove"] == "g8f6"
+    assert stored_premoves(a, game_uuid) == {"premove_player": None, "premoves": None}
+
+
+def test_unmet_premove_condition_clears_stored_queue(workers):
+    a, b = workers
+    game_uuid = new_game(a)
+    assert play(a, game_uuid, WHITE, "e2e4").status_code == 200
+    assert play(a, game_uuid, BLACK, "e7e5").status_code == 200
+    assert queue(b, game_uuid, BLACK, [{"if": "g1f3", "play": "b8c6"}]).status_code == 200
+
+    response = play(a, game_uuid, WHITE, "d2d4")
+    assert response.status_code == 200
+    assert response.get_json()["premove"] is None
+    assert stored_premoves(b, game_uuid) == {"premove_player": None, "premoves": None}
+    assert stored_moves(b, game_uuid) == ["e2e4", "e7e5", "d2d4"]
+
+
+def test_premoves_validated_on_stale_position_are_rejected(workers):
+    a, b = workers
+    game_uuid = new_game(a)
+    assert play(a, game_uuid, WHITE, "e2e4").status_code == 200
+    assert play(b, game_uuid, BLACK, "e7e5").status_code == 200
+
+    # A croit encore le Noir au trait : la file du Blanc y est validée sur 1.e4
+    response = queue(a, game_uuid, WHITE, [{"if": "c7c5", "play": "g1f3"}])
+    assert response.status_code == 409
+    assert stored_premoves(b, game_uuid) == {"premove_player": None, "premoves": None}
@@ -0,0 +1,50 @@
+"""
+PlayCounters : incréments en mémoire, flush atomique, nom inconnu relu une seule fois par période.
+"""
+from counters import PlayCounters
+
+
+class FakeTable:
+    def __init__(self, rows):
+        self.rows = dict(rows)
+        self.loads = 0
+
+    def increment(self, name, amount):
+        self.rows[name] += amount
+        return self.rows[name]
+
+    def load(self):
+        self.loads += 1
+        return [{"name": name, "counter": counter} for name, counter in self.rows.items()]
+
+
+def test_increments_are_flushed_once():
+    table = FakeTable({"chess": 3})
+    counters = PlayCounters(table.increment, table.load)
+    counters.increment("chess")
+    counters.increment("chess", 2)
+
+    assert counters.value("chess") == 6
+    assert table.rows["chess"] == 3
+    counters.flush()
+    assert table.rows["chess"] == 6
+    assert counters.pending() == {}
+    assert counters.value("chess") == 6
+
+
+def test_unknown_name_is_read_once_until_next_flush():
+    table = FakeTable({"chess": 0})
+    counters = PlayCounters(table.increment, table.load)
+
+    assert counters.value("inconnu") is None
+    assert counters.value("inconnu") is None
+    assert counters.value("inconnu") is None
+    assert table.loads == 1
+    assert counters.stats()["unknown_hits"] == 2
+
+    # Jeu créé entre-temps : visible après le flush périodique suivant
+    table.rows["inconnu"] = 4
+    assert counters.value("inconnu") is None
+    counters.flush()
+    assert counters.value("inconnu") == 4
+    assert table.loads == 2
@@ -0,0 +1,67 @@
+"""
+Sauvegardes Gun Merge par patch JSON (gun_merge_saves.py).
+"""
+import pytest
+
+from gun_merge_saves import SaveCache, apply_patch, top_level_changes
+
+SAVE = {"xp": 3, "money": 10, "inventory": [{"id": 1}, None, {"id": 2}], "flags": {"tuto": True}}
+
+
+def test_add_remove_replace():
+    patched = apply_patch(SAVE, [
+        {"op": "replace", "path": "/money", "value": 12},
+        {"op": "add", "path": "/inventory/1", "value": {"id": 4}},
+        {"op": "add", "path": "/inventory/-", "value": None},
+        {"op": "remove", "path": "/flags/tuto"},
+        {"op": "add", "path": "/flags/a~1b", "value": 1},
+    ])
+    assert patched == {
+        "xp": 3,
+        "money": 12,
+        "inventory": [{"id": 1}, {"id": 4}, None, {"id": 2}, None],
+        "flags": {"a/b": 1},
+    }
+    # Le document d'origine n'est pas modifié
+    assert SAVE["money"] == 10 and len(SAVE["inventory"]) == 3
+
+
+def test_root_replace():
+    assert apply_patch(SAVE, [{"op": "replace", "path": "", "value": {"xp": 0}}]) == {"xp": 0}
+
+
+@pytest.mark.parametrize("operations", [
+    {"op": "add"},
+    [{"op": "move", "path": "/xp", "from": "/money"}],
+    [{"op": "add", "path": "/xp"}],
+    [{"op": "remove", "path": ""}],
+    [{"op": "replace", "path": "/absent", "value": 1}],
+    [{"op": "remove", "path": "/inventory/3"}],
+    [{"op": "replace", "path": "/inventory/01", "value": 1}],
+    [{"op": "add", "path": "/inventory/4", "value": 1}],
+    [{"op": "add", "path": "/missing/child", "value": 1}],
+    [{"op": "add", "path": "xp", "value": 1}],
+    ["pas une opération"],
+])
+def test_invalid_patches_are_rejected(operations):
+    with pytest.raises(ValueError):
+        apply_patch(SAVE, operations)
+
+
+def test_top_level_changes():
+    changes, removed = top_level_changes(SAVE, {"xp": 4, "money": 10, "inventory": SAVE["inventory"], "level": 2})
+    assert changes == {"xp": 4, "level": 2}
+    assert removed == ["flags"]
+
+
+def test_save_cache_returns_copies_for_matching_version():
+    cache = SaveCache(capacity=1)
+    cache.put("alice", "v1", SAVE)
+    copy = cache.get("alice", "v1")
+    copy["money"] = 0
+    assert cache.get("alice", "v1")["money"] == 10
+    assert cache.get("alice", "v0") is None
+
+    cache.put("bob", "v1", SAVE)
+    assert cache.get("alice", "v1") is None
+    assert cache.stats()["evictions"] == 1
@@ -0,0 +1,70 @@
+"""
+Instantanés HTTP (http_cache.py) : ETag / If-None-Match -> 304, compression, invalidation.
+"""
+import gzip
+
+from http_cache import SnapshotCache, accepted_encoding, etag_matches
+
+
+def test_etag_matching():
+    assert etag_matches('"abc"', '"abc"')
+    assert etag_matches('W/"abc", "def"', '"abc"')
+    assert etag_matches("*", '"abc"')
+    assert not etag_matches('"abd"', '"abc"')
+    assert not etag_matches(None, '"abc"')
+
+
+def test_accepted_encoding():
+    assert accepted_encoding("gzip, deflate") == "gzip"
+    assert accepted_encoding("gzip;q=0") is None
+    assert accepted_encoding(None) is None
+
+
+def test_snapshot_is_built_once_until_invalidated():
+    cache = SnapshotCache(ttl=60)
+    builds = []
+
+    def build():
+        builds.append(1)
+        return b'{"v":1}', 200
+
+    first, cached = cache.get(("versions",), build)
+    assert not cached
+    second, cached = cache.get(("versions",), build)
+    assert cached and second.etag == first.etag
+    cache.invalidate("versions")
+    cache.get(("versions",), build)
+    assert len(builds) == 2
+
+
+def test_errors_are_not_kept():
+    cache = SnapshotCache(ttl=60)
+    cache.get(("versions",), lambda: (b'{"status":"error"}', 500))
+    _, cached = cache.get(("versions",), lambda: (b"{}", 200))
+    assert not cached
+
+
+def test_route_answers_304_for_matching_etag(server, client):
+    server.supabase.table("Last_Maj").insert({"Version": 999, "Title": "t", "Description": "d"}).execute()
+    server.snapshot_cache.invalidate("latest_version")
+
+    response = client.get("/get_latest_version")
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    assert response.headers["Cache-Control"] == "no-cache"
+
+    revalidated = client.get("/get_latest_version", headers={"If-None-Match": etag})
+    assert revalidated.status_code == 304
+    assert revalidated.data == b""
+    assert revalidated.headers["ETag"] == etag
+
+    assert client.get("/get_latest_version", headers={"If-None-Match": '"autre"'}).status_code == 200
+
+
+def test_large_bodies_are_gzipped(server, client, monkeypatch):
+    monkeypatch.setattr(server, "HTTP_COMPRESS_MIN_BYTES", 1)
+    server.snapshot_cache.invalidate("latest_version")
+    plain = client.get("/get_latest_version")
+    compressed = client.get("/get_latest_version", headers={"Accept-Encoding": "gzip"})
+    assert compressed.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(compressed.data) == plain.data
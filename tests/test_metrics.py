@@ -0,0 +1,25 @@
+"""
+InstrumentedClient : lignes et octets des réponses base comptés séparément.
+"""
+import json
+
+import storage
+from metrics import InstrumentedClient, Metrics, response_bytes
+
+
+def test_response_bytes_is_compact_json_size():
+    assert response_bytes(None) == 0
+    assert response_bytes([{"ID": "é"}]) == len('[{"ID":"é"}]'.encode("utf-8"))
+
+
+def test_instrumented_client_counts_rows_and_bytes():
+    inner = storage.SQLiteClient(":memory:")
+    inner.table("Player").insert([{"ID": "m1", "Password": "x"}, {"ID": "m2", "Password": "y"}]).execute()
+    metrics = Metrics()
+    db = InstrumentedClient(inner, metrics)
+
+    data = db.table("Player").select("ID, Password").order("ID").execute().data
+
+    counters = {name: value for name, _, value in metrics.snapshot()["counters"]}
+    assert counters["supabase_response_rows_total"] == 2
+    assert counters["supabase_response_bytes_total"] == len(json.dumps(data, separators=(",", ":")))
@@ -0,0 +1,52 @@
+"""
+Historique binaire des coups (move_history.py) : codage 16 bits, formats renvoyés par la base.
+"""
+import binascii
+
+import chess
+import pytest
+
+from move_history import (
+    column_bytes, decode_move, encode_move, pack_moves, row_moves, to_base64, unpack_moves
+)
+
+
+def test_every_legal_move_roundtrips():
+    board = chess.Board("r3k2r/pPppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1")
+    moves = [move.uci() for move in board.legal_moves] + ["b7a8q", "b7b8n", "a1h8", "0000"]
+    assert unpack_moves(pack_moves(moves)) == moves
+    assert len(pack_moves(moves)) == 2 * len(moves)
+
+
+def test_null_move_is_zero():
+    assert encode_move("0000") == 0
+    assert decode_move(0) == "0000"
+
+
+@pytest.mark.parametrize("uci", ["e2e9", "i2e4", "e2e4k", "e2", ""])
+def test_invalid_moves_are_rejected(uci):
+    with pytest.raises(ValueError):
+        encode_move(uci)
+
+
+def test_truncated_or_corrupt_history_is_rejected():
+    with pytest.raises(ValueError):
+        unpack_moves(b"\x0c")
+    with pytest.raises(ValueError):
+        decode_move(0x000F)
+
+
+def test_column_formats():
+    packed = pack_moves(["e2e4", "e7e5"])
+    assert column_bytes(None) == b""
+    assert column_bytes(packed) == packed
+    assert column_bytes(memoryview(packed)) == packed
+    assert column_bytes("\\x" + binascii.hexlify(packed).decode()) == packed
+    assert column_bytes(to_base64(packed)) == packed
+
+
+def test_row_moves_prefers_packed_then_legacy_json():
+    packed = pack_moves(["d2d4"])
+    assert row_moves({"moves_packed": packed, "moves_list": ["e2e4"]}) == ["d2d4"]
+    assert row_moves({"moves_packed": None, "moves_list": ["e2e4"]}) == ["e2e4"]
+    assert row_moves({"moves_packed": None, "moves_list": None}) == []
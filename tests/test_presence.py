@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta, timezone
+
+from presence import PresenceBuffer, PresenceRegistry
+
+
+def test_buffer_coalesces_heartbeats_per_player():
+    written = []
+    buffer = PresenceBuffer(written.extend, batch_size=10)
+    buffer.record("alice", "2024-01-01T00:00:01+00:00")
+    buffer.record("bob", "2024-01-01T00:00:02+00:00")
+    buffer.record("alice", "2024-01-01T00:00:03+00:00")
+
+    assert buffer.pending_count() == 2
+    buffer.flush()
+
+    assert sorted(written) == [("alice", "2024-01-01T00:00:03+00:00"), ("bob", "2024-01-01T00:00:02+00:00")]
+    stats = buffer.stats()
+    assert (stats["heartbeats"], stats["coalesced"], stats["flushed_rows"], stats["pending"]) == (3, 1, 2, 0)
+
+
+def test_buffer_splits_batches_and_requeues_failures():
+    calls = []
+
+    def flush(batch):
+        calls.append(list(batch))
+        if len(calls) == 1:
+            raise RuntimeError("base indisponible")
+
+    buffer = PresenceBuffer(flush, batch_size=2)
+    for i in range(3):
+        buffer.record(f"p{i}", f"2024-01-01T00:00:0{i}+00:00")
+    buffer.flush()
+
+    assert [len(batch) for batch in calls] == [2, 1]
+    assert buffer.pending_count() == 2
+    # Un battement plus récent reçu entre-temps n'est pas écrasé par le lot en échec
+    buffer.record("p0", "2024-01-01T00:00:09+00:00")
+    buffer.flush()
+    assert ("p0", "2024-01-01T00:00:09+00:00") in calls[-1]
+    assert buffer.stats()["flush_errors"] == 1
+
+
+def test_registry_pages_follow_the_cursor_and_expire():
+    registry = PresenceRegistry(timeout=60)
+    now = datetime.now(timezone.utc).timestamp()
+    for i in range(10):
+        registry.touch(f"p{i}", now - i)
+    registry.touch("idle", now - 120)
+
+    first = registry.online(limit=4)
+    second = registry.online(after=(first[-1][1], first[-1][0]), limit=4)
+    assert [player for player, _ in first + second] == [f"p{i}" for i in range(8)]
+    assert registry.count() == 10
+    assert not registry.is_online("idle")
+
+
+def test_flush_writes_each_players_own_last_seen(server):
+    server.supabase.table("Player").insert([
+        {"ID": "presence_a", "Password": "x"}, {"ID": "presence_b", "Password": "x"},
+    ]).execute()
+    older = (datetime.now(timezone.utc) - timedelta(minutes=5)).isoformat()
+    newer = datetime.now(timezone.utc).isoformat()
+
+    server.flush_presence_batch([("presence_a", older), ("presence_b", newer), ("presence_unknown", newer)])
+
+    rows = server.supabase.table("Player").select("ID, Status, last_seen") \
+        .in_("ID", ["presence_a", "presence_b", "presence_unknown"]).order("ID").execute().data
+    assert [(row["ID"], row["last_seen"]) for row in rows] == [("presence_a", older), ("presence_b", newer)]
+    assert all(row["Status"] == "🟢 online" for row in rows)
+
+
+def test_buffer_counters_are_exported_to_metrics(server, client):
+    server.presence_buffer.record("metrics_player")
+    body = client.get("/metrics").get_data(as_text=True)
+    assert "# TYPE presence_buffer_coalesced gauge" in body
+    assert "presence_buffer_heartbeats " in body
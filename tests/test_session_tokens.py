@@ -0,0 +1,60 @@
+"""
+Jetons de session : émission / vérification, expiration, signature, en-tête
+Authorization, et démarrage sans SESSION_SECRET (jetons désactivés).
+"""
+import importlib.util
+import os
+
+from werkzeug.security import generate_password_hash
+
+from conftest import ROOT
+from session_tokens import SessionTokens
+
+
+def test_issue_and_verify():
+    tokens = SessionTokens("secret", 60)
+    assert tokens.verify(tokens.issue("alice")) == "alice"
+
+
+def test_expired_token_is_rejected():
+    tokens = SessionTokens("secret", -1)
+    assert tokens.verify(tokens.issue("alice")) is None
+
+
+def test_token_signed_with_other_secret_is_rejected():
+    token = SessionTokens("autre", 60).issue("alice")
+    assert SessionTokens("secret", 60).verify(token) is None
+    assert SessionTokens("secret", 60).verify(token[:-2] + "xx") is None
+
+
+def test_from_header():
+    assert SessionTokens.from_header("Bearer abc") == "abc"
+    assert SessionTokens.from_header("bearer  abc ") == "abc"
+    assert SessionTokens.from_header("Basic abc") is None
+    assert SessionTokens.from_header("Bearer ") is None
+    assert SessionTokens.from_header(None) is None
+
+
+def test_login_token_authenticates_requests(server, client):
+    server.supabase.table("Player").insert({"ID": "tok", "Password": generate_password_hash("pw")}).execute()
+    body = client.post("/login", json={"id": "tok", "password": "pw"}).get_json()
+    assert server.player_from_authorization(f"Bearer {body['token']}") == "tok"
+    assert server.player_from_authorization("Bearer faux") is None
+
+
+def test_app_boots_without_secret(monkeypatch, tmp_path):
+    monkeypatch.delenv("SESSION_SECRET", raising=False)
+    monkeypatch.delenv("SESSION_DEV_MODE", raising=False)
+    monkeypatch.setenv("SQLITE_PATH", str(tmp_path / "nosecret.db"))
+    spec = importlib.util.spec_from_file_location("app_without_secret", os.path.join(ROOT, "app.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    assert module.session_tokens is None
+    token = SessionTokens("tests", 60).issue("tok")
+    assert module.player_from_authorization(f"Bearer {token}") is None
+
+    module.supabase.table("Player").insert({"ID": "tok", "Password": generate_password_hash("pw")}).execute()
+    response = module.app.test_client().post("/login", json={"id": "tok", "password": "pw"})
+    assert response.status_code == 200
+    assert "token" not in response.get_json()
@@ -0,0 +1,71 @@
+import pytest
+
+from storage import PostgrestAPIError, SQLiteClient
+
+
+@pytest.fixture
+def db():
+    return SQLiteClient(":memory:")
+
+
+def test_exact_count_is_the_total_before_limit(db):
+    db.table("Play_Count").insert([{"name": f"game_{i}", "counter": i} for i in range(5)]).execute()
+
+    response = db.table("Play_Count").select("name", count="exact").gte("counter", 1).limit(1).execute()
+
+    assert response.count == 4
+    assert len(response.data) == 1
+
+
+def test_update_count_is_the_number_of_rows_changed(db):
+    db.table("Play_Count").insert([{"name": f"game_{i}", "counter": 0} for i in range(3)]).execute()
+
+    response = db.table("Play_Count").update({"counter": 1}).neq("name", "game_0").execute()
+
+    assert len(response.data) == 2
+
+
+def test_single_raises_unless_exactly_one_row(db):
+    db.table("Play_Count").insert({"name": "Chess", "counter": 3}).execute()
+
+    assert db.table("Play_Count").select("counter").eq("name", "Chess").single().execute().data == {"counter": 3}
+    with pytest.raises(PostgrestAPIError) as error:
+        db.table("Play_Count").select("counter").eq("name", "Missing").single().execute()
+    assert "0 rows" in str(error.value)
+    assert db.table("Play_Count").select("counter").eq("name", "Missing").maybe_single().execute().data is None
+
+
+def test_upsert_on_conflict_updates_and_json_columns_round_trip(db):
+    db.table("Casino").upsert({"username": "bob", "money": 1, "success": {"a": True}}, on_conflict="username").execute()
+    db.table("Casino").upsert({"username": "bob", "money": 5, "success": {"b": [1, 2]}}, on_conflict="username").execute()
+
+    rows = db.table("Casino").select("*").eq("username", "bob").execute().data
+    assert rows == [{"username": "bob", "money": 5, "success": {"b": [1, 2]}}]
+
+
+def test_duplicate_insert_raises_a_postgrest_conflict(db):
+    db.table("Play_Count").insert({"name": "Chess", "counter": 0}).execute()
+    with pytest.raises(PostgrestAPIError) as error:
+        db.table("Play_Count").insert({"name": "Chess", "counter": 0}).execute()
+    assert error.value.code == "23505"
+
+
+def test_or_filters_with_nested_and(db):
+    db.table("Play_Count").insert([{"name": n, "counter": c} for n, c in (("a", 1), ("b", 2), ("c", 3))]).execute()
+
+    rows = db.table("Play_Count").select("name").or_("name.eq.a,and(counter.gte.2,name.neq.c)").order("name").execute().data
+
+    assert [row["name"] for row in rows] == ["a", "b"]
+
+
+def test_count_waiting_chess_games_counts_every_open_game(server):
+    from datetime import datetime, timezone
+
+    before = server.count_waiting_chess_games()
+    server.supabase.table("chess").insert([
+        {"uuid": f"count-waiting-{i}", "fen_state": server.INITIAL_FEN, "white_player_id": f"waiting_{i}",
+         "waiting_seen_at": datetime.now(timezone.utc).isoformat()}
+        for i in range(3)
+    ]).execute()
+
+    assert server.count_waiting_chess_games() == before + 3
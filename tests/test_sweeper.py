@@ -0,0 +1,82 @@
+from datetime import datetime, timedelta, timezone
+
+from chess_archive import ChessReaper
+from metrics import Metrics
+from sweeper import LeaderLock, OfflineSweeper
+
+
+def test_only_one_lock_holder_per_file(tmp_path):
+    path = str(tmp_path / "leader.lock")
+    first, second = LeaderLock(path), LeaderLock(path)
+
+    assert first.try_acquire()
+    assert not second.try_acquire()
+    first.release()
+    assert second.try_acquire()
+    second.release()
+
+
+def test_sweep_counts_reach_metrics_and_stats(tmp_path):
+    metrics = Metrics()
+    results = iter([(2, 5), RuntimeError("base indisponible"), (0, 3)])
+
+    def sweep():
+        result = next(results)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    sweeper = OfflineSweeper(sweep, str(tmp_path / "sweep.lock"), metrics)
+    assert sweeper.run_once() == 2
+    assert sweeper.run_once() is None
+    assert sweeper.run_once() == 0
+    sweeper.leader.release()
+
+    counters = {name: value for name, _, value in metrics.snapshot()["counters"]}
+    assert counters == {
+        "offline_sweeps_total": 2,
+        "offline_sweep_flipped_total": 2,
+        "offline_sweep_inspected_total": 8,
+        "offline_sweep_errors_total": 1,
+    }
+    stats = sweeper.stats()
+    assert (stats["last_flipped"], stats["last_inspected"], stats["total_flipped"]) == (0, 3, 2)
+
+
+def test_non_leader_does_not_sweep(tmp_path):
+    path = str(tmp_path / "sweep.lock")
+    holder = LeaderLock(path)
+    holder.try_acquire()
+    calls = []
+    sweeper = OfflineSweeper(lambda: calls.append(1) or (0, 0), path)
+
+    assert sweeper.run_once() is None
+    assert calls == []
+    holder.release()
+
+
+def test_chess_reaper_shares_leader_task_stats(tmp_path):
+    reaper = ChessReaper(lambda: 1, lambda: 3, str(tmp_path / "reaper.lock"))
+    assert reaper.run_once() == {"reaped": 1, "archived": 3}
+    assert reaper.run_once() == {"reaped": 1, "archived": 3}
+    reaper.leader.release()
+
+    stats = reaper.stats()
+    assert (stats["runs"], stats["errors"], stats["total_reaped"], stats["total_archived"]) == (2, 0, 2, 6)
+    assert stats["last_run_at"] is not None and not stats["is_leader"]
+
+
+def test_check_player_activity_flips_only_stale_online_players(server):
+    now = datetime.now(timezone.utc)
+    server.supabase.table("Player").insert([
+        {"ID": "sweep_stale", "Password": "x", "Status": "🟢 online",
+         "last_seen": (now - timedelta(seconds=server.PLAYER_INACTIVITY_TIMEOUT + 60)).isoformat()},
+        {"ID": "sweep_fresh", "Password": "x", "Status": "🟢 online", "last_seen": now.isoformat()},
+    ]).execute()
+
+    flipped, inspected = server.check_player_activity()
+
+    assert flipped >= 1 and inspected >= 2
+    rows = server.supabase.table("Player").select("ID, Status").in_("ID", ["sweep_stale", "sweep_fresh"]) \
+        .order("ID").execute().data
+    assert [(row["ID"], row["Status"]) for row in rows] == [("sweep_fresh", "🟢 online"), ("sweep_stale", "🔴 offline")]